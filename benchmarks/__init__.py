@@ -0,0 +1,13 @@
+"""
+The data shared by the benchmarks, imported as `benchmarks` with the repository root on the path.
+"""
+
+import os
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "test", "fixtures")
+WEEKS = [(2018, week) for week in range(18, 23)]  # the weeks of test/fixtures/menu/<week>.csv
+
+
+def read_fixture(*path) -> bytes:
+    with open(os.path.join(FIXTURES, *path), "rb") as f:
+        return f.read()
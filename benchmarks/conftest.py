@@ -0,0 +1,129 @@
+"""
+Benchmarks of the parse -> diff -> render pipeline, using pytest-benchmark.
+All data comes from the fixtures in test/fixtures, served by a local HTTP stub where the code under test downloads it,
+so that the benchmarks run offline and their results only depend on the code. Run them with
+
+    python -m pytest benchmarks/ --benchmark-autosave
+
+and compare the saved runs of two commits with `--benchmark-compare` or `py.test-benchmark compare`.
+A plain `pytest` only runs the tests, the benchmarks are collected when this directory or one of them is given.
+"""
+
+import datetime as dtm
+import glob
+import os
+import pathlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from benchmarks import FIXTURES, WEEKS, read_fixture
+from mensabot import mensa
+
+pytest.importorskip("pytest_benchmark")
+
+BENCHMARKS = pathlib.Path(__file__).parent.resolve()
+
+
+def benchmarks_given(config) -> bool:
+    for arg in config.args:
+        path = (config.invocation_params.dir / arg.split("::")[0]).resolve()
+        if path == BENCHMARKS or BENCHMARKS in path.parents:
+            return True
+    return False
+
+
+def pytest_collect_file(file_path, parent):
+    # files given on the command line are collected anyway
+    if file_path.name.endswith("_bench.py") and not parent.session.isinitpath(file_path) \
+            and benchmarks_given(parent.config):
+        return pytest.Module.from_parent(parent, path=file_path)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves the csv files of the WEEKS, the opening times pages of the LOCATIONS with a fixture and the semester dates.
+    """
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        body, content_type = None, "text/html; charset=utf-8"
+        if path.startswith("/csv/"):
+            file = path[len("/csv/"):]
+            if os.path.isfile(os.path.join(FIXTURES, "menu", file)):
+                body, content_type = read_fixture("menu", file), "text/csv; charset=iso-8859-3"
+        elif path.startswith("/gastronomie/"):
+            name = next((name for name, loc in mensa.LOCATIONS.items() if path.endswith(loc)), None)
+            if name and os.path.isfile(os.path.join(FIXTURES, "html", "opening_%s.html" % name)):
+                body = read_fixture("html", "opening_%s.html" % name)
+        elif path == "/dates/":
+            body = read_fixture("html", "semester_dates.html")
+
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="session", autouse=True)
+def stub_server(tmp_path_factory):
+    """
+    Point all URLs and stores of `mensa` to the local HTTP stub and temporary directories.
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%s" % server.server_port
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(mensa, "MENU_URL", url + "/csv/")
+        mp.setattr(mensa, "OPENING_URL", url + "/gastronomie/")
+        mp.setattr(mensa, "DATES_URL", url + "/dates/")
+        mp.setattr(mensa, "MENU_STORE", str(tmp_path_factory.mktemp("menustore")))
+        mp.setattr(mensa, "SCRAPE_STORE", str(tmp_path_factory.mktemp("scrapestore")))
+        mp.setattr(mensa, "cache", {})
+        mp.setattr(mensa, "change_listeners", [])
+        mensa.clear_caches()
+        yield url
+        mensa.clear_caches()
+    server.shutdown()
+
+
+@pytest.fixture
+def menu_cache():
+    """
+    Fill the menu cache with the WEEKS as if they were just fetched from the stub.
+    """
+
+    for week in WEEKS:
+        mensa.get_menu_week(week)
+        mensa.cache[week] = (dtm.datetime.now(), mensa.cache[week][1])
+    return mensa.cache
+
+
+@pytest.fixture(scope="session")
+def menu_files():
+    """
+    The raw content of all csv files in test/fixtures/menu by their name.
+    """
+
+    files = sorted(os.path.basename(path) for path in glob.glob(os.path.join(FIXTURES, "menu", "*.csv")))
+    return {file: read_fixture("menu", file) for file in files}
+
+
+@pytest.fixture(scope="session")
+def menus(menu_files):
+    """
+    The parsed menus of all csv files in test/fixtures/menu by their name.
+    """
+
+    return {file: mensa.parse_menu_csv(mensa.repair_menu_csv(data.decode("iso8859_3")))
+            for file, data in menu_files.items()}
@@ -0,0 +1,26 @@
+import datetime as dtm
+
+import pytest
+
+from mensabot import parse
+
+INPUTS = ["heute", "morgen", "übermorgen", "mo", "Freitag", "+2", "17.5.", "in 2 tagen", "20. Mai", "nächste woche"]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def date_parser():
+    parse.load_date_parser()
+
+
+def test_parse_date(benchmark):
+    now = dtm.datetime.now()
+    assert all(benchmark(lambda: [parse.parse_date(s, now) for s in INPUTS]))
+
+
+def test_parse_date_uncached(benchmark):
+    # the first request of the day for the inputs that parse_date_fast leaves to dateparser
+    now = dtm.datetime.now()
+    cached = getattr(parse, "__parse_date_cached")
+    result = benchmark.pedantic(lambda: [parse.parse_date(s, now) for s in INPUTS], setup=cached.cache_clear,
+                                rounds=20)
+    assert all(result)
@@ -0,0 +1,36 @@
+import datetime as dtm
+
+import pytest
+
+from mensabot.mensa_menu import generate_diff
+
+CHANGES = ["18", "19", "20", "21", "22"]  # test/fixtures/menu/<week>.csv changed to <week>-v2.csv
+SEMESTER_WEEKS = 26
+
+
+def semester(menus, version):
+    """
+    Concatenate SEMESTER_WEEKS weeks of menus, cycling through the fixtures, to get a menu history of realistic size.
+    """
+
+    menu = []
+    for i in range(SEMESTER_WEEKS):
+        shift = dtm.timedelta(weeks=i - i % len(CHANGES))
+        menu += [d._replace(datum=d.datum + shift) for d in menus["%s%s.csv" % (CHANGES[i % len(CHANGES)], version)]]
+    return menu
+
+
+@pytest.mark.parametrize("week", CHANGES)
+def test_generate_diff(benchmark, menus, week):
+    old, new = menus[week + ".csv"], menus[week + "-v2.csv"]
+    assert benchmark(generate_diff, old, new)
+
+
+def test_generate_diff_unchanged(benchmark, menus):
+    old, new = menus["18.csv"], list(menus["18.csv"])
+    assert benchmark(generate_diff, old, new) == []
+
+
+def test_generate_diff_semester(benchmark, menus):
+    old, new = semester(menus, ""), semester(menus, "-v2")
+    assert benchmark(generate_diff, old, new)
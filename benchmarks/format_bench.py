@@ -0,0 +1,34 @@
+import datetime as dtm
+import os
+
+import pytest
+
+from benchmarks import WEEKS
+from mensabot import format
+from mensabot.mensa import PRICES_CATEGORIES
+
+TEMPLATES = os.path.join(os.path.dirname(format.__file__), "templates")
+DAY = dtm.date.fromisocalendar(*WEEKS[2], 3)
+
+
+def menu_templates():
+    for dir, dirs, files in sorted(os.walk(TEMPLATES)):
+        if "menu.md" in files:
+            yield os.path.relpath(dir, TEMPLATES).replace(os.sep, "/")
+
+
+@pytest.mark.parametrize("template", sorted(menu_templates()))
+@pytest.mark.parametrize("price_category", PRICES_CATEGORIES)
+def test_get_mensa_formatted(benchmark, menu_cache, template, price_category):
+    locale = template.split("/")[0]
+
+    def render():
+        format.clear_menu_cache()
+        return format.get_mensa_formatted(DAY, template, locale, price_category, DAY)
+
+    assert benchmark(render)
+
+
+def test_get_mensa_formatted_cached(benchmark, menu_cache):
+    format.get_mensa_formatted(DAY, "de", "de", "stud", DAY)
+    assert benchmark(format.get_mensa_formatted, DAY, "de", "de", "stud", DAY)
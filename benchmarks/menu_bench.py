@@ -0,0 +1,97 @@
+import datetime as dtm
+import os
+import shutil
+
+import pytest
+from dateutil.easter import easter
+from dateutil.relativedelta import TH, TU, relativedelta
+
+from benchmarks import WEEKS
+from mensabot import mensa
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning", "ignore::DeprecationWarning")  # from the scraped pages
+
+DAYS = [dtm.date.fromisocalendar(year, week, day) for year, week in WEEKS for day in range(1, 6)]
+TIMES = [dtm.datetime.combine(day, dtm.time(hour)) for day in DAYS for hour in [8, 12, 18]]
+FIRST_YEAR, LAST_YEAR = 2005, 2030
+
+
+def clear_store():
+    shutil.rmtree(mensa.MENU_STORE)
+    os.makedirs(mensa.MENU_STORE)
+
+
+@pytest.fixture
+def semesters():
+    """
+    Put semesters with the same kinds of holidays parse_semester_dates finds into the cache, for all years from
+    FIRST_YEAR until LAST_YEAR.
+    """
+
+    semesters = []
+    for year in range(FIRST_YEAR, LAST_YEAR):
+        easter_date = easter(year)
+        semesters.append(mensa.semester(
+            "Sommersemester %s" % year, False, dtm.date(year, 4, 15), dtm.date(year, 7, 20), [
+                (dtm.date(year, 5, 30), dtm.date(year, 5, 30)),
+                (easter_date + relativedelta(weekday=TH(-1)), easter_date + relativedelta(weekday=TU(+1))),
+                (easter_date + relativedelta(days=50), easter_date + relativedelta(days=51))]))
+        semesters.append(mensa.semester(
+            "Wintersemester %s/%s" % (year, year + 1), True, dtm.date(year, 10, 15), dtm.date(year + 1, 2, 8), [
+                (dtm.date(year, 12, 24), dtm.date(year + 1, 1, 6))]))
+    mensa.get_semester_dates.cache_put(semesters)
+    yield semesters
+    mensa.clear_caches()
+
+
+def test_fetch_menu_week(benchmark):
+    # download, repair, parse and store a week that wasn't seen before
+    menu = benchmark.pedantic(mensa.fetch_menu_week, args=(WEEKS[0],), setup=clear_store, rounds=50)
+    assert menu
+
+
+def test_fetch_menu_week_unchanged(benchmark):
+    mensa.fetch_menu_week(WEEKS[0])
+    assert benchmark(mensa.fetch_menu_week, WEEKS[0])
+
+
+def test_get_menu_day(benchmark, menu_cache):
+    result = benchmark(lambda: [mensa.get_menu_day(day) for day in DAYS])
+    assert all(result)
+
+
+@pytest.mark.parametrize("name", sorted(mensa.LOCATIONS))
+def test_get_next_open(benchmark, name):
+    loc = mensa.LOCATIONS[name]
+    try:
+        mensa.get_opening_times(loc)
+    except Exception:
+        pytest.skip("no recorded opening times page for %s" % name)
+    benchmark(lambda: [mensa.get_next_open(dt, loc) for dt in TIMES])
+
+
+def test_is_holiday(benchmark, semesters):
+    start = dtm.datetime(FIRST_YEAR + 1, 1, 1)
+    times = [start + dtm.timedelta(days=i) for i in range((LAST_YEAR - FIRST_YEAR - 2) * 365)]
+    benchmark(lambda: [mensa.is_holiday(dt) for dt in times])
+
+
+def test_is_holiday_range(benchmark, semesters):
+    start, end = dtm.date(FIRST_YEAR + 1, 1, 1), dtm.date(LAST_YEAR - 1, 12, 31)
+    assert len(benchmark(mensa.is_holiday_range, start, end)) == (end - start).days + 1
+
+
+def test_build_holiday_index(benchmark, semesters):
+    assert benchmark(mensa.build_holiday_index, semesters)
+
+
+def test_scrape(benchmark):
+    # what a refresh of the opening times and semester dates costs
+    locs = [loc for name, loc in mensa.LOCATIONS.items() if name in ("audimax", "nikolakloster", "wiwi")]
+
+    def scrape():
+        mensa.clear_caches()
+        return mensa.get_semester_dates(), [mensa.get_opening_times(loc) for loc in locs]
+
+    semesters, times = benchmark(scrape)
+    assert semesters and all(times)
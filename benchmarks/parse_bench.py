@@ -0,0 +1,82 @@
+import csv
+import functools
+import io
+import tracemalloc
+
+import pytest
+
+from benchmarks import read_fixture
+from mensabot import mensa, mensa_menu
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning", "ignore::DeprecationWarning")  # from the scraped pages
+
+PARSERS = ["html.parser"] + (["lxml"] if mensa.builder_registry.lookup("lxml") else [])
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        size, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size, peak
+
+
+@pytest.fixture(scope="module")
+def rows(menu_files):
+    rows = []
+    for data in menu_files.values():
+        text = mensa.repair_menu_csv(data.decode("iso8859_3"))
+        rows += [row for row in csv.DictReader(text.splitlines(), delimiter=';') if row['datum'].strip()]
+    return rows
+
+
+def test_parse_name(benchmark, rows):
+    parse_name = getattr(mensa_menu, "__parse_name")
+    names = [row["name"] for row in rows]
+    benchmark(lambda: [parse_name(name) for name in names])
+
+
+def test_parse_dish(benchmark, rows):
+    menu, size, peak = peak_memory(lambda: [mensa_menu.parse_dish(dict(row)) for row in rows])
+    benchmark.extra_info["bytes_per_dish"] = size // len(menu)
+    benchmark(lambda: [mensa_menu.parse_dish(dict(row)) for row in rows])
+
+
+def test_repair_menu_csv(benchmark, menu_files):
+    texts = [data.decode("iso8859_3") for data in menu_files.values()]
+    benchmark(lambda: [mensa.repair_menu_csv(text) for text in texts])
+
+
+def test_read_menu_csv(benchmark, menu_files, menus):
+    # decode, repair and parse, as done for every downloaded or imported week
+    result = benchmark(lambda: [list(mensa.read_menu_csv([data])) for data in menu_files.values()])
+    assert result == list(menus.values())
+
+
+def test_read_menu_csv_bulk(benchmark, menu_files):
+    # many weeks in one file, read in chunks and consumed one dish after another like a historical bulk import
+    weeks = list(menu_files.values())
+    bulk = weeks[0] + b"".join(week.split(b"\n", 1)[1] for week in weeks[1:] * 20)
+
+    def read():
+        f = io.BytesIO(bulk)
+        return sum(1 for _ in mensa.read_menu_csv(iter(functools.partial(f.read, 4096), b"")))
+
+    count, size, peak = peak_memory(read)
+    benchmark.extra_info["peak_kib"] = peak // 1024
+    benchmark.extra_info["csv_kib"] = len(bulk) // 1024
+    assert benchmark(read) == count
+
+
+@pytest.mark.parametrize("features", PARSERS)
+def test_parse_opening_times(benchmark, features):
+    html = read_fixture("html", "opening_wiwi.html").decode("utf-8")
+    assert benchmark(mensa.parse_opening_times, html, features)
+
+
+@pytest.mark.parametrize("features", PARSERS)
+def test_parse_semester_dates(benchmark, features):
+    html = read_fixture("html", "semester_dates.html").decode("utf-8")
+    assert benchmark(mensa.parse_semester_dates, html, features)
@@ -0,0 +1,62 @@
+import argparse
+import subprocess
+import sys
+import time
+
+# console script -> module whose import makes up its cold start, see entry_points in setup.py
+ENTRY_POINTS = {
+    "mensabot": "mensabot.bot.main",
+    "mensabot-bc": "mensabot.bot.broadcast",
+    "mensa-diff": "mensabot.mensa_menu",
+    "mensabot-import": "mensabot.importer",
+}
+
+
+def import_times(module):
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+
+    :return: the wall clock time of the whole interpreter run and the cumulative import time in µs
+             of `module` and of all modules it imports directly
+    """
+
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                          stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    wall = time.perf_counter() - start
+
+    # nested imports are indented by two more spaces and are listed right before the module importing them
+    times = {}
+    for line in reversed(proc.stderr.splitlines()):
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and times:
+            break
+        elif depth == 0 and name.strip() == module or depth == 1 and times:
+            times[name.strip()] = int(cumulative)
+    return wall, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the cold start import time of the mensabot entry points.')
+    parser.add_argument('--repeat', type=int, default=5, help='best of how many fresh interpreters')
+    parser.add_argument('--top', type=int, default=8, help='how many of the slowest imports to list')
+    parser.add_argument('entry_point', nargs='*', default=list(ENTRY_POINTS),
+                        help='one of %s, all of them by default' % ", ".join(ENTRY_POINTS))
+    args = parser.parse_args()
+    if not set(args.entry_point) <= set(ENTRY_POINTS):
+        parser.error("unknown entry point %s" % ", ".join(set(args.entry_point) - set(ENTRY_POINTS)))
+
+    for entry_point in args.entry_point:
+        module = ENTRY_POINTS[entry_point]
+        runs = [import_times(module) for _ in range(args.repeat)]
+        wall, times = min(runs, key=lambda run: run[1][module])
+        print("%-12s %8.1f ms import %8.1f ms wall (%s)" % (entry_point, times.pop(module) / 1e3, wall * 1e3, module))
+        for name, cumulative in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+            print("    %-40s %8.1f ms" % (name, cumulative / 1e3))
+
+
+if __name__ == "__main__":
+    main()
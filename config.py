@@ -12,3 +12,4 @@ LOG_CONFIG = "./logging.yaml"
 
 # Path of the menu archive directory
 MENU_STORE = "./menustore"
+TELEGRAM_TOKEN = "123456:TESTTOKEN"
@@ -0,0 +1,224 @@
+import asyncio
+import datetime as dtm
+import functools
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Mapping, NamedTuple, Tuple
+
+import aiohttp
+import requests
+
+from mensabot import mensa
+from mensabot.bot import tasks
+from mensabot.bot.delivery import DELIVERY
+from mensabot.bot.diff_listener import install_listener
+from mensabot.bot.ext import updater
+from mensabot.config_default import MENU_PREFETCH_WEEKS
+
+HTTP_CONNECTIONS = 8
+HTTP_TIMEOUT = 30
+HTTP_ENCODING = "iso8859_1"  # same fallback as requests uses for text/* responses without charset
+
+# change listeners are run one after another, as e.g. commit_diff must not run concurrently with itself
+LISTENER_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="listener")
+
+response = NamedTuple("response", [("status", int), ("headers", Mapping[str, str]), ("text", str)])
+
+logger = logging.getLogger("mensabot.aio")
+pending_waves = set()  # keep references to the tasks, so that they aren't garbage collected while waiting
+
+
+def run_async():
+    """
+    Run fetching and scheduling as coroutines on one event loop instead of using the blocking SCHED loop.
+    Telegram updates are still polled by the `updater` threads, messages are still sent by the DELIVERY threads.
+    """
+
+    try:
+        asyncio.run(main_async())
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt, shutting down.", exc_info=1)
+        updater.stop()
+        DELIVERY.shutdown(wait=False)
+
+
+async def main_async():
+    loop = asyncio.get_running_loop()
+    install_listener(lambda func, *args:
+                     loop.call_soon_threadsafe(loop.run_in_executor, LISTENER_EXECUTOR, func, *args))
+
+    connector = aiohttp.TCPConnector(limit=HTTP_CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        logger.debug("Handing over to event loop")
+        await asyncio.gather(
+            notifications(),
+            periodically(update_menu, session),
+            periodically(refresh_caches, session, start=next_night()),
+            periodically(clear_mensa_notifications),
+        )
+
+
+async def run_blocking(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def sleep_until(dt: dtm.datetime):
+    await asyncio.sleep(max(0, (dt - dtm.datetime.now()).total_seconds()))
+
+
+def next_night() -> dtm.datetime:
+    return dtm.datetime.combine(dtm.date.today() + dtm.timedelta(days=1), dtm.time(2, 0))
+
+
+async def periodically(task, *args, start: dtm.datetime = None):
+    """
+    Run the coroutine function `task` over and over again, each time waiting until the time it returned.
+
+    :param start: when to run `task` for the first time, immediately by default
+    """
+
+    if start:
+        await sleep_until(start)
+    while True:
+        try:
+            next = await task(*args)
+        except Exception:
+            logger.error("Exception from task %s, retrying in 1 minute." % task.__name__, exc_info=1)
+            next = dtm.datetime.now() + dtm.timedelta(minutes=1)
+        await sleep_until(next)
+
+
+async def get(session: aiohttp.ClientSession, url: str, headers=None, check=True) -> response:
+    """
+    Send a GET request and read the whole response.
+
+    :param check: raise an aiohttp.ClientResponseError if the response has an error status
+    """
+
+    async with session.get(url, headers=headers) as r:
+        if check:
+            r.raise_for_status()
+        return response(r.status, r.headers, await r.text(encoding=r.charset or HTTP_ENCODING))
+
+
+async def get_text(session: aiohttp.ClientSession, url: str) -> str:
+    return (await get(session, url)).text
+
+
+########################################################################################################################
+
+async def fetch_menu_week(session: aiohttp.ClientSession, week: Tuple[int, int]):
+    """
+    Fetch the menu of a week like `mensa.refresh_menu_week` does. If the week is already being fetched, either by
+    another coroutine or in a thread, no new request is made and the result of the running fetch is returned instead.
+    """
+
+    with mensa.pending_fetches_lock:
+        future = mensa.pending_fetches.get(week)
+        running = future is not None
+        if not running:
+            future = mensa.pending_fetches[week] = Future()
+    if running:
+        return await asyncio.wrap_future(future)
+
+    try:
+        menu = await __fetch_menu_week(session, week)
+        mensa.cache[week] = (dtm.datetime.now(), menu)
+        future.set_result(menu)
+        return menu
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with mensa.pending_fetches_lock:
+            del mensa.pending_fetches[week]
+
+
+async def __fetch_menu_week(session: aiohttp.ClientSession, week: Tuple[int, int]):
+    headers = mensa.menu_week_request_headers(week)
+    first, fallback = mensa.menu_week_urls(week)
+    r = await get(session, first, headers, check=False)
+    if r.status >= 400:
+        r = await get(session, fallback, headers)
+    if r.status == 304:
+        return await run_blocking(mensa.unchanged_menu_week, week)
+    return await run_blocking(mensa.update_menu_week, week, r.text, r.headers)
+
+
+async def fetch_opening_times(session: aiohttp.ClientSession, loc: str):
+    html = await get_text(session, mensa.OPENING_URL + loc)
+    mensa.get_opening_times.cache_put(await run_blocking(mensa.parse_opening_times, html), loc)
+
+
+async def fetch_semester_dates(session: aiohttp.ClientSession):
+    html = await get_text(session, mensa.DATES_URL)
+    mensa.get_semester_dates.cache_put(await run_blocking(mensa.parse_semester_dates, html))
+
+
+########################################################################################################################
+
+async def notifications():
+    now = tasks.current_slot()
+    while True:
+        try:
+            later, day = await run_blocking(tasks.get_next_notification_slot, now)
+            for notify_time, rows in await run_blocking(tasks.get_notification_waves, now, later):
+                task = asyncio.create_task(send_notification_wave(day, rows, notify_time))
+                pending_waves.add(task)
+                task.add_done_callback(pending_waves.discard)
+        except Exception:
+            logger.error("Exception while scheduling notifications, trying again in 1 minute.", exc_info=1)
+            later = now + dtm.timedelta(minutes=1)
+        await sleep_until(later)
+        now = later
+
+
+async def send_notification_wave(day, rows, notify_time):
+    await sleep_until(notify_time)
+    await run_blocking(tasks.send_notification_wave, day, rows, notify_time)
+
+
+async def update_menu(session: aiohttp.ClientSession) -> dtm.datetime:
+    """
+    Fetch the menus of the current and the MENU_PREFETCH_WEEKS following weeks concurrently.
+    """
+
+    logger.debug("Fetching new menu")
+    today = dtm.date.today()
+    weeks = [mensa.menu_week_of(today + dtm.timedelta(weeks=i)) for i in range(MENU_PREFETCH_WEEKS + 1)]
+    results = await asyncio.gather(*(fetch_menu_week(session, week) for week in weeks), return_exceptions=True)
+    for week, res in zip(weeks, results):
+        if isinstance(res, aiohttp.ClientResponseError) and res.status == 404 and week != weeks[0]:
+            logger.debug("Menu for week %s is not published yet" % (week,))
+        elif isinstance(res, (aiohttp.ClientError, asyncio.TimeoutError)):
+            logger.warning("Could not fetch menu for week %s, trying again later" % (week,), exc_info=res)
+        elif isinstance(res, Exception):
+            raise res
+    return dtm.datetime.now() + dtm.timedelta(minutes=5)
+
+
+async def refresh_caches(session: aiohttp.ClientSession) -> dtm.datetime:
+    """
+    Replace the cached opening times and semester dates with freshly scraped ones, like the nightly refresh_caches
+    of the SCHED loop does. The old values stay available until the new ones are parsed.
+    """
+
+    logger.debug("Refreshing caches...")
+    locs = [loc for loc in mensa.LOCATIONS.values() if loc not in mensa.FIXED_OPENING_TIMES]
+    results = await asyncio.gather(
+        fetch_semester_dates(session), *(fetch_opening_times(session, loc) for loc in locs),
+        return_exceptions=True)
+    for res in results:
+        if isinstance(res, Exception):
+            logger.warning("Could not refresh cache, keeping the old values", exc_info=res)
+
+    return next_night()
+
+
+async def clear_mensa_notifications() -> dtm.datetime:
+    try:
+        return await run_blocking(tasks.clear_mensa_notifications)
+    except requests.exceptions.RequestException:
+        logger.warning("Could not get next opening time of mensa, trying again in 1 minute", exc_info=True)
+        return dtm.datetime.now() + dtm.timedelta(minutes=1)
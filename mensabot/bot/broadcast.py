@@ -1,18 +1,15 @@
 import argparse
+import functools
 import os
 
 from telegram import ParseMode
 
+from mensabot.bot.delivery import DELIVERY
 from mensabot.bot.ext import updater
-from mensabot.bot.tasks import SCHED
-from mensabot.config_default import DATABASE
 
 
-# TODO use telegram-bot MessageQueue for rate limiting
-# https://github.com/python-telegram-bot/python-telegram-bot/wiki/Avoiding-spam-limits
-
 def main():
-    from mensabot.db import CHATS, connection
+    from mensabot.db import CHATS, connection, migrate
 
     parser = argparse.ArgumentParser(description='Broadcast a message to all mensabot users.')
     parser.add_argument('--silent', action='store_true')
@@ -20,18 +17,23 @@ def main():
     parser.add_argument('message', action='store')
     args = parser.parse_args()
 
+    migrate()
     with connection() as (conn, execute):
         res = execute(CHATS.select())
         rows = res.fetchall()
+        jobs = []
         for row in rows:
             if args.test and row.id != 114998496:
                 print("Skipping %s" % row)
                 continue
             print("Broadcasting to %s" % row)
-            updater.bot.sendMessage(chat_id=row.id, text=args.message, parse_mode=ParseMode.MARKDOWN,
-                                    disable_notification=args.silent)
+            jobs.append(functools.partial(updater.bot.sendMessage, chat_id=row.id, text=args.message,
+                                          parse_mode=ParseMode.MARKDOWN, disable_notification=args.silent))
+
+    wave = DELIVERY.send_wave("broadcast", jobs)
+    wave.wait()
+    print("Finished %s" % wave)
 
 
 if __name__ == "__main__":
     main()
-    SCHED.run()
@@ -1,7 +1,7 @@
 import datetime as dtm
 
 from mensabot.bot.util import ComHandlerFunc, get_args, chat_record
-from mensabot.db import CHATS, connection
+from mensabot.db import CHATS, set_chat
 from mensabot.format import check_legal_template
 from mensabot.mensa import PRICES_CATEGORIES
 from mensabot.parse import LANG
@@ -87,15 +87,7 @@ def set_config(update, ctx):
         ctx.bot.sendMessage(chat_id=update.message.chat_id, text=str(e))
         return
 
-    with connection() as (conn, execute):
-        val = {fun: arg}
-        res = execute(
-            CHATS.update().values(**val).where(CHATS.c.id == id)
-        )
-        if res.rowcount != 1:
-            execute(
-                CHATS.insert().values(id=id, **val)
-            )
+    set_chat(id, **{fun: arg})
     ctx.bot.sendMessage(chat_id=update.message.chat_id, text="Updated %s to '%s'." % (fun, arg))
 
 
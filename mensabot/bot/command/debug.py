@@ -35,10 +35,18 @@ def dump_notifications(update, ctx):
                         mensa.notifications_date,
                         "\n\n".join(
                             str({'message_id': msg.message_id, 'date': msg.date, 'chat': msg.chat.to_dict()})
-                            for msg in mensa.notifications)
+                            for msg, text in list(mensa.notifications.values()))
                     ))
 
 
+@DbgComHandlerFunc("commits")
+def dump_commits(update, ctx):
+    from mensabot.bot import diff_listener
+    ctx.bot.sendMessage(chat_id=update.message.chat_id,
+                        text="Menu store: {}\npending: {}".format(
+                            diff_listener.commit_stats, sorted(diff_listener.pending_commits)))
+
+
 @DbgComHandlerFunc("settrace")
 def settrace(update, ctx):
     import pydevd
@@ -52,3 +60,19 @@ def settrace(update, ctx):
     import pydevd
     ctx.bot.sendMessage(chat_id=update.message.chat_id, text="Calling pydevd.stoptrace")
     pydevd.stoptrace()
+
+
+@DbgComHandlerFunc("cache")
+def dump_cache(update, ctx):
+    from mensabot.format import get_menu_cache_info
+    from mensabot.mensa import get_opening_times, get_semester_dates
+    ctx.bot.sendMessage(chat_id=update.message.chat_id,
+                        text="Cache statistics:\nmenu rendering: {}\nopening times: {}\nsemester dates: {}".format(
+                            get_menu_cache_info(), get_opening_times.cache_info(), get_semester_dates.cache_info()))
+
+
+@DbgComHandlerFunc("delivery")
+def dump_delivery(update, ctx):
+    from mensabot.bot.delivery import DELIVERY
+    ctx.bot.sendMessage(chat_id=update.message.chat_id,
+                        text="Recent deliveries:\n" + "\n".join(str(wave) for wave in DELIVERY.waves))
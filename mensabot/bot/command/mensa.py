@@ -1,15 +1,15 @@
 import datetime as dtm
 
-from telegram import ParseMode
+from telegram import Message, ParseMode
 from telegram.error import BadRequest
 
 from mensabot.bot.ext import updater
-from mensabot.bot.util import ComHandlerFunc, chat_record, ensure_date, get_args
+from mensabot.bot.util import ComHandlerFunc, chat_record, get_args
 from mensabot.format import get_mensa_diff_formatted, get_mensa_formatted
-from mensabot.mensa import PRICES_CATEGORIES, get_next_mensa_open
+from mensabot.mensa import PRICES_CATEGORIES, ensure_date, get_next_mensa_open
 from mensabot.parse import parse_loc_date
 
-notifications = []
+notifications = {}  # (chat id, message id) -> (menu message for notifications_date, markdown text it shows)
 notifications_date = dtm.date.today()
 
 
@@ -30,44 +30,68 @@ def mensa(update, ctx):
         send_menu_message(dt, chat, update.message.chat_id)
 
 
+def track_notification(text):
+    def callback(msg):
+        if isinstance(msg, Message):  # the callback also gets the exception if sending failed
+            notifications[(msg.chat_id, msg.message_id)] = (msg, text)
+
+    return callback
+
+
 def send_menu_message(dt, chat, chat_id):
+    text = get_mensa_formatted(
+        dt,
+        template=chat.template if chat else None,
+        locale=chat.locale if chat else None,
+        price_category=PRICES_CATEGORIES[chat.price_category if chat else 0])
     return updater.bot.sendMessage(
         chat_id=chat_id,
-        text=get_mensa_formatted(
-            dt,
-            template=chat.template if chat else None,
-            locale=chat.locale if chat else None,
-            price_category=PRICES_CATEGORIES[chat.price_category if chat else 0]),
+        text=text,
         disable_notification=(not chat.push_sound) if chat else False,
         parse_mode=ParseMode.MARKDOWN,
-        callback=notifications.append if ensure_date(dt) == notifications_date else None)
+        callback=track_notification(text) if ensure_date(dt) == notifications_date else None)
 
 
-def send_menu_update(dt, diff, chat):
-    text = get_mensa_diff_formatted(
-        dt, diff,
-        template=chat.template if chat else None,
-        locale=chat.locale if chat else None,
-        price_category=PRICES_CATEGORIES[chat.price_category if chat else 0])
+def send_menu_update(dt, diff, chat, text=None):
+    """
+    :param text: the already rendered diff, by default it is rendered for the settings of `chat`
+    """
+
+    if text is None:
+        text = get_mensa_diff_formatted(
+            dt, diff,
+            template=chat.template if chat else None,
+            locale=chat.locale if chat else None,
+            price_category=PRICES_CATEGORIES[chat.price_category if chat else 0])
     if text.strip():
         updater.bot.sendMessage(chat_id=chat.id, text=text, parse_mode=ParseMode.MARKDOWN,
                                 disable_notification=(not chat.notify_change_sound) if chat else False)
 
 
-def edit_menu_message(dt, msg, menu, chat):
-    text = get_mensa_formatted(
-        dt,
-        template=chat.template if chat else None,
-        locale=chat.locale if chat else None,
-        price_category=PRICES_CATEGORIES[chat.price_category if chat else 0],
-        now=msg.date)
-    if text != msg.text:
-        try:
-            updater.bot.editMessageText(
-                message_id=msg.message_id, chat_id=msg.chat_id,
-                text=text, parse_mode=ParseMode.MARKDOWN)
-        except BadRequest as e:
-            if str(e.message).startswith("Message is not modified"):
-                pass
-            else:
-                raise
+def edit_menu_message(dt, msg, menu, chat, text=None):
+    """
+    :param text: the already rendered menu, by default it is rendered for the settings of `chat`
+    """
+
+    if text is None:
+        text = get_mensa_formatted(
+            dt,
+            template=chat.template if chat else None,
+            locale=chat.locale if chat else None,
+            price_category=PRICES_CATEGORIES[chat.price_category if chat else 0],
+            now=msg.date)
+    key = (msg.chat_id, msg.message_id)
+    # msg.text is the text without markdown, so compare with the markdown that was sent if the message is tracked
+    if text == notifications.get(key, (msg, msg.text))[1]:
+        return
+    try:
+        updater.bot.editMessageText(
+            message_id=msg.message_id, chat_id=msg.chat_id,
+            text=text, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if str(e.message).startswith("Message is not modified"):
+            pass
+        else:
+            raise
+    if key in notifications:
+        notifications[key] = (msg, text)
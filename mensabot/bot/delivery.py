@@ -0,0 +1,191 @@
+import logging
+import threading
+import time as systime
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from mensabot.config_default import DELIVERY_WORKERS, TELEGRAM_CHAT_RATE_LIMIT, TELEGRAM_RATE_LIMIT
+
+# See here for the limits: https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+MAX_RETRIES = 8
+MAX_CHAT_BUCKETS = 1024
+
+logger = logging.getLogger("mensabot.delivery")
+
+
+class TokenBucket(object):
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = systime.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token from the bucket, even if it is empty.
+
+        :return: the number of seconds the caller has to wait before the token may be used
+        """
+
+        with self.lock:
+            now = systime.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+            self.updated = now
+            return max(-self.tokens / self.rate, self.blocked_until - now, 0)
+
+    def block(self, seconds: float):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, systime.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        with self.lock:
+            return self.tokens + (systime.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class Throttle(object):
+    """
+    Rate limit for sending messages, combining one global token bucket with one bucket per chat.
+    """
+
+    def __init__(self, rate: float, chat_rate: float):
+        self.bucket = TokenBucket(rate, rate)
+        self.chat_rate = chat_rate
+        self.chats = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, chat_id=None):
+        if chat_id is not None:
+            with self.lock:
+                if len(self.chats) > MAX_CHAT_BUCKETS:
+                    self.chats = {id: b for id, b in self.chats.items() if not b.is_idle()}
+                bucket = self.chats.get(chat_id)
+                if not bucket:
+                    bucket = self.chats[chat_id] = TokenBucket(self.chat_rate, 1)
+            systime.sleep(bucket.reserve())
+        systime.sleep(self.bucket.reserve())
+
+    def block(self, seconds: float):
+        self.bucket.block(seconds)
+
+
+class Wave(object):
+    """
+    A batch of messages that are sent out together, e.g. all menu notifications for one push time.
+    """
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.sent = 0
+        self.failed = 0
+        self.first_send = None
+        self.last_send = None
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        if not size:
+            self.finished.set()
+
+    def done(self, future: Future):
+        now = systime.time()
+        with self.lock:
+            if future.exception():
+                self.failed += 1
+            else:
+                self.sent += 1
+                self.first_send = self.first_send or now
+                self.last_send = now
+            if self.sent + self.failed == self.size:
+                logger.info("Finished delivery of %s" % self)
+                self.finished.set()
+
+    def latency(self) -> float:
+        """
+        The number of seconds between the first and the last message of this wave being sent.
+        """
+
+        return self.last_send - self.first_send if self.first_send else 0
+
+    def wait(self, timeout=None) -> bool:
+        return self.finished.wait(timeout)
+
+    def __str__(self):
+        return "wave '%s': %d/%d sent, %d failed, %.2fs from first to last send" % (
+            self.name, self.sent, self.size, self.failed, self.latency())
+
+
+class DeliveryEngine(object):
+    """
+    Sends messages through a pool of worker threads, retrying them in case of network problems or
+    when the telegram rate limit was exceeded.
+    """
+
+    def __init__(self, workers: int, throttle: Throttle):
+        self.throttle = throttle
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="delivery")
+        self.local = threading.local()
+        self.waves = deque(maxlen=16)
+
+    def is_worker(self) -> bool:
+        return getattr(self.local, "is_worker", False)
+
+    def on_failure(self, callback: Callable):
+        """
+        Call `callback` with the exception if the message currently sent by this worker can't be delivered after all
+        retries. Only the callbacks registered by the last attempt are called.
+        """
+
+        self.local.failure_callbacks.append(callback)
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        future = self.executor.submit(self.__deliver, func, args, kwargs)
+        future.add_done_callback(self.__log_failure)
+        return future
+
+    def send_wave(self, name: str, jobs: List[Callable]) -> Wave:
+        wave = Wave(name, len(jobs))
+        self.waves.append(wave)
+        logger.debug("Starting delivery of %s" % wave)
+        for job in jobs:
+            self.submit(job).add_done_callback(wave.done)
+        return wave
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def __deliver(self, func, args, kwargs):
+        self.local.is_worker = True
+        retries = 0
+        while True:
+            self.local.failure_callbacks = []
+            try:
+                return func(*args, **kwargs)
+            except BadRequest:
+                raise
+            except RetryAfter as e:  # pause all deliveries for e.retry_after
+                logger.warning("Message rate limit exceeded, retrying in %s seconds." % e.retry_after)
+                self.throttle.block(e.retry_after)
+            except (TimedOut, NetworkError) as e:  # handle slow connection problems and other connection problems
+                if retries >= MAX_RETRIES:
+                    for callback in self.local.failure_callbacks:
+                        try:
+                            callback(e)
+                        except Exception:
+                            logger.error("Failure callback of undeliverable message failed", exc_info=True)
+                    raise
+                delay = 2 ** retries
+                retries += 1
+                logger.warning("Network problems, retrying in %d seconds." % delay, exc_info=e)
+                systime.sleep(delay)
+
+    @staticmethod
+    def __log_failure(future: Future):
+        if future.exception():
+            logger.error("Could not deliver message", exc_info=future.exception())
+
+
+DELIVERY = DeliveryEngine(DELIVERY_WORKERS, Throttle(TELEGRAM_RATE_LIMIT, TELEGRAM_CHAT_RATE_LIMIT))
@@ -1,48 +1,190 @@
 import datetime as dtm
+import functools
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 import sh
 
+try:
+    from dulwich import porcelain
+except ImportError:
+    porcelain = None  # fall back to running the git executable
+
 from mensabot import mensa as mensa_api
 from mensabot.bot.command import mensa as mensa_cmd
 from mensabot.bot.command.mensa import edit_menu_message, send_menu_update
+from mensabot.bot.delivery import DELIVERY, Wave
 from mensabot.bot.tasks import SCHED
-from mensabot.bot.util import chat_record
-from mensabot.config_default import MENU_STORE
-from mensabot.mensa import MENU_TYPES
+from mensabot.config_default import MENU_COMMIT_DELAY, MENU_STORE
+from mensabot.db import get_chat
+from mensabot.format import get_mensa_diff_formatted, get_mensa_formatted
+from mensabot.mensa import MENU_TYPES, PRICES_CATEGORIES, ensure_date
 from mensabot.mensa_menu import generate_diff
 
+logger = logging.getLogger("mensabot.diff_listener")
+
+MENU_STORE_REMOTE = "git@github.com:N-Coder/mensabot-crawler.git"
+COMMIT_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="menu-commit")
+
+pending_commits = set()  # weeks changed since the last commit of the MENU_STORE
+pending_since = None  # when the first of the pending_commits changed
+pending_lock = threading.Lock()
+flushing = threading.Event()
+
+
+class CommitStats(object):
+    """
+    Latencies of the commits to the MENU_STORE, from the first change that went into a commit to the commit
+    being written, and how long writing the commits took.
+    """
+
+    def __init__(self):
+        self.commits = 0
+        self.weeks = 0
+        self.failed = 0
+        self.last_latency = 0
+        self.max_latency = 0
+        self.last_duration = 0
+        self.total_duration = 0
+        self.lock = threading.Lock()
+
+    def record(self, weeks: int, since: float, start: float, end: float, failed=False):
+        with self.lock:
+            if failed:
+                self.failed += 1
+                return
+            self.commits += 1
+            self.weeks += weeks
+            self.last_latency = end - since
+            self.max_latency = max(self.max_latency, self.last_latency)
+            self.last_duration = end - start
+            self.total_duration += self.last_duration
+
+    def __str__(self):
+        return "%d commits of %d weeks (%d failed), latency %.2fs (max %.2fs), git took %.3fs (avg %.3fs)" % (
+            self.commits, self.weeks, self.failed, self.last_latency, self.max_latency,
+            self.last_duration, self.total_duration / self.commits if self.commits else 0)
+
+
+commit_stats = CommitStats()
+
 
 def commit_diff(week, old, new):
-    git = sh.git.bake(_cwd=MENU_STORE)
+    """
+    Queue the changed week for being committed to the MENU_STORE in the background.
+    All weeks changing within MENU_COMMIT_DELAY seconds of the first one go into the same commit.
+    """
+
+    global pending_since
+    with pending_lock:
+        if not pending_commits:
+            pending_since = time.time()
+            COMMIT_EXECUTOR.submit(commit_pending, MENU_COMMIT_DELAY)
+        pending_commits.add(week)
 
-    if not os.path.isdir(os.path.join(MENU_STORE, ".git")):
-        git.init()
-        git.remote.add("origin", "git@github.com:N-Coder/mensabot-crawler.git")
 
-    git.add("%s.csv" % week)
-    git.commit(m="updates from %s" % dtm.datetime.now())
+def commit_pending(delay=0):
+    flushing.wait(delay)
+    with pending_lock:
+        weeks = sorted(pending_commits)
+        pending_commits.clear()
+        since = pending_since
+    if not weeks:
+        return
+
+    start = time.time()
+    try:
+        git_commit([mensa_api.menu_week_file(week) for week in weeks], "updates from %s" % dtm.datetime.now())
+    except Exception:
+        commit_stats.record(len(weeks), since, start, time.time(), failed=True)
+        logger.error("Could not commit the menus of weeks %s to %s" % (weeks, MENU_STORE), exc_info=1)
+        return
+    commit_stats.record(len(weeks), since, start, time.time())
+    logger.debug("Committed the menus of weeks %s, %s" % (weeks, commit_stats))
+
+
+def flush_commits():
+    """
+    Commit the pending changes right away and wait until they are written, e.g. before shutting down.
+    """
+
+    flushing.set()
+    COMMIT_EXECUTOR.submit(flushing.clear).result()
+
+
+def git_commit(files: List[str], message: str):
+    """
+    Commit the given files of the MENU_STORE, creating the repository if it doesn't exist yet.
+    Uses dulwich if it is installed instead of starting a git process for every step.
+    """
+
+    store = os.path.abspath(MENU_STORE)
+    if porcelain:
+        if not os.path.isdir(os.path.join(store, ".git")):
+            porcelain.remote_add(porcelain.init(store), "origin", MENU_STORE_REMOTE)
+        porcelain.add(store, [os.path.join(store, file) for file in files])
+        porcelain.commit(store, message=message)
+    else:
+        git = sh.git.bake(_cwd=store)
+        if not os.path.isdir(os.path.join(store, ".git")):
+            git.init()
+            git.remote.add("origin", MENU_STORE_REMOTE)
+        git.add(*files)
+        git.commit(m=message)
     # git.push()
 
 
-def notify_diff(week, old, new):
-    dedup = set()
+def notify_diff(week, old, new) -> Wave:
+    """
+    Tell all chats that got the menu of the notifications_date about its changes and update their menu messages.
+    Every variant of the diff and the menu is only rendered once and messages that wouldn't change aren't edited,
+    the remaining messages are sent and edited concurrently by the DELIVERY engine.
+    """
 
+    day = mensa_cmd.notifications_date
     diff = generate_diff(old, new)
-    diff = [d for d in diff if d.dish().datum == mensa_cmd.notifications_date]
+    diff = [d for d in diff if d.dish().datum == day]
     diff = sorted(diff, key=lambda d: (MENU_TYPES.index(d.dish().warengruppe[0]), d.dish().warengruppe))
 
-    for msg in mensa_cmd.notifications:
-        with chat_record(msg) as chat:
-            if not chat:
-                continue
-            if chat.notify_change and chat.id not in dedup:
-                dedup.add(chat.id)
-                send_menu_update(mensa_cmd.notifications_date, diff, chat)
-            if chat.update_menu:
-                edit_menu_message(mensa_cmd.notifications_date, msg, new, chat)
+    dedup = set()
+    diff_texts = {}  # (template, locale, price category) -> rendered diff
+    menu_texts = {}  # (template, locale, price category, date of the message) -> rendered menu
+    jobs = []
+    for msg, text in list(mensa_cmd.notifications.values()):
+        chat = get_chat(msg.chat_id)
+        variant = (chat.template, chat.locale, PRICES_CATEGORIES[chat.price_category])
+        if chat.notify_change and chat.id not in dedup:
+            dedup.add(chat.id)
+            if variant not in diff_texts:
+                diff_texts[variant] = get_mensa_diff_formatted(
+                    day, diff, template=variant[0], locale=variant[1], price_category=variant[2])
+            if diff_texts[variant].strip():
+                jobs.append(functools.partial(send_menu_update, day, diff, chat, diff_texts[variant]))
+        if chat.update_menu:
+            key = variant + (ensure_date(msg.date),)
+            if key not in menu_texts:
+                menu_texts[key] = get_mensa_formatted(
+                    day, template=variant[0], locale=variant[1], price_category=variant[2], now=msg.date)
+            if menu_texts[key] != text:
+                jobs.append(functools.partial(edit_menu_message, day, msg, new, chat, menu_texts[key]))
+
+    logger.debug("Rendered {} diffs and {} menus for {} tracked messages".format(
+        len(diff_texts), len(menu_texts), len(mensa_cmd.notifications)))
+    return DELIVERY.send_wave("changes for {:%Y-%m-%d}".format(day), jobs)
+
+
+def install_listener(schedule=None):
+    """
+    Handle menu changes asynchronously, by default via the SCHED.
 
+    :param schedule: a function `schedule(func, *args)` that arranges for `func(*args)` to be called later
+    """
 
-def install_listener():
-    mensa_api.change_listeners.append(lambda *args, **kwargs: SCHED.enter(0, 150, notify_diff, args, kwargs))
-    mensa_api.change_listeners.append(lambda *args, **kwargs: SCHED.enter(0, 150, commit_diff, args, kwargs))
+    if not schedule:
+        schedule = lambda func, *args: SCHED.enter(0, 150, func, args)
+    mensa_api.change_listeners.append(lambda *args: schedule(notify_diff, *args))
+    mensa_api.change_listeners.append(lambda *args: schedule(commit_diff, *args))
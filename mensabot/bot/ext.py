@@ -6,8 +6,9 @@ from telegram.error import *
 from telegram.ext import Updater
 from telegram.utils.request import Request
 
-from mensabot.config_default import TELEGRAM_TOKEN
-from mensabot.db import CHATS, connection
+from mensabot.bot.delivery import DELIVERY
+from mensabot.config_default import DELIVERY_WORKERS, TELEGRAM_TOKEN
+from mensabot.db import delete_chat, move_chat
 
 access_logger = logging.getLogger("mensabot.access")
 
@@ -30,16 +31,12 @@ class MensaBot(Bot):
         return updates
 
     def send_message(self, *args, **kwargs):
-        from mensabot.bot.tasks import SCHED
-
-        # TODO use telegram-bot MessageQueue for rate limiting
-        # https://github.com/python-telegram-bot/python-telegram-bot/wiki/Avoiding-spam-limits
-        retries = kwargs.pop("__sendMessage_retries", 0)
         cb = kwargs.pop("callback", None)
         if not cb:
             cb = lambda x: None
 
         try:
+            self.__throttle(kwargs.get("chat_id"))
             access_logger.debug("Sending message (%s, %s)" % (args, kwargs))
             msg = super().send_message(*args, **kwargs)
             access_logger.info("Message sent: %s" % (msg.to_json() if isinstance(msg, Message) else msg))
@@ -50,55 +47,49 @@ class MensaBot(Bot):
             cb(e)
             raise
 
-        except RetryAfter as e:  # schedule retry after e.retry_after
-            kwargs["__sendMessage_retries"] = retries + 1
-            logger.warning("Message rate limit exceeded, retrying later.", exc_info=e)
-            id = SCHED.enter(e.retry_after, 120, updater.bot.sendMessage, kwargs=kwargs)
-            return e, id
-
-        except (TimedOut, NetworkError) as e:  # handle slow connection problems and handle other connection problems
-            if retries <= 8:
-                kwargs["__sendMessage_retries"] = retries + 1
-                delay = 2 ** retries
-                logger.warning("Network problems, retrying in %d seconds." % delay, exc_info=e)
-                id = SCHED.enter(delay, 120, updater.bot.sendMessage, kwargs=kwargs)
-                return e, id
-            else:
-                cb(e)
-                raise
+        except (RetryAfter, TimedOut, NetworkError) as e:
+            if DELIVERY.is_worker():
+                DELIVERY.on_failure(cb)  # in case this was the last try
+                raise  # the delivery engine retries the message on its own
+
+            # hand the message over to the delivery engine, which retries it in the background
+            logger.warning("Could not send message, retrying later.", exc_info=e)
+            if isinstance(e, RetryAfter):
+                DELIVERY.throttle.block(e.retry_after)
+            return e, DELIVERY.submit(self.send_message, *args, callback=cb, **kwargs)
 
         except ChatMigrated as e:  # the chat_id of a group has changed, use e.new_chat_id instead
             logger.info("Chat migrated, updating database and retrying.", exc_info=e)
-            with connection() as (conn, execute):
-                execute(
-                    CHATS.update().where(CHATS.c.id == kwargs["chat_id"]).values(id=e.new_chat_id)
-                )
+            move_chat(kwargs["chat_id"], e.new_chat_id)
             kwargs["chat_id"] = e.new_chat_id
-            id = SCHED.enter(1, 120, updater.bot.sendMessage, kwargs=kwargs)
-            return e, id
+            return self.send_message(*args, callback=cb, **kwargs)
 
         except Unauthorized as e:  # remove update.message.chat_id from conversation list
             logger.info("User stopped bot, removing from database.", exc_info=e)
-            with connection() as (conn, execute):
-                execute(
-                    CHATS.delete().where(CHATS.c.id == kwargs["chat_id"])
-                )
+            delete_chat(kwargs["chat_id"])
             cb(e)
             raise
 
     def edit_message_text(self, *args, **kwargs):
+        self.__throttle(kwargs.get("chat_id"))
         access_logger.debug("Editing message text (%s, %s)" % (args, kwargs))
         msg = super().edit_message_text(*args, **kwargs)
         access_logger.info("Message text edited: %s" % (msg.to_json() if isinstance(msg, Message) else msg))
         return msg
 
+    @staticmethod
+    def __throttle(chat_id):
+        # interactive replies from the handler threads only count towards the global limit, as waiting for the bucket
+        # of their chat would block the handler for a second per additional message
+        DELIVERY.throttle.acquire(chat_id if DELIVERY.is_worker() else None)
+
     getUpdates = get_updates
     sendMessage = send_message
     editMessageText = edit_message_text
 
 
 logger = logging.getLogger("mensabot.ext")
-request = Request(con_pool_size=8)
+request = Request(con_pool_size=8 + DELIVERY_WORKERS)
 bot = MensaBot(token=TELEGRAM_TOKEN, request=request)
 updater = Updater(bot=bot, use_context=True)
 dispatcher = updater.dispatcher
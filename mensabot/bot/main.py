@@ -1,10 +1,15 @@
+import argparse
 import logging
+import threading
+import time
 
+from mensabot import db, history, mensa, parse
 from mensabot.bot.command import init_commands
-from mensabot.bot.diff_listener import install_listener
+from mensabot.bot.diff_listener import flush_commits, install_listener
 from mensabot.bot.ext import updater
 from mensabot.bot.tasks import run_sched
-from mensabot.config_default import configure_logging, ENABLE_WEBSERVER
+from mensabot.config_default import configure_logging, ASYNCIO, ENABLE_WEBSERVER, MENU_STORE, \
+    SCRAPE_STORE, WARM_UP
 from mensabot.format import get_version
 
 configure_logging()
@@ -12,12 +17,48 @@ logger = logging.getLogger("mensabot.bot")
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Run the mensabot telegram bot.')
+    parser.add_argument('--asyncio', action='store_true', default=ASYNCIO,
+                        help='fetch and schedule on an asyncio event loop (requires aiohttp)')
+    parser.add_argument('--warm-up', choices=["blocking", "background", "off"], default=WARM_UP,
+                        help='fetch all opening times and the upcoming menus before or while starting to poll')
+    args = parser.parse_args()
+
     logger.info("Starting telegram bot")
+    db.migrate()
+    history.install_listener()
+    logger.info("Loaded {} chats with push notifications".format(db.load_push_buckets()))
     init_commands()
-    install_listener()
-    updater.start_polling()
-    logger.info("{} listening...".format(get_version()))
-    run_sched()
+    parse.load_date_parser()
+    logger.info("Loaded the menus of {} weeks from {}".format(mensa.warm_menu_cache(), MENU_STORE))
+    logger.info("Loaded {} scraped results from {}".format(mensa.load_caches(), SCRAPE_STORE))
+    if args.warm_up != "off":
+        warm_up(blocking=args.warm_up == "blocking")
+    if args.asyncio:
+        from mensabot.bot.aio import run_async
+        updater.start_polling()
+        logger.info("{} listening in asyncio mode...".format(get_version()))
+        run_async()
+    else:
+        install_listener()
+        updater.start_polling()
+        logger.info("{} listening...".format(get_version()))
+        run_sched()
+    flush_commits()
+
+
+def warm_up(blocking=True):
+    start = time.perf_counter()
+    futures = mensa.warm_up()
+
+    def report():
+        steps = mensa.warm_up_report(futures)
+        logger.info("Warm-up took {:.2f}s: {}".format(time.perf_counter() - start, steps))
+
+    if blocking:
+        report()
+    else:
+        threading.Thread(target=report, name="warm-up", daemon=True).start()
 
 
 if __name__ == "__main__":
@@ -1,17 +1,22 @@
 import datetime as dtm
+import functools
 import logging
 import math
 import sched
 import time as systime
+from typing import List, Tuple
 
 import requests
-from sqlalchemy import and_
 
 from mensabot.bot.command import mensa
 from mensabot.bot.command.mensa import send_menu_message
+from mensabot.bot.delivery import DELIVERY
 from mensabot.bot.ext import updater
-from mensabot.db import CHATS, connection
-from mensabot.mensa import clear_caches, get_menu_week, get_next_mensa_open
+from mensabot.config_default import MENU_PREFETCH_WEEKS
+from mensabot.db import get_push_chats
+from mensabot.format import get_mensa_formatted
+from mensabot.mensa import PRICES_CATEGORIES, get_menu_week, get_next_mensa_open, menu_week_of, \
+    prefetch_menu_weeks, refresh_caches
 
 # TODO use telegram task queue
 # https://github.com/python-telegram-bot/python-telegram-bot/wiki/Extensions-%E2%80%93-JobQueue
@@ -25,7 +30,7 @@ logger = logging.getLogger("mensabot.sched")
 def run_sched():
     schedule_notification()
     schedule_update_menu()
-    schedule_clear_cache()
+    schedule_refresh_caches()
     schedule_clear_mensa_notifications()
 
     running = True
@@ -38,6 +43,7 @@ def run_sched():
             running = False
             logger.info("KeyboardInterrupt, shutting down.", exc_info=1)
             updater.stop()
+            DELIVERY.shutdown(wait=False)
         except:
             logger.error("Exception from scheduler, restarting.", exc_info=1)
             if len(SCHED.queue) < SCHED_TASK_COUNT:
@@ -49,13 +55,31 @@ def task_name(task):
     return getattr(task.action, '__name__', repr(task.action))
 
 
+def current_slot() -> dtm.datetime:
+    now = dtm.datetime.now()
+    return now.replace(minute=math.floor(now.minute / SCHED_INTERVAL) * SCHED_INTERVAL, second=0, microsecond=0)
+
+
 def schedule_notification(now=None):
     if not now:
-        now = dtm.datetime.now()
-        now = now.replace(minute=math.floor(now.minute / SCHED_INTERVAL) * SCHED_INTERVAL,
-                          second=0, microsecond=0)
-    later = now + dtm.timedelta(minutes=SCHED_INTERVAL)
+        now = current_slot()
+    later, day = get_next_notification_slot(now)
+    SCHED.enterabs(later.timestamp(), 10, schedule_notification, [later])
 
+    for notify_time, rows in get_notification_waves(now, later):
+        SCHED.enterabs(notify_time.timestamp(), 100, send_notification_wave, [day, rows, notify_time])
+        # this needs to use `day` instead of `notify_time`, because we could be requesting the menu for
+        # tomorrow on the evening before
+
+
+def get_next_notification_slot(now: dtm.datetime) -> (dtm.datetime, dtm.datetime):
+    """
+    Determine the end of the time slot starting at `now` and the day whose menu should be sent during that slot.
+    The day is None if the opening times of the mensa couldn't be fetched, `send_notification_wave` then tries again.
+    """
+
+    later = now + dtm.timedelta(minutes=SCHED_INTERVAL)
+    day = None
     try:
         (open, close, day, offset), menu = get_next_mensa_open(now)
         next_close = dtm.datetime.combine(day.date(), close)
@@ -68,59 +92,84 @@ def schedule_notification(now=None):
             logger.debug("Scheduling notifications between {:%H:%M} and {:%H:%M}".format(now, later))
     except requests.exceptions.RequestException:
         logger.warning("Could not get next opening time of mensa, trying again in 1 minute", exc_info=True)
+    return later, day
+
+
+def get_notification_waves(now: dtm.datetime, later: dtm.datetime) -> List[Tuple[dtm.datetime, list]]:
+    """
+    Group all chats that want their notification between `now` and `later` by the minute of their push_time.
+    """
+
+    waves = []
+    for push_time, rows in get_push_chats(now.time(), later.time()):
+        notify_time = dtm.datetime.combine(now.date(), push_time)
+        logger.debug("Scheduling notification to {} chats for {:%H:%M}".format(len(rows), notify_time))
+        waves.append((notify_time, rows))
+    return waves
 
-    SCHED.enterabs(later.timestamp(), 10, schedule_notification, [later])
 
-    with connection() as (conn, execute):
-        res = execute(
-            CHATS.select()
-                .where(and_(CHATS.c.push_time >= now.time(), CHATS.c.push_time < later.time()))
-                .order_by(CHATS.c.push_time.asc())
-        )
-        for row in res:
-            notify_time = dtm.datetime.combine(now.date(), row.push_time)
-            logger.debug("Scheduling notification to {} for {:%H:%M}".format(row, notify_time))
-            SCHED.enterabs(notify_time.timestamp(), 100,
-                           lambda row=row: send_menu_message(day, row, row.id))
-            # `row` needs to be captured explicitly in a new scope, otherwise it would always have the last used value
-            # after the loop terminated. See here: https://stackoverflow.com/a/2295372/805569
-            # this also needs to use `day` instead of `notify_time`, because we could be requesting the menu for
-            # tomorrow on the evening before
+def send_notification_wave(day, rows, notify_time):
+    if day is None:
+        # the opening times couldn't be fetched when the wave was scheduled, so determine the day now
+        later, day = get_next_notification_slot(notify_time)
+        if day is None or later > notify_time + dtm.timedelta(minutes=SCHED_INTERVAL):
+            logger.warning("Not sending notification to {} chats for {:%H:%M}, as the day of the next menu is unknown"
+                           .format(len(rows), notify_time))
+            return
+
+    # render every variant once before fanning out, so that the workers only hit the cache
+    for template, locale, price_category in {(row.template, row.locale, row.price_category) for row in rows}:
+        get_mensa_formatted(day, template=template, locale=locale, price_category=PRICES_CATEGORIES[price_category])
+
+    DELIVERY.send_wave("notifications for {:%H:%M}".format(notify_time),
+                       [functools.partial(send_menu_message, day, row, row.id) for row in rows])
 
 
 def schedule_update_menu():
     logger.debug("Fetching new menu")
     SCHED.enter(5 * 60, 11, schedule_update_menu)
     try:
-        get_menu_week(dtm.date.today().isocalendar()[1], disable_cache=True)
+        get_menu_week(menu_week_of(dtm.date.today()), disable_cache=True)
     except requests.exceptions.RequestException:
         logger.warning("Could not fetch new menu, trying again later", exc_info=True)
+    prefetch_menu_weeks(dtm.date.today() + dtm.timedelta(weeks=1), MENU_PREFETCH_WEEKS - 1)
 
 
-def schedule_clear_cache():
+def schedule_refresh_caches(refresh=False):
     now = dtm.datetime.now()
     next = dtm.datetime.combine((now + dtm.timedelta(days=1)).date(), dtm.time(2, 0))
-    SCHED.enterabs(next.timestamp(), 1000, schedule_clear_cache)
-    clear_caches()
+    SCHED.enterabs(next.timestamp(), 1000, schedule_refresh_caches, (True,))
+    if refresh:
+        refresh_caches()
 
 
 def schedule_clear_mensa_notifications():
     try:
-        (open, close, day, offset), menu = get_next_mensa_open()
-        next_close = dtm.datetime.combine(day.date(), close)
-        SCHED.enterabs((next_close + dtm.timedelta(minutes=1)).timestamp(), 1000, schedule_clear_mensa_notifications)
-
-        if mensa.notifications_date != day.date():
-            logger.debug("Dropping mensa notifications from {:%Y-%m-%d}, because new mensa date is {:%Y-%m-%d}"
-                         " (next reset on that day at {:%H:%M})"
-                         .format(mensa.notifications_date, day.date(), next_close))
-            mensa.notifications.clear()
-            mensa.notifications_date = day.date()
-        else:
-            logger.debug("Not dropping mensa notifications from {:%Y-%m-%d}, because it is still the next mensa date "
-                         " (next reset on that day at {:%H:%M})"
-                         .format(mensa.notifications_date, next_close))
+        next = clear_mensa_notifications()
     except requests.exceptions.RequestException:
         logger.warning("Could not get next opening time of mensa, trying again in 1 minute", exc_info=True)
-        SCHED.enterabs((dtm.datetime.now() + dtm.timedelta(minutes=1)).timestamp(), 1000,
-                       schedule_clear_mensa_notifications)
+        next = dtm.datetime.now() + dtm.timedelta(minutes=1)
+    SCHED.enterabs(next.timestamp(), 1000, schedule_clear_mensa_notifications)
+
+
+def clear_mensa_notifications() -> dtm.datetime:
+    """
+    Drop the tracked menu messages once the next mensa date changed.
+
+    :return: the time when this check should be repeated
+    """
+
+    (open, close, day, offset), menu = get_next_mensa_open()
+    next_close = dtm.datetime.combine(day.date(), close)
+
+    if mensa.notifications_date != day.date():
+        logger.debug("Dropping mensa notifications from {:%Y-%m-%d}, because new mensa date is {:%Y-%m-%d}"
+                     " (next reset on that day at {:%H:%M})"
+                     .format(mensa.notifications_date, day.date(), next_close))
+        mensa.notifications.clear()
+        mensa.notifications_date = day.date()
+    else:
+        logger.debug("Not dropping mensa notifications from {:%Y-%m-%d}, because it is still the next mensa date "
+                     " (next reset on that day at {:%H:%M})"
+                     .format(mensa.notifications_date, next_close))
+    return next_close + dtm.timedelta(minutes=1)
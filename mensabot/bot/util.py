@@ -1,4 +1,3 @@
-import datetime as dtm
 import logging
 import sys
 from contextlib import contextmanager
@@ -8,7 +7,7 @@ from telegram import Message, MessageEntity, ParseMode, Update
 from telegram.ext import CommandHandler
 
 from mensabot.bot.ext import dispatcher
-from mensabot.db import CHATS, connection
+from mensabot.db import get_chat
 
 
 @contextmanager
@@ -19,27 +18,7 @@ def chat_record(id):
         id = id.message.chat.id
     elif not isinstance(id, int):
         raise ValueError("ID '%s' is not an int." % id)
-    with connection() as (conn, execute):
-        res = execute(
-            CHATS.select().where(CHATS.c.id == id)
-        ).fetchone()
-        if not res:
-            execute(
-                CHATS.insert().values(id=id)
-            )
-            res = execute(
-                CHATS.select().where(CHATS.c.id == id)
-            ).fetchone()
-        yield res
-
-
-def ensure_date(dt):
-    if isinstance(dt, dtm.datetime):
-        return dt.date()
-    elif isinstance(dt, dtm.date):
-        return dt
-    else:
-        raise ValueError("'%s' can't be converted to a date" % dt)
+    yield get_chat(id)
 
 
 def get_args(update):
@@ -21,11 +21,27 @@ def configure_logging():
 # Defaults for the config
 ENABLE_WEBSERVER = False
 DATABASE = 'sqlite:///mensabot.sqlite'
+DATABASE_POOL_SIZE = 8  # connections to the database kept open and shared by all threads
+DATABASE_TIMEOUT = 15  # seconds to wait for another thread or process writing to an SQLite database
 LOG_PATH = "./log"
 LOG_CONFIG = "./logging.yaml"
 #TELEGRAM_TOKEN =  # No sensible default here
 MENU_STORE = "./menustore"
+MENU_CACHE_TTL = 5 * 60  # seconds a fetched menu is considered fresh
+MENU_CACHE_MAX_STALE = 60 * 60  # seconds an outdated menu may still be served while it is refreshed in background
+MENU_PREFETCH_WEEKS = 4  # number of upcoming weeks fetched together with the current one
+MENU_COMMIT_DELAY = 10  # seconds to wait for further menu changes before committing them to the MENU_STORE
+SCRAPE_STORE = "./scrapestore"  # scraped opening times and semester dates are kept here across restarts
+SCRAPE_CACHE_REFRESH = 24 * 60 * 60  # seconds after which scraped data is refreshed in background
+SCRAPE_CACHE_TTL = 7 * 24 * 60 * 60  # seconds after which scraped data must be refreshed before it is used again
+HTML_PARSER = None  # BeautifulSoup parser used for scraping, e.g. "lxml" or "html.parser", by default lxml if installed
+WARM_UP = "blocking"  # fetch all opening times and menus on startup: "blocking", "background" or "off"
+WARM_UP_WORKERS = 4  # threads fetching in parallel during the warm-up
 ENABLE_WEBSERVER = False
+ASYNCIO = False  # run fetching and scheduling on an asyncio event loop, requires aiohttp
+DELIVERY_WORKERS = 4  # threads sending messages in parallel
+TELEGRAM_RATE_LIMIT = 30  # messages per second to all chats
+TELEGRAM_CHAT_RATE_LIMIT = 1  # messages per second to a single chat
 
 sys.path.insert(0, '.')
 from config import *
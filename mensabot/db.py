@@ -1,13 +1,20 @@
+import datetime as dtm
 import logging
+import threading
 from contextlib import ExitStack, closing, contextmanager
+from typing import Dict, List, Set, Tuple
 
 from sqlalchemy import *
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import ClauseElement
 
-from mensabot.config_default import ECHO_SQL, DATABASE
+from mensabot.config_default import DATABASE, DATABASE_POOL_SIZE, DATABASE_TIMEOUT, ECHO_SQL
 
 logger = logging.getLogger("mensabot.db")
 
-SCHEMA_VERSION = 2
+SCHEMA_VERSION = 4
 metadata = MetaData()
 CHATS = Table(
     'chats', metadata,
@@ -21,8 +28,55 @@ CHATS = Table(
     Column('notify_change_sound', Boolean, server_default=text("0")),
     Column('update_menu', Boolean, server_default=text("1")),
 )
+CHATS_PUSH_TIME = Index('chats_push_time', CHATS.c.push_time)  # since version 3
 
-SQL_ENGINE = create_engine(DATABASE, echo=ECHO_SQL)
+# every version of every dish ever fetched, valid from the time it was fetched until it changed or was removed
+DISH_VERSIONS = Table(  # since version 4
+    'dish_versions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('datum', Date, nullable=False),
+    Column('warengruppe', String, nullable=False),
+    Column('name', String, nullable=False),
+    Column('kennz', String, nullable=False),  # the codes joined by ","
+    Column('zusatz', String, nullable=False),
+    Column('stud', Float),
+    Column('bed', Float),
+    Column('gast', Float),
+    Column('valid_from', DateTime, nullable=False),
+    Column('valid_to', DateTime, server_default=text("NULL")),  # NULL for the dishes currently on the menu
+    Index('dish_versions_datum', 'datum', 'warengruppe'),
+)
+
+
+def create_sql_engine(url: str = DATABASE):
+    """
+    Create the engine for the database at `url`.
+    SQLite files are opened in WAL mode and their connections are pooled and shared between threads,
+    so that reads by the handler threads don't wait for the scheduler writing and vice versa.
+    """
+
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return create_engine(url, echo=ECHO_SQL)
+
+    engine = create_engine(url, echo=ECHO_SQL, poolclass=QueuePool, pool_size=DATABASE_POOL_SIZE,
+                           connect_args={"check_same_thread": False, "timeout": DATABASE_TIMEOUT})
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")  # WAL is still consistent after a crash with this
+        cursor.close()
+
+    return engine
+
+
+SQL_ENGINE = create_sql_engine()
+chat_cache = {}  # chat id -> row of CHATS, kept up to date by all functions below that change a chat
+chat_cache_lock = threading.Lock()
+# minute of push_time -> ids of the chats with that push_time, loaded by load_push_buckets on first use
+push_buckets = None  # type: Dict[dtm.time, Set[int]]
 
 
 @contextmanager
@@ -33,26 +87,155 @@ def connection():
         yield conn, execute
 
 
-with connection() as (conn, execute):
-    res = execute("PRAGMA user_version")
-    version = res.fetchone()[0]
-
-    if version == 0:
-        logger.info("Migrating from version %s to version %s" % (version, SCHEMA_VERSION))
-        metadata.create_all(SQL_ENGINE)
-        execute("PRAGMA user_version = %s;" % (SCHEMA_VERSION,))
-    elif version == 1:
-        logger.info("Migrating from version %s to version %s" % (version, SCHEMA_VERSION))
-        execute("ALTER TABLE chats RENAME TO chats_backup;")
-        metadata.create_all(SQL_ENGINE)
-        execute(
-            "INSERT INTO chats (id, price_category, template, locale, push_time) "
-            "SELECT id, price_category, template, locale, notification_time FROM chats_backup;"
-        )
-        execute("DROP TABLE chats_backup;")
-        execute("PRAGMA user_version = %s;" % SCHEMA_VERSION)
-    elif version == SCHEMA_VERSION:
-        logger.debug("Database version %s is up-to-date" % version)
-    elif version > SCHEMA_VERSION:
-        raise AssertionError("Database version %s is from a more recent program version (code v %s)!" %
-                             (version, SCHEMA_VERSION))
+def migrate():
+    """
+    Create the database or bring its schema up to SCHEMA_VERSION.
+    Needs to be called once by every entry point before the database is used.
+    """
+
+    with connection() as (conn, execute):
+        res = execute("PRAGMA user_version")
+        version = res.fetchone()[0]
+
+        if version == 0:
+            logger.info("Migrating from version %s to version %s" % (version, SCHEMA_VERSION))
+            metadata.create_all(SQL_ENGINE)
+            execute("PRAGMA user_version = %s;" % (SCHEMA_VERSION,))
+        elif version == 1:
+            logger.info("Migrating from version %s to version %s" % (version, SCHEMA_VERSION))
+            execute("ALTER TABLE chats RENAME TO chats_backup;")
+            metadata.create_all(SQL_ENGINE)
+            execute(
+                "INSERT INTO chats (id, price_category, template, locale, push_time) "
+                "SELECT id, price_category, template, locale, notification_time FROM chats_backup;"
+            )
+            execute("DROP TABLE chats_backup;")
+            execute("PRAGMA user_version = %s;" % SCHEMA_VERSION)
+        elif version in (2, 3):
+            logger.info("Migrating from version %s to version %s" % (version, SCHEMA_VERSION))
+            if version == 2:
+                CHATS_PUSH_TIME.create(conn)
+            DISH_VERSIONS.create(conn)
+            execute("PRAGMA user_version = %s;" % SCHEMA_VERSION)
+        elif version == SCHEMA_VERSION:
+            logger.debug("Database version %s is up-to-date" % version)
+        elif version > SCHEMA_VERSION:
+            raise AssertionError("Database version %s is from a more recent program version (code v %s)!" %
+                                 (version, SCHEMA_VERSION))
+
+
+def get_chat(id: int):
+    """
+    Get the settings of a chat, adding the chat with the default settings if it is unknown.
+    Only the first call for a chat goes to the database.
+    """
+
+    row = chat_cache.get(id)
+    if row is None:
+        with chat_cache_lock, connection() as (conn, execute):
+            row = chat_cache.get(id)
+            if row is None:
+                row = execute(CHATS.select().where(CHATS.c.id == id)).fetchone()
+                if not row:
+                    execute(CHATS.insert().prefix_with("OR IGNORE").values(id=id))
+                    row = execute(CHATS.select().where(CHATS.c.id == id)).fetchone()
+                chat_cache[id] = row
+    return row
+
+
+def set_chat(id: int, **values):
+    """
+    Change the settings of a chat, adding the chat if it is unknown.
+
+    :param values: the new value for each column, may also be SQL like the `server_default` of the column
+    :return: the updated row
+    """
+
+    columns = [CHATS.c[name] for name in values]  # raises KeyError for unknown columns
+    params = {name: value for name, value in values.items() if not isinstance(value, ClauseElement)}
+    stmt = text("INSERT INTO chats (id, {}) VALUES (:id, {}) ON CONFLICT (id) DO UPDATE SET {}".format(
+        ", ".join(col.name for col in columns),
+        ", ".join(str(values[col.name]) if col.name not in params else ":" + col.name for col in columns),
+        ", ".join("{0} = excluded.{0}".format(col.name) for col in columns),
+    )).bindparams(bindparam("id", type_=CHATS.c.id.type), *(bindparam(col.name, type_=col.type)
+                                                            for col in columns if col.name in params))
+
+    with chat_cache_lock, connection() as (conn, execute):
+        execute(stmt, id=id, **params)
+        row = execute(CHATS.select().where(CHATS.c.id == id)).fetchone()
+        __update_push_bucket(chat_cache.get(id), row)
+        chat_cache[id] = row
+    return row
+
+
+def move_chat(id: int, new_id: int):
+    """
+    Keep the settings of a chat whose id changed, e.g. because a group was migrated to a supergroup.
+    """
+
+    with chat_cache_lock, connection() as (conn, execute):
+        execute(CHATS.update().where(CHATS.c.id == id).values(id=new_id))
+        row = execute(CHATS.select().where(CHATS.c.id == new_id)).fetchone()
+        __update_push_bucket(chat_cache.pop(id, None), None)
+        __update_push_bucket(chat_cache.pop(new_id, None), row)
+        if row:
+            chat_cache[new_id] = row
+
+
+def delete_chat(id: int):
+    with chat_cache_lock, connection() as (conn, execute):
+        execute(CHATS.delete().where(CHATS.c.id == id))
+        __update_push_bucket(chat_cache.pop(id, None), None)
+
+
+def push_minute(push_time: dtm.time) -> dtm.time:
+    return push_time.replace(second=0, microsecond=0)
+
+
+def load_push_buckets() -> int:
+    """
+    Read all chats into the chat_cache and group the ones with a push_time into the push_buckets.
+
+    :return: the number of chats that want a notification
+    """
+
+    global push_buckets
+    with chat_cache_lock, connection() as (conn, execute):
+        buckets = {}
+        for row in execute(CHATS.select()).fetchall():
+            chat_cache[row.id] = row
+            if row.push_time is not None:
+                buckets.setdefault(push_minute(row.push_time), set()).add(row.id)
+        push_buckets = buckets
+        return sum(len(ids) for ids in buckets.values())
+
+
+def __update_push_bucket(old_row, new_row):
+    # needs to be called with the chat_cache_lock held
+    if push_buckets is None:
+        return
+    if old_row is not None and old_row.push_time is not None:
+        bucket = push_buckets.get(push_minute(old_row.push_time), set())
+        bucket.discard(old_row.id)
+        if not bucket:
+            push_buckets.pop(push_minute(old_row.push_time), None)
+    if new_row is not None and new_row.push_time is not None:
+        push_buckets.setdefault(push_minute(new_row.push_time), set()).add(new_row.id)
+
+
+def get_push_chats(start: dtm.time, end: dtm.time) -> List[Tuple[dtm.time, list]]:
+    """
+    Get the chats that want their notification between `start` (inclusive) and `end` (exclusive), grouped by the
+    minute of their push_time. Only the first call reads from the database, later ones use the push_buckets.
+
+    :return: a list of (minute, rows of CHATS ordered by push_time) tuples, ordered by minute
+    """
+
+    if push_buckets is None:
+        load_push_buckets()
+    with chat_cache_lock:
+        minutes = sorted(minute for minute in push_buckets if start <= minute < end)
+        return [(minute, sorted((chat_cache[id] for id in push_buckets[minute]),
+                                key=lambda row: (row.push_time, row.id)))
+                for minute in minutes]
+
@@ -1,18 +1,23 @@
 import datetime as dtm
 import inspect
+import logging
 import os
 import subprocess
-from typing import List, NamedTuple
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Tuple
 
 import pkg_resources
 from babel.dates import format_date, format_time
 from jinja2 import PackageLoader, TemplateNotFound
 from jinja2.sandbox import SandboxedEnvironment
 
-from mensabot.bot.util import ensure_date
-from mensabot.mensa import LOCATIONS, NOT_OPEN, dish, get_menu_day, get_next_open, get_opening_times, is_holiday
+from mensabot.mensa import LOCATIONS, NOT_OPEN, change_listeners, dish, ensure_date, get_menu_day, get_next_open, \
+    get_opening_times_range, menu_week_of
 from mensabot.parse import LANG
 
+logger = logging.getLogger("mensabot.format")
+
 KETCHUP = ["kartoffel", "potato", "pommes", "twister", "kroketten", "rösti", "schnitzel", "cordon", "burger", "fries"]
 
 JINJA2_ENV = SandboxedEnvironment(
@@ -50,28 +55,28 @@ def filter_warengruppe_not(list: List[dish], warengruppe):
 def filter_kennz(list: List[dish], kennz):
     if isinstance(kennz, str):
         kennz = kennz.split(",")
-    return (v for v in list if any(v.kennz[k] for k in kennz))
+    return (v for v in list if any(k in v.kennz for k in kennz))
 
 
 @jinja2_filter("kennz_not")
 def filter_kennz_not(list: List[dish], kennz):
     if isinstance(kennz, str):
         kennz = kennz.split(",")
-    return (v for v in list if not any(v.kennz[k] for k in kennz))
+    return (v for v in list if not any(k in v.kennz for k in kennz))
 
 
 @jinja2_filter("zusatz")
 def filter_zusatz(list: List[dish], zusatz):
     if isinstance(zusatz, str):
         zusatz = zusatz.split(",")
-    return (v for v in list if any(v.zusatz[z] for z in zusatz))
+    return (v for v in list if any(z in v.zusatz for z in zusatz))
 
 
 @jinja2_filter("zusatz_not")
 def filter_zusatz_not(list: List[dish], zusatz):
     if isinstance(zusatz, str):
         zusatz = zusatz.split(",")
-    return (v for v in list if not any(v.zusatz[z] for z in zusatz))
+    return (v for v in list if not any(z in v.zusatz for z in zusatz))
 
 
 @jinja2_filter("ketchup")
@@ -79,14 +84,70 @@ def filter_ketchup(list: List[dish]):
     return (v for v in list if any(s in v.name.lower() for s in KETCHUP))
 
 
+MENU_CACHE_SIZE = 64
+menu_cache_info = NamedTuple("menu_cache_info", [("hits", int), ("misses", int), ("maxsize", int), ("currsize", int)])
+
+menu_cache = OrderedDict()
+menu_cache_lock = threading.Lock()
+menu_cache_stats = {"hits": 0, "misses": 0}
+
+
+def menu_fingerprint(menu: List[dish]) -> int:
+    """
+    Compute a hash over the contents of a menu, so that cached renderings of outdated menus can be detected.
+    """
+
+    return hash(tuple(menu))
+
+
 def get_mensa_formatted(dt, template=None, locale=None, price_category="stud", now=None):
     locale = locale or LANG[0]
     template = template or locale
     now = now or dtm.datetime.now()
-    return JINJA2_ENV.get_template("{}/menu.md".format(template)).render(
-        {"menu": get_menu_day(dt), "date": dt, "now": now, "locale": locale,
+    menu = get_menu_day(dt)
+
+    # the templates only use the dates of `dt` and `now`, so all chats with the same settings share one rendering
+    key = (ensure_date(dt), ensure_date(now), template, locale, price_category)
+    fingerprint = menu_fingerprint(menu)
+    with menu_cache_lock:
+        cached = menu_cache.get(key)
+        if cached and cached[0] == fingerprint:
+            menu_cache.move_to_end(key)
+            menu_cache_stats["hits"] += 1
+            return cached[1]
+        menu_cache_stats["misses"] += 1
+
+    text = JINJA2_ENV.get_template("{}/menu.md".format(template)).render(
+        {"menu": menu, "date": dt, "now": now, "locale": locale,
          "price_category": price_category})
 
+    with menu_cache_lock:
+        menu_cache[key] = (fingerprint, text)
+        menu_cache.move_to_end(key)
+        while len(menu_cache) > MENU_CACHE_SIZE:
+            menu_cache.popitem(last=False)
+    return text
+
+
+def get_menu_cache_info() -> menu_cache_info:
+    with menu_cache_lock:
+        return menu_cache_info(menu_cache_stats["hits"], menu_cache_stats["misses"], MENU_CACHE_SIZE, len(menu_cache))
+
+
+def clear_menu_cache(week: Tuple[int, int] = None):
+    """
+    Drop the cached renderings for all dates of the given (iso year, iso week) or, if no week is given, all renderings.
+    """
+
+    with menu_cache_lock:
+        keys = [k for k in menu_cache if week is None or menu_week_of(k[0]) == week]
+        for key in keys:
+            del menu_cache[key]
+    logger.debug("Dropped %d cached menu renderings for week %s" % (len(keys), week or "all"))
+
+
+change_listeners.append(lambda week, old, new: clear_menu_cache(week))
+
 
 def get_mensa_diff_formatted(dt, diff, template=None, locale=None, price_category="stud", now=None):
     locale = locale or LANG[0]
@@ -108,8 +169,9 @@ def get_open_formatted(loc, dt, template=None, locale=None):
     open_info = get_next_open(dt, LOCATIONS[loc])
 
     # schedule for the current week
-    sched = [schedule(*get_opening_times(LOCATIONS[loc])[(is_holiday(day), day.isoweekday() - 1)], day=day)
-             for day in [dt + dtm.timedelta(days=i - dt.weekday()) for i in range(7)]]
+    days = [dt + dtm.timedelta(days=i - dt.weekday()) for i in range(7)]
+    times = get_opening_times_range(days[0], days[-1], LOCATIONS[loc])
+    sched = [schedule(open, close, day) for day, (open, close) in zip(days, times)]
 
     return JINJA2_ENV.get_template("{}/open.md".format(template)).render(
         {"open_info": open_info, "schedule": sched, "date": dt, "loc": loc, "NOT_OPEN": NOT_OPEN,
@@ -0,0 +1,162 @@
+import collections
+import datetime as dtm
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from mensabot.db import DISH_VERSIONS, connection
+from mensabot.mensa_menu import Change, codeset, dish, generate_diff
+
+logger = logging.getLogger("mensabot.history")
+
+
+def week_dates(week: Tuple[int, int]) -> Tuple[dtm.date, dtm.date]:
+    """
+    Get the monday and the sunday of the given (iso year, iso week).
+    """
+
+    monday = dtm.datetime.strptime("%d-W%02d-1" % week, "%G-W%V-%u").date()
+    return monday, monday + dtm.timedelta(days=6)
+
+
+def __to_row(d: dish) -> dict:
+    return dict(datum=d.datum, warengruppe=d.warengruppe, name=d.name, kennz=",".join(d.kennz),
+                zusatz=",".join(d.zusatz), stud=d.stud, bed=d.bed, gast=d.gast)
+
+
+def __to_dish(row) -> dish:
+    return dish(datum=row.datum, name=row.name, warengruppe=row.warengruppe,
+                kennz=codeset.of(row.kennz.split(",") if row.kennz else []),
+                zusatz=codeset.of(row.zusatz.split(",") if row.zusatz else []),
+                stud=row.stud, bed=row.bed, gast=row.gast)
+
+
+def record_menu_week(week: Tuple[int, int], menu: List[dish], now: dtm.datetime = None) -> int:
+    """
+    Store `menu` as the current version of the menu of `week`.
+    Dishes that didn't change keep their version, the versions of all other dishes of the week end `now`.
+
+    :return: the number of dish versions that were added or ended
+    """
+
+    now = now or dtm.datetime.now()
+    start, end = week_dates(week)
+    with connection() as (conn, execute), conn.begin():
+        current = execute(DISH_VERSIONS.select().where(and_(
+            DISH_VERSIONS.c.datum.between(start, end), DISH_VERSIONS.c.valid_to.is_(None)))).fetchall()
+        remaining = collections.Counter(menu)
+        ended = []
+        for row in current:
+            d = __to_dish(row)
+            if remaining[d] > 0:
+                remaining[d] -= 1
+            else:
+                ended.append(row.id)
+        added = []
+        for d in menu:
+            if remaining[d] > 0:
+                remaining[d] -= 1
+                added.append(dict(__to_row(d), valid_from=now))
+
+        if ended:
+            execute(DISH_VERSIONS.update().where(DISH_VERSIONS.c.id.in_(ended)).values(valid_to=now))
+        if added:
+            execute(DISH_VERSIONS.insert(), added)
+    if ended or added:
+        logger.debug("Recorded new version of week %s: %d dishes added, %d ended" % (week, len(added), len(ended)))
+    return len(ended) + len(added)
+
+
+def delete_menu_week(week: Tuple[int, int]) -> int:
+    """
+    Remove all versions of the menu of `week` from the history, e.g. for importing them again.
+
+    :return: the number of dish versions that were removed
+    """
+
+    start, end = week_dates(week)
+    with connection() as (conn, execute):
+        return execute(DISH_VERSIONS.delete().where(__between(start, end))).rowcount
+
+
+def __between(start: dtm.date, end: dtm.date):
+    return DISH_VERSIONS.c.datum.between(start, end)
+
+
+def get_versions(start: dtm.date, end: dtm.date = None) -> List[dtm.datetime]:
+    """
+    Get all times at which the menu of the dates between `start` and `end` (inclusive) changed, oldest first.
+    """
+
+    where = __between(start, end or start)
+    with connection() as (conn, execute):
+        times = {row[0] for row in execute(select([DISH_VERSIONS.c.valid_from]).where(where).distinct())}
+        times.update(row[0] for row in execute(select([DISH_VERSIONS.c.valid_to]).where(
+            and_(where, DISH_VERSIONS.c.valid_to.isnot(None))).distinct()))
+    return sorted(times)
+
+
+def get_menu_at(start: dtm.date, end: dtm.date = None, at: dtm.datetime = None) -> List[dish]:
+    """
+    Get the menu of the dates between `start` and `end` (inclusive) as it was at the time `at`, the current one
+    by default.
+    """
+
+    where = __between(start, end or start)
+    if at:
+        where = and_(where, DISH_VERSIONS.c.valid_from <= at,
+                     or_(DISH_VERSIONS.c.valid_to.is_(None), DISH_VERSIONS.c.valid_to > at))
+    else:
+        where = and_(where, DISH_VERSIONS.c.valid_to.is_(None))
+    with connection() as (conn, execute):
+        rows = execute(DISH_VERSIONS.select().where(where).order_by(
+            DISH_VERSIONS.c.datum, DISH_VERSIONS.c.warengruppe, DISH_VERSIONS.c.id)).fetchall()
+    return [__to_dish(row) for row in rows]
+
+
+def get_menu_week_versions(week: Tuple[int, int]) -> List[Tuple[dtm.datetime, List[dish]]]:
+    """
+    Get every version of the menu of the given (iso year, iso week) together with the time it was fetched.
+    """
+
+    start, end = week_dates(week)
+    return [(at, get_menu_at(start, end, at)) for at in get_versions(start, end)]
+
+
+def get_changes(start: dtm.date, end: dtm.date = None) -> List[Tuple[dtm.datetime, List[Change]]]:
+    """
+    Get every change of the menu of the dates between `start` and `end` (inclusive), together with the time the
+    change was fetched. The first version of the menu isn't a change and thus not included.
+    """
+
+    end = end or start
+    with connection() as (conn, execute):
+        rows = execute(DISH_VERSIONS.select().where(__between(start, end)).order_by(
+            DISH_VERSIONS.c.datum, DISH_VERSIONS.c.warengruppe, DISH_VERSIONS.c.id)).fetchall()
+
+    # all versions are built from the same rows, so that only one query is needed
+    changes = []
+    old = None
+    for at in sorted({row.valid_from for row in rows} | {row.valid_to for row in rows if row.valid_to}):
+        new = [__to_dish(row) for row in rows if row.valid_from <= at and (not row.valid_to or row.valid_to > at)]
+        if old is not None:
+            changes.append((at, generate_diff(old, new)))
+        old = new
+    return changes
+
+
+def install_listener():
+    """
+    Record every new version of a menu week that is fetched.
+    """
+
+    from mensabot import mensa
+    mensa.change_listeners.append(record_change)
+
+
+def record_change(week, old, new):
+    try:
+        record_menu_week(week, new)
+    except Exception:
+        logger.error("Could not record new version of week %s in the menu history" % (week,), exc_info=1)
@@ -0,0 +1,253 @@
+import collections
+import datetime as dtm
+import functools
+import itertools
+import logging
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import regex as re
+
+from mensabot.mensa import REGEX_MENU_WEEK_FILE, menu_week_of, read_menu_csv
+from mensabot.mensa_menu import dish, generate_diff
+
+logger = logging.getLogger("mensabot.importer")
+
+READ_CHUNK_SIZE = 64 * 1024
+PENDING_PER_WORKER = 8  # how many versions may be parsed ahead of the one being stored, per worker process
+REGEX_OLD_MENU_WEEK_FILE = re.compile("[0-9]{1,2}\\.csv")  # <week>.csv, as named by the stwno website
+
+
+class version(NamedTuple):
+    week: Optional[Tuple[int, int]]  # None for the old <week>.csv files, the week is then taken from their content
+    at: dtm.datetime
+    source: str  # the path of the csv file or the git object name "<commit>:<file>"
+
+
+def week_of_file(file: str) -> Tuple[bool, Optional[Tuple[int, int]]]:
+    """
+    Check whether `file` is the csv file of a week, either named YYYY-Www.csv or <week>.csv.
+
+    :return: whether the file is a week and the (iso year, iso week) if the name contains it
+    """
+
+    file = os.path.basename(file)
+    match = REGEX_MENU_WEEK_FILE.fullmatch(file)
+    if match:
+        return True, (int(match.group(1)), int(match.group(2)))
+    return bool(REGEX_OLD_MENU_WEEK_FILE.fullmatch(file)), None
+
+
+def __sort_key(v: version):
+    # the versions of one file follow each other, so that the versions of a week stay in order
+    return v.week or (0, 0), os.path.basename(v.source.split(":", 1)[-1]), v.at
+
+
+class ImportStats(object):
+    """
+    Counts of what was imported and how fast it was.
+    """
+
+    def __init__(self):
+        self.weeks = set()
+        self.versions = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.failed = 0
+        self.rows = 0
+        self.changes = 0
+        self.stored = 0
+        self.start = time.perf_counter()
+
+    def __str__(self):
+        elapsed = time.perf_counter() - self.start
+        return "%d versions of %d weeks (%d unchanged, %d skipped, %d failed), %d rows with %d changes, " \
+               "%d dish versions stored in %.2fs: %.0f rows/s" % (
+                   self.versions, len(self.weeks), self.unchanged, self.skipped, self.failed, self.rows,
+                   self.changes, self.stored, elapsed, self.rows / elapsed if elapsed else 0)
+
+
+def store_versions(store: str) -> List[version]:
+    """
+    Find the csv files of all weeks in the directory `store`, each of them being the only version of its week.
+    """
+
+    versions = []
+    for file in os.listdir(store):
+        is_week, week = week_of_file(file)
+        if is_week:
+            path = os.path.join(store, file)
+            versions.append(version(week, dtm.datetime.fromtimestamp(os.path.getmtime(path)), path))
+    return sorted(versions, key=__sort_key)
+
+
+def git_versions(store: str) -> List[version]:
+    """
+    Find every version of the csv files of all weeks ever committed to the git repository `store`.
+    """
+
+    log = subprocess.run(["git", "log", "--reverse", "--diff-filter=AM", "--name-only", "--format=%x00%H %ct"],
+                         cwd=store, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    versions = []
+    for entry in log.split("\0")[1:]:
+        header, *files = entry.strip().splitlines()
+        commit, timestamp = header.split()
+        for file in files:
+            is_week, week = week_of_file(file)
+            if is_week:
+                versions.append(version(week, dtm.datetime.fromtimestamp(int(timestamp)), "%s:%s" % (commit, file)))
+    return sorted(versions, key=__sort_key)
+
+
+def git_blobs(store: str, versions: Iterable[version], batch: int = 256) -> Iterator[Tuple[version, bytes]]:
+    """
+    Read the content of the given versions from the git repository `store`, using one git process per `batch`
+    versions. The process has already exited when the versions are yielded, so that the worker processes forked
+    meanwhile don't inherit its pipes.
+    """
+
+    versions = iter(versions)
+    while True:
+        chunk = list(itertools.islice(versions, batch))
+        if not chunk:
+            return
+        out = subprocess.run(["git", "cat-file", "--batch"], cwd=store, check=True, stdout=subprocess.PIPE,
+                             input="".join(v.source + "\n" for v in chunk).encode("utf-8")).stdout
+        pos = 0
+        for v in chunk:
+            end = out.index(b"\n", pos)
+            header = out[pos:end].split()
+            if header[-1] == b"missing":
+                raise ValueError("%s is missing from the git repository %s" % (v.source, store))
+            pos = end + 1 + int(header[2])
+            yield v, out[end + 1:pos]
+            pos += 1  # the newline after the content
+
+
+def parse_version(source: Union[str, bytes]) -> Tuple[Optional[List[dish]], Optional[str]]:
+    """
+    Parse one version of a week, either read from the file with the path `source` or the raw content of the file.
+    Runs in the worker processes.
+
+    :return: the menu or the error that prevented parsing it
+    """
+
+    try:
+        if isinstance(source, bytes):
+            return list(read_menu_csv([source])), None
+        with open(source, "rb") as f:
+            return list(read_menu_csv(iter(functools.partial(f.read, READ_CHUNK_SIZE), b""))), None
+    except Exception as e:
+        return None, "%s: %s" % (type(e).__name__, e)
+
+
+def parse_versions(executor: ProcessPoolExecutor, sources: Iterable[Tuple[version, Union[str, bytes]]],
+                   pending: int) -> Iterator[Tuple[version, Tuple[Optional[List[dish]], Optional[str]]]]:
+    """
+    Parse the `sources` in the worker processes of `executor` and yield the results in the same order.
+    At most `pending` versions are parsed ahead, so that not all of the history needs to be held in memory.
+    """
+
+    queue = collections.deque()
+    for v, source in sources:
+        queue.append((v, executor.submit(parse_version, source)))
+        if len(queue) >= pending:
+            v, future = queue.popleft()
+            yield v, future.result()
+    while queue:
+        v, future = queue.popleft()
+        yield v, future.result()
+
+
+def import_versions(sources: Iterable[Tuple[version, Union[str, bytes]]], workers: int = None, replace=False,
+                    dry_run=False) -> ImportStats:
+    """
+    Parse all versions of the weeks and store them in the menu history.
+    Versions that don't change the menu of their week are only counted.
+
+    :param sources: each version together with the content or the path of its csv file, the versions of each week
+                    sorted by time
+    :param replace: remove the versions of the imported weeks already in the history instead of only adding newer ones
+    :param dry_run: only parse and diff the versions, but don't store them
+    """
+
+    from mensabot import history
+
+    stats = ImportStats()
+    workers = workers or os.cpu_count()
+    olds = {}  # week -> the last version of its menu
+    latest = {}  # week -> the time of the newest version in the history
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for v, (menu, error) in parse_versions(executor, sources, workers * PENDING_PER_WORKER):
+            stats.versions += 1
+            if error:
+                logger.warning("Could not parse %s: %s" % (v.source, error))
+                stats.failed += 1
+                continue
+            stats.rows += len(menu)
+            week = menu_week_of(menu[0].datum) if menu else v.week
+            if not week or v.week and week != v.week:
+                logger.debug("%s contains the menu of week %s" % (v.source, week))
+                stats.skipped += 1
+                continue
+
+            stats.weeks.add(week)
+            if week not in latest:
+                latest[week] = None
+                if replace and not dry_run:
+                    history.delete_menu_week(week)
+                elif not dry_run:
+                    latest[week] = (history.get_versions(*history.week_dates(week)) or [None])[-1]
+
+            old = olds.get(week)
+            if old is not None:
+                diff = generate_diff(old, menu)
+                if not diff:
+                    stats.unchanged += 1
+                    continue
+                stats.changes += len(diff)
+            olds[week] = menu
+
+            if latest[week] and v.at <= latest[week]:
+                stats.skipped += 1
+            elif not dry_run:
+                stats.stored += history.record_menu_week(week, menu, v.at)
+                latest[week] = v.at
+    return stats
+
+
+def main():
+    import argparse
+
+    from mensabot.config_default import MENU_STORE
+
+    parser = argparse.ArgumentParser(
+        description='Import the menus of all weeks in a menustore directory or its git history into the menu history.')
+    parser.add_argument('store', nargs='?', default=MENU_STORE,
+                        help='the menustore directory, %s by default' % MENU_STORE)
+    parser.add_argument('--git', action='store_true',
+                        help='import every version committed to the git repository of the store, not only the current')
+    parser.add_argument('--replace', action='store_true',
+                        help='replace the history of the imported weeks instead of only adding newer versions')
+    parser.add_argument('--dry-run', action='store_true', help='only parse and diff the weeks, but store nothing')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='the number of parsing processes')
+    args = parser.parse_args()
+
+    if args.git:
+        versions = git_versions(args.store)
+        sources = git_blobs(args.store, versions)
+    else:
+        versions = store_versions(args.store)
+        sources = ((v, v.source) for v in versions)
+
+    if not args.dry_run:
+        from mensabot.db import migrate
+        migrate()
+    print(import_versions(sources, args.workers, args.replace, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,35 @@
+import bisect
+import codecs
 import csv
 import datetime as dtm
 import functools
+import hashlib
+import json
 import logging
 import os
+import pickle
+import threading
+import time
 import warnings
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pprint import pformat
-from typing import Dict, List, NamedTuple, Tuple
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import regex as re
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
 from dateutil.easter import easter
 from dateutil.relativedelta import TH, TU, relativedelta
 
-from mensabot.bot.util import ensure_date
-from mensabot.config_default import MENU_STORE
-from mensabot.mensa_menu import dish, parse_dish
+from mensabot.config_default import HTML_PARSER, MENU_CACHE_MAX_STALE, MENU_CACHE_TTL, MENU_PREFETCH_WEEKS, \
+    MENU_STORE, SCRAPE_CACHE_REFRESH, SCRAPE_CACHE_TTL, SCRAPE_STORE, WARM_UP_WORKERS
+from mensabot.mensa_menu import MENU_TYPES, PRICES_CATEGORIES, dish, parse_dish
 
 logger = logging.getLogger("mensabot.mensa")
 
 MENU_URL = "http://www.stwno.de/infomax/daten-extern/csv/UNI-P/"
-MENU_TYPES = ["S", "H", "B", "N"]
 
 LOCATIONS = {
     "audimax": "cafeterien/cafeteria-uni-pa-audimax",
@@ -30,54 +38,383 @@ LOCATIONS = {
     "wiwi": "cafeterien/cafebar-uni-pa-wiwi",
     "mensaessen": "mensen/mensa-uni-passau"
 }
-PRICES_CATEGORIES = ["stud", "bed", "gast"]
+SNAPSHOT_VERSION = 1  # increment when the pickled representation of dish changes
 
-cache = {}
+cache = {}  # (iso year, iso week) -> (time fetched, list of dishes)
 change_listeners = []
+HTTP = requests.Session()  # shared by all threads, so that connections to the same host are reused
 
+pending_fetches = {}  # week -> Future of the currently running fetch
+pending_fetches_lock = threading.Lock()
+REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=MENU_PREFETCH_WEEKS + 1, thread_name_prefix="menu-refresh")
+REGEX_MENU_WEEK_FILE = re.compile("([0-9]{4})-W([0-9]{2})\\.csv")
+REGEX_MENU_ROW_START = re.compile("[0-9]{2}\\.[0-9]{2}\\.[0-9]{4};")
+REGEX_ZUSATZ_SEMICOLON = re.compile("\\([A-Z0-9,; ]*;[A-Z0-9,; ]*\\)")
+MENU_ENCODING = "iso8859_3"
 
-def get_menu_week(week: int, disable_cache=False) -> List[dish]:
+
+def ensure_date(dt):
+    if isinstance(dt, dtm.datetime):
+        return dt.date()
+    elif isinstance(dt, dtm.date):
+        return dt
+    else:
+        raise ValueError("'%s' can't be converted to a date" % dt)
+
+
+def menu_week_of(dt: dtm.date) -> Tuple[int, int]:
+    """
+    Get the (iso year, iso week) tuple used as key for the menu of the week containing the given date(-time).
+    """
+
+    year, week, _ = ensure_date(dt).isocalendar()
+    return year, week
+
+
+def get_menu_week(week: Tuple[int, int], disable_cache=False) -> List[dish]:
     """
     Get all dishes for a certain week from the stwno website.
+    Outdated menus are still returned for up to MENU_CACHE_MAX_STALE seconds while they are refreshed in background.
 
-    :param week: the iso number of the week
+    :param week: the iso year and iso number of the week, see `menu_week_of`
+    :param disable_cache: always wait for a fresh copy of the menu
     :return: a list of dishes
     """
 
     if week in cache and not disable_cache:
         dt, list = cache[week]
-        if dtm.datetime.now() - dt < dtm.timedelta(minutes=5):  # TODO make this configurable
+        age = (dtm.datetime.now() - dt).total_seconds()
+        if age < MENU_CACHE_TTL:
+            return list
+        elif age < MENU_CACHE_MAX_STALE:
+            refresh_menu_week(week, background=True)
             return list
-    list = fetch_menu_week(week)
-    cache[week] = (dtm.datetime.now(), list)
-    return list
+    return refresh_menu_week(week).result()
+
 
+def refresh_menu_week(week: Tuple[int, int], background=False) -> Future:
+    """
+    Fetch the menu of a week and store it in the cache. If the week is already being fetched, no new request is made
+    and the Future of the running fetch is returned instead.
+
+    :param background: fetch using the REFRESH_EXECUTOR instead of the calling thread
+    """
 
-def fetch_menu_week(week: int) -> List[dish]:
-    r = requests.get("%s%s.csv" % (MENU_URL, week))
+    with pending_fetches_lock:
+        future = pending_fetches.get(week)
+        if future:
+            return future
+        future = pending_fetches[week] = Future()
+
+    if background:
+        future.add_done_callback(functools.partial(__log_failed_refresh, week))
+        REFRESH_EXECUTOR.submit(__run_fetch, week, future)
+    else:
+        __run_fetch(week, future)
+    return future
+
+
+def __log_failed_refresh(week, future):
+    e = future.exception()
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code == 404:
+        logger.debug("Menu for week %s is not published yet" % (week,))
+    elif e:
+        logger.warning("Could not refresh menu for week %s in background" % (week,), exc_info=e)
+
+
+def prefetch_menu_weeks(dt: dtm.date = None, weeks: int = MENU_PREFETCH_WEEKS) -> List[Future]:
+    """
+    Concurrently fetch the menus of the week containing `dt` and the `weeks` following weeks, so that looking ahead
+    can be answered from the cache. Weeks that are cached and still fresh are skipped.
+
+    :return: the Futures of the started fetches
+    """
+
+    dt = ensure_date(dt or dtm.date.today())
+    now = dtm.datetime.now()
+    futures = []
+    for i in range(weeks + 1):
+        week = menu_week_of(dt + dtm.timedelta(weeks=i))
+        if week in cache and (now - cache[week][0]).total_seconds() < MENU_CACHE_TTL:
+            continue
+        futures.append(refresh_menu_week(week, background=True))
+    return futures
+
+
+def __run_fetch(week, future):
+    try:
+        list = fetch_menu_week(week)
+        cache[week] = (dtm.datetime.now(), list)
+        future.set_result(list)
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with pending_fetches_lock:
+            del pending_fetches[week]
+
+
+def fetch_menu_week(week: Tuple[int, int]) -> List[dish]:
+    headers = menu_week_request_headers(week)
+    first, fallback = menu_week_urls(week)
+    r = HTTP.get(first, headers=headers)
     if not r.ok:
-        r = requests.get("%s%02s.csv" % (MENU_URL, week))
+        r = HTTP.get(fallback, headers=headers)
     r.raise_for_status()
-    text = r.text
-    # fix ; appearing in Zusatz, e.g. (2,3,8,G,I,A;AA)
-    text = re.sub("\([A-Z0-9,; ]+\)", lambda m: m.group().replace(";", ","), text)
+    if r.status_code == 304:
+        return unchanged_menu_week(week)
+    return update_menu_week(week, r.text, r.headers)
 
-    # Fix stray newlines. If a line does not start with a valid date, is it
-    # probably actually part of the previous line.
-    text = re.sub("\n(?![0-9]{2}\.[0-9]{2}\.[0-9]{4};)", " ", text)
 
-    os.makedirs(MENU_STORE, exist_ok=True)
-    with open("%s/%s.csv" % (MENU_STORE, week), "a+", encoding="iso8859_3") as f:
-        f.seek(0)
-        old = [parse_dish(row) for row in csv.DictReader(f.readlines(), delimiter=';') if row['datum'].strip()]
-        new = [parse_dish(row) for row in csv.DictReader(text.splitlines(), delimiter=';') if row['datum'].strip()]
+def menu_week_urls(week: Tuple[int, int]) -> Tuple[str, str]:
+    # the stwno website only knows the week number and always serves the upcoming week with that number
+    return "%s%s.csv" % (MENU_URL, week[1]), "%s%02d.csv" % (MENU_URL, week[1])
+
+
+def menu_week_file(week: Tuple[int, int], ext="csv") -> str:
+    return "%04d-W%02d.%s" % (week[0], week[1], ext)
+
+
+def menu_week_path(week: Tuple[int, int], ext="csv") -> str:
+    return "%s/%s" % (MENU_STORE, menu_week_file(week, ext))
+
+
+def load_menu_meta(week: Tuple[int, int]) -> dict:
+    """
+    Load the ETag, Last-Modified header and content hash that were stored together with the csv file of a week.
+    """
+
+    try:
+        with open(menu_week_path(week, "json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_menu_meta(week: Tuple[int, int], meta: dict):
+    path = menu_week_path(week, "json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+
+
+def menu_week_request_headers(week: Tuple[int, int]) -> Dict[str, str]:
+    """
+    Get the headers for a conditional request that only downloads the csv file of a week if it changed.
+    """
+
+    if not os.path.isfile(menu_week_path(week)):
+        return {}
+    meta = load_menu_meta(week)
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def unchanged_menu_week(week: Tuple[int, int]) -> List[dish]:
+    """
+    Get the menu of a week whose csv file did not change since it was last stored.
+    """
+
+    if week in cache:
+        return cache[week][1]
+    return load_menu_week(week)
+
+
+def load_menu_week(week: Tuple[int, int]) -> List[dish]:
+    """
+    Load the stored menu of a week, using the parsed snapshot instead of the csv file if it is still up to date.
+    """
+
+    return __load_menu_week(week)[1]
+
+
+def __load_menu_week(week: Tuple[int, int]) -> Tuple[Optional[str], List[dish]]:
+    try:
+        with open(menu_week_path(week), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, []
+
+    digest = hashlib.sha1(data).hexdigest()
+    snapshot = load_menu_snapshot(week)
+    if snapshot and snapshot["hash"] == digest:
+        return digest, snapshot["menu"]
+
+    menu = list(iter_menu_csv(decode_lines([data])))
+    save_menu_snapshot(week, digest, menu)
+    return digest, menu
+
+
+def parse_menu_csv(text: str) -> List[dish]:
+    return list(iter_menu_csv(text.split("\n")))
+
+
+def iter_menu_csv(lines: Iterable[str]) -> Iterator[dish]:
+    """
+    Parse the lines of an already repaired csv file one after another.
+    """
+
+    rows = csv.DictReader((l for line in lines for l in line.splitlines()), delimiter=';')
+    return (parse_dish(row) for row in rows if row['datum'].strip())
+
+
+def read_menu_csv(chunks: Iterable[bytes], encoding: str = MENU_ENCODING) -> Iterator[dish]:
+    """
+    Decode, repair and parse a csv file from the stwno website while it is being read, without keeping all of it
+    in memory.
+
+    :param chunks: the raw content of the file, e.g. from `iter(functools.partial(f.read, 65536), b"")`
+    """
+
+    return iter_menu_csv(repair_menu_lines(decode_lines(chunks, encoding)))
+
+
+def decode_lines(chunks: Iterable[bytes], encoding: str = MENU_ENCODING) -> Iterator[str]:
+    """
+    Incrementally decode `chunks` and split the text at each newline, like `data.decode(encoding).split("\\n")`.
+    """
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+    rest = ""
+    for chunk in chunks:
+        lines = (rest + decoder.decode(chunk)).split("\n")
+        rest = lines.pop()
+        yield from lines
+    yield rest + decoder.decode(b"", final=True)
+
+
+def load_menu_snapshot(week: Tuple[int, int]) -> Optional[dict]:
+    """
+    Load the parsed menu of a week together with the hash of the csv file it was parsed from.
+    Returns None if there is no snapshot or it can't be used, e.g. because it was written by an older version.
+    """
+
+    try:
+        with open(menu_week_path(week, "pickle"), "rb") as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("Could not load menu snapshot for week %s" % (week,), exc_info=True)
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def save_menu_snapshot(week: Tuple[int, int], digest: str, menu: List[dish]):
+    path = menu_week_path(week, "pickle")
+    try:
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump({"version": SNAPSHOT_VERSION, "hash": digest, "menu": menu}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        logger.warning("Could not save menu snapshot for week %s" % (week,), exc_info=True)
+
+
+def warm_menu_cache() -> int:
+    """
+    Fill the cache with the stored menus of the current and following years, so that they can be served right after
+    a restart without waiting for the network. The menus count as outdated and are refreshed in background when
+    first used.
+
+    :return: the number of weeks loaded
+    """
+
+    year = dtm.date.today().isocalendar()[0]
+    fetched = dtm.datetime.now() - dtm.timedelta(seconds=MENU_CACHE_TTL)
+    count = 0
+    for file in (os.listdir(MENU_STORE) if os.path.isdir(MENU_STORE) else []):
+        match = REGEX_MENU_WEEK_FILE.fullmatch(file)
+        if not match or int(match.group(1)) < year:
+            continue
+        week = (int(match.group(1)), int(match.group(2)))
+        menu = load_menu_week(week)
+        if menu:
+            cache.setdefault(week, (fetched, menu))
+            count += 1
+    return count
+
+
+def repair_menu_csv(text: str) -> str:
+    """
+    Fix the formatting errors commonly found in the csv files from the stwno website.
+    """
+
+    return "\n".join(repair_menu_lines(text.split("\n")))
+
+
+def repair_menu_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Fix the formatting errors commonly found in the csv files from the stwno website, one line at a time.
+
+    :param lines: the lines of the file without their trailing newline
+    :return: the repaired lines, each holding exactly one row
+    """
+
+    row = None
+    for line in lines:
+        # fix ; appearing in Zusatz, e.g. (2,3,8,G,I,A;AA)
+        if "(" in line:
+            line = REGEX_ZUSATZ_SEMICOLON.sub(lambda m: m.group().replace(";", ","), line)
+
+        # Fix stray newlines. If a line does not start with a valid date, is it
+        # probably actually part of the previous line.
+        if row is None:
+            row = [line]
+        elif line[10:11] == ";" and REGEX_MENU_ROW_START.match(line):
+            yield " ".join(row)
+            row = [line]
+        else:
+            row.append(line)
+    if row is not None:
+        yield " ".join(row)
+
+
+def update_menu_week(week: Tuple[int, int], text: str, headers=None) -> List[dish]:
+    """
+    Parse the downloaded csv file of a week and store it in the MENU_STORE, notifying the change_listeners if the
+    menu changed.
 
-        if old == new:
-            return old
+    :param headers: the headers of the response, used for making the next request conditional
+    """
 
-        f.seek(0)
-        f.truncate(0)
-        f.writelines(text)
+    headers = headers or {}
+    meta = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "hash": hashlib.sha1(text.encode("utf-8")).hexdigest()
+    }
+    os.makedirs(MENU_STORE, exist_ok=True)
+    if meta["hash"] == load_menu_meta(week).get("hash") and os.path.isfile(menu_week_path(week)):
+        save_menu_meta(week, meta)
+        return unchanged_menu_week(week)
+
+    lines = list(repair_menu_lines(text.split("\n")))
+    data = "\n".join(lines).encode(MENU_ENCODING)
+    digest = hashlib.sha1(data).hexdigest()
+    stored, old = __load_menu_week(week)
+    if stored == digest:
+        save_menu_meta(week, meta)
+        return old
+
+    new = list(iter_menu_csv(lines))
+    if new and menu_week_of(new[0].datum) != week:
+        logger.debug("Menu for week %s is not available, got the one for week %s" % (week, menu_week_of(new[0].datum)))
+        return []
+    if old == new:
+        save_menu_meta(week, meta)
+        return old
+
+    path = menu_week_path(week)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    save_menu_snapshot(week, digest, new)
+    save_menu_meta(week, meta)
 
     logger.debug("Menu changed!")
     for l in change_listeners:
@@ -93,19 +430,160 @@ def get_menu_day(dt: dtm.date = None) -> List[dish]:
     :return: a list of dishes
     """
     dt = ensure_date(dt or dtm.date.today())
-    menu = [d for d in get_menu_week(dt.isocalendar()[1]) if d.datum == dt]
+    menu = [d for d in get_menu_week(menu_week_of(dt)) if d.datum == dt]
     menu = sorted(menu, key=lambda d: (MENU_TYPES.index(d.warengruppe[0]), d.warengruppe))
     menu = reversed(OrderedDict((dish.name, dish) for dish in reversed(menu)).values())
     return list(menu)
 
 
+def parse_html(html: str, parse_only: SoupStrainer = None, features: str = None) -> BeautifulSoup:
+    """
+    Parse a scraped page, using the C-accelerated lxml parser if it is installed.
+
+    :param parse_only: only build the tree for the elements matching this strainer
+    :param features: the parser to use instead of HTML_PARSER
+    """
+
+    features = features or HTML_PARSER or ("lxml" if builder_registry.lookup("lxml") else "html.parser")
+    return BeautifulSoup(html, features, parse_only=parse_only)
+
+
 OPENING_URL = "https://stwno.de/de/gastronomie/"
+OPENING_STRAINER = SoupStrainer(["h3", "table"])
 OPENING_DAYS = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
 OPENING_TIMEFRAME_HOLIDAY = {"vorlesungszeit": False, "vorlesungsfreie zeit": True}
 NOT_OPEN = (dtm.time(0, 0),) * 2
 
 
-@functools.lru_cache(maxsize=16)
+memo_info = NamedTuple("memo_info", [("hits", int), ("misses", int), ("currsize", int)])
+
+
+def memoize(refresh_after: float = None, ttl: float = None, persist: str = None):
+    """
+    Cache the results of the decorated function like `functools.lru_cache` does, but additionally allow storing results
+    that were fetched elsewhere (e.g. by the asyncio mode) via `func.cache_put(value, *args)`.
+    If fetching a new result fails, the last known result is returned instead.
+
+    :param refresh_after: seconds after which a result is still returned, but fetched again in background
+    :param ttl: seconds after which a result has to be fetched again before it is returned
+    :param persist: name of the file in SCRAPE_STORE that keeps the results across restarts, loaded by `cache_load()`
+    """
+
+    def decorator(func):
+        results = {}  # args -> (time fetched, value)
+        stats = {"hits": 0, "misses": 0}
+        refreshing = set()
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            entry = results.get(args)
+            if entry:
+                age = time.time() - entry[0]
+                if ttl is None or age < ttl:
+                    stats["hits"] += 1
+                    if refresh_after is not None and age >= refresh_after:
+                        cache_refresh(*args)
+                    return entry[1]
+            stats["misses"] += 1
+            return fetch(args, entry)
+
+        def fetch(args, entry=None):
+            try:
+                value = func(*args)
+            except Exception:
+                if not entry:
+                    raise
+                logger.warning("Could not refresh {}{}, using the result from {}".format(
+                    func.__name__, args, dtm.datetime.fromtimestamp(entry[0])), exc_info=True)
+                return entry[1]
+            cache_put(value, *args)
+            return value
+
+        def cache_refresh(*args):
+            """
+            Fetch a new result in background, returning the old one until it is available.
+            """
+
+            with lock:
+                if args in refreshing:
+                    return
+                refreshing.add(args)
+
+            def run():
+                try:
+                    fetch(args, results.get(args))
+                except Exception:
+                    logger.warning("Could not refresh {}{} in background".format(func.__name__, args), exc_info=True)
+                finally:
+                    with lock:
+                        refreshing.discard(args)
+
+            REFRESH_EXECUTOR.submit(run)
+
+        def cache_put(value, *args):
+            results[args] = (time.time(), value)
+            if persist:
+                cache_save()
+
+        def cache_save():
+            path = os.path.join(SCRAPE_STORE, persist + ".pickle")
+            with lock:
+                try:
+                    os.makedirs(SCRAPE_STORE, exist_ok=True)
+                    with open(path + ".tmp", "wb") as f:
+                        pickle.dump(dict(results), f, pickle.HIGHEST_PROTOCOL)
+                    os.replace(path + ".tmp", path)
+                except Exception:  # also results that can't be pickled, they are still cached in memory
+                    logger.warning("Could not save cache of {}".format(func.__name__), exc_info=True)
+
+        def cache_load():
+            """
+            Load the results stored by a previous run, keeping newer results that are already in memory.
+            """
+
+            try:
+                with open(os.path.join(SCRAPE_STORE, persist + ".pickle"), "rb") as f:
+                    stored = pickle.load(f)
+            except FileNotFoundError:
+                return 0
+            except Exception:
+                logger.warning("Could not load cache of {}".format(func.__name__), exc_info=True)
+                return 0
+            for args, entry in stored.items():
+                if args not in results or results[args][0] < entry[0]:
+                    results[args] = entry
+            return len(stored)
+
+        def cache_clear():
+            results.clear()
+            stats.update(hits=0, misses=0)
+
+        wrapper.cache_info = lambda: memo_info(stats["hits"], stats["misses"], len(results))
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_put = cache_put
+        wrapper.cache_refresh = cache_refresh
+        wrapper.cache_keys = lambda: list(results.keys())
+        if persist:
+            wrapper.cache_load = cache_load
+        return wrapper
+
+    return decorator
+
+
+def __mensa_opening_times():
+    dates = {(t, d): NOT_OPEN for d in range(7) for t in [True, False]}
+    for d in range(5):
+        dates[(True, d)] = dates[(False, d)] = (dtm.time(11, 00), dtm.time(14, 15))
+    return dates
+
+
+# This is a hack to keep the /mensa command working even though the opening times cannot be determined reliably.
+# TODO: Find a new reliable source for mensa opening times.
+FIXED_OPENING_TIMES = {"mensen/mensa-uni-passau": __mensa_opening_times()}
+
+
+@memoize(SCRAPE_CACHE_REFRESH, SCRAPE_CACHE_TTL, persist="opening_times")
 def get_opening_times(loc: str) -> Dict[Tuple[bool, int], Tuple[dtm.time, dtm.time]]:
     """
     Return the opening times for a certain location.
@@ -114,17 +592,16 @@ def get_opening_times(loc: str) -> Dict[Tuple[bool, int], Tuple[dtm.time, dtm.ti
     :return: a dict, mapping from the tuple (is during holidays, iso week day) to (opening time, closing time)
     """
 
-    # This is a hack to keep the /mensa command working even though the opening times cannot be determined reliably.
-    # TODO: Find a new reliable source for mensa opening times.
-    if loc == "mensen/mensa-uni-passau":
-      dates = {(t, d): NOT_OPEN for d in range(7) for t in [True, False]}
-      for d in range(5):
-        dates[(True, d)] = dates[(False, d)] = (dtm.time(11, 00), dtm.time(14, 15))
-      return dates
+    if loc in FIXED_OPENING_TIMES:
+        return FIXED_OPENING_TIMES[loc]
 
-    r = requests.get(OPENING_URL + loc)
+    r = HTTP.get(OPENING_URL + loc)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, 'html.parser')
+    return parse_opening_times(r.text)
+
+
+def parse_opening_times(html: str, features: str = None) -> Dict[Tuple[bool, int], Tuple[dtm.time, dtm.time]]:
+    soup = parse_html(html, OPENING_STRAINER, features)
     table = soup.find("h3", string=re.compile("^Öffnungszeiten")).find_next_sibling("table")
 
     dates = {(t, d): NOT_OPEN for d in range(7) for t in [True, False]}
@@ -174,6 +651,64 @@ def get_opening_times(loc: str) -> Dict[Tuple[bool, int], Tuple[dtm.time, dtm.ti
 
 
 open_info = NamedTuple("open_info", [("open", dtm.time), ("close", dtm.time), ("day", dtm.datetime), ("offset", int)])
+opening_calendar = NamedTuple("opening_calendar", [
+    ("opening_times", dict), ("semester_dates", list),  # the cached values the calendar was built from
+    ("first", dtm.date), ("times", List[Tuple[dtm.time, dtm.time]]), ("open_days", List[dtm.date])
+])
+
+OPENING_CALENDAR_LOOKAHEAD = 7  # days after the end of the last known semester that are included in the calendar
+opening_calendars = {}
+
+
+def get_opening_calendar(loc: str) -> opening_calendar:
+    """
+    Get the opening times of a location for every day of the known semesters, which is rebuilt whenever the cached
+    opening times or semester dates change.
+    """
+
+    times, semesters = get_opening_times(loc), get_semester_dates()
+    calendar = opening_calendars.get(loc)
+    if not calendar or calendar.opening_times is not times or calendar.semester_dates is not semesters:
+        calendar = opening_calendars[loc] = build_opening_calendar(times, semesters)
+    return calendar
+
+
+def build_opening_calendar(times: Dict[Tuple[bool, int], Tuple[dtm.time, dtm.time]], semesters: List["semester"]) \
+        -> opening_calendar:
+    if not semesters:
+        return opening_calendar(times, semesters, dtm.date.max, [], [])
+
+    first = semesters[0].start
+    last = max(sem.end for sem in semesters) + dtm.timedelta(days=OPENING_CALENDAR_LOOKAHEAD)
+    day_times = __opening_times_range(times, first, last)
+    open_days = [first + dtm.timedelta(days=i) for i, (open, _) in enumerate(day_times) if open > dtm.time(0, 0)]
+    return opening_calendar(times, semesters, first, day_times, open_days)
+
+
+def __opening_times_range(times, start, end):
+    return [times[(holiday, (start.weekday() + i) % 7)] for i, holiday in enumerate(is_holiday_range(start, end))]
+
+
+def get_opening_times_on(day: dtm.date, loc: str) -> Tuple[dtm.time, dtm.time]:
+    """
+    Get the (opening time, closing time) of a location on a certain day.
+    """
+
+    return get_opening_times_range(day, day, loc)[0]
+
+
+def get_opening_times_range(start: dtm.date, end: dtm.date, loc: str) -> List[Tuple[dtm.time, dtm.time]]:
+    """
+    Get the (opening time, closing time) of a location for every date from `start` up to and including `end`.
+    """
+
+    start, end = ensure_date(start), ensure_date(end)
+    calendar = get_opening_calendar(loc)
+    first, last = (start - calendar.first).days, (end - calendar.first).days
+    if 0 <= first and last < len(calendar.times):
+        return calendar.times[first:last + 1]
+    # outside of the known semesters, is_holiday_range will complain if it can't tell
+    return __opening_times_range(calendar.opening_times, start, end)
 
 
 def get_next_open(dt: dtm.datetime, loc: str) -> open_info:
@@ -184,19 +719,22 @@ def get_next_open(dt: dtm.datetime, loc: str) -> open_info:
         If the location is not open in the foreseeable future, None is returned.
     """
 
-    times = get_opening_times(loc)
-    days = [(i, dt + dtm.timedelta(days=i)) for i in range(6)]
-    for open, close, offset, day in (times[(is_holiday(d), d.isoweekday() - 1)] + (i, d) for i, d in days):
-        # print("{} {:%a %Y-%m-%d} {:%H:%M} {:%H:%M}".format(offset, day, open, close))
-        if offset == 0:
-            if dt.time() < close:
-                return open_info(open, close, day, offset)  # still open today
-            else:
-                pass  # closed for today, search for the next open date
-        elif open > dtm.time(0, 0):
-            return open_info(open, close, day, offset)  # found next open day
-        else:
-            pass  # continue searching for the next open date
+    date = dt.date()
+    open, close = get_opening_times_on(date, loc)
+    if dt.time() < close:
+        return open_info(open, close, dt, 0)  # still open today
+
+    # closed for today, search for the next open date within the next 5 days
+    calendar = get_opening_calendar(loc)
+    if calendar.first <= date and (date - calendar.first).days + 5 < len(calendar.times):
+        idx = bisect.bisect_right(calendar.open_days, date)
+        offset = (calendar.open_days[idx] - date).days if idx < len(calendar.open_days) else None
+    else:
+        lookahead = get_opening_times_range(date + dtm.timedelta(days=1), date + dtm.timedelta(days=5), loc)
+        offset = next((i + 1 for i, (open, _) in enumerate(lookahead) if open > dtm.time(0, 0)), None)
+    if offset is not None and offset <= 5:
+        open, close = get_opening_times_on(date + dtm.timedelta(days=offset), loc)
+        return open_info(open, close, dt + dtm.timedelta(days=offset), offset)  # found next open day
 
     # FIXME this might happen in the vorlesungsfreie zeit
     raise AssertionError("Mensa '%s' not open in the foreseeable future after %s" % (loc, dt))
@@ -219,28 +757,99 @@ def get_next_mensa_open(dt: dtm.datetime = None, loc: str = "mensen/mensa-uni-pa
 
 
 DATES_URL = "https://www.uni-passau.de/termine-fristen/vorlesungszeiten/"
+DATES_STRAINER = SoupStrainer("div", class_="upa_main_content")
 semester = NamedTuple("semester", [("name", str), ("is_winter", bool), ("start", dtm.date), ("end", dtm.date),
                                    ("holidays", List[Tuple[dtm.date, dtm.date]])])
 
 
+holiday_index = NamedTuple("holiday_index", [
+    ("semester_dates", list),  # the cached value the index was built from
+    ("bounds", List[dtm.date]), ("holidays", List[bool])  # holidays[i] holds from bounds[i] until bounds[i + 1]
+])
+holiday_index_cache = None
+
+
 def is_holiday(dt: dtm.datetime = None) -> bool:
     """
     Check whether a certain date is during the holidays, the so called "vorlesungsfreie Zeit".
     """
 
     dt = dt.date() or dtm.date.today()
-    semester_dates = get_semester_dates()
-    current_semester = next((sem for sem in reversed(semester_dates) if sem.start <= dt), None)
-    assert current_semester, "Could not find semester for date %s, available semesters are:\n%s" \
-                             % (dt, pformat(semester_dates))
-    return current_semester.end < dt or any(start <= dt <= end for start, end in current_semester.holidays)
+    index = get_holiday_index()
+    return index.holidays[__find_holiday_interval(index, dt)]
+
+
+def is_holiday_range(start: dtm.date, end: dtm.date) -> List[bool]:
+    """
+    Check for every date from `start` up to and including `end` whether it is during the holidays.
+    """
+
+    index = get_holiday_index()
+    start, end = ensure_date(start), ensure_date(end)
+    i = __find_holiday_interval(index, start)
+    mask = []
+    day = start
+    while day <= end:
+        until = index.bounds[i + 1] if i + 1 < len(index.bounds) else end + dtm.timedelta(days=1)
+        days = (min(until, end + dtm.timedelta(days=1)) - day).days
+        mask += [index.holidays[i]] * days
+        day += dtm.timedelta(days=days)
+        i += 1
+    return mask
+
+
+def __find_holiday_interval(index: holiday_index, day: dtm.date) -> int:
+    i = bisect.bisect_right(index.bounds, day) - 1
+    assert i >= 0, "Could not find semester for date %s, available semesters are:\n%s" \
+                   % (day, pformat(index.semester_dates))
+    return i
+
+
+def get_holiday_index() -> holiday_index:
+    """
+    Get the holidays of all known semesters as sorted list of intervals, which is rebuilt whenever the cached semester
+    dates change.
+    """
+
+    global holiday_index_cache
+    semesters = get_semester_dates()
+    index = holiday_index_cache
+    if not index or index.semester_dates is not semesters:
+        index = holiday_index_cache = build_holiday_index(semesters)
+    return index
+
+
+def build_holiday_index(semesters: List["semester"]) -> holiday_index:
+    bounds, holidays = [], []
+    for i, sem in enumerate(semesters):
+        # a semester is the current one until the next one starts
+        until = semesters[i + 1].start if i + 1 < len(semesters) else None
+        if until is not None and until <= sem.start:
+            continue
+
+        def is_holiday_in_sem(day):
+            return sem.end < day or any(start <= day <= end for start, end in sem.holidays)
+
+        # the holidays can only change at these dates
+        points = {sem.start}
+        for start, end in [(sem.end + dtm.timedelta(days=1), None)] + sem.holidays:
+            points.add(start)
+            if end is not None and end < dtm.date.max:
+                points.add(end + dtm.timedelta(days=1))
+        for point in sorted(p for p in points if sem.start <= p and (until is None or p < until)):
+            holiday = is_holiday_in_sem(point)
+            if not holidays or holidays[-1] != holiday:
+                bounds.append(point)
+                holidays.append(holiday)
+    return holiday_index(semesters, bounds, holidays)
+
 
 def sanitize_semester_dates_table_heads(strings: List[str]) -> List[str]:
     strings = [x.replace('\xad', '').replace('\t', '').split(' ')[0] for x in strings]
     strings = [x for x in strings if x != '']
     return strings[0:4]
 
-@functools.lru_cache(maxsize=1)
+@memoize(SCRAPE_CACHE_REFRESH, SCRAPE_CACHE_TTL, persist="semester_dates")
 def get_semester_dates() -> List[semester]:
     """
     Get a list of the start and end dates of semesters coming and past, including the ranges of dates which
@@ -248,9 +857,13 @@ def get_semester_dates() -> List[semester]:
     university is closed completely).
     """
 
-    r = requests.get(DATES_URL)
+    r = HTTP.get(DATES_URL)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, 'html.parser')
+    return parse_semester_dates(r.text)
+
+
+def parse_semester_dates(html: str, features: str = None) -> List[semester]:
+    soup = parse_html(html, DATES_STRAINER, features)
     table = soup.find("div", class_="upa_main_content").find("table", class_="contenttable")
     assert sanitize_semester_dates_table_heads(list(table.find("thead").strings)) == ['Semester', 'Beginn', 'Ende',
                                                  'Verfügungstag']
@@ -261,11 +874,11 @@ def get_semester_dates() -> List[semester]:
 
     semesters = []
     for semester_tr in table.find("tbody").find_all("tr") + past_table.find("tbody").find_all("tr"):
-        name, *dates = [s for s in semester_tr.strings if s.strip() != '']
+        name, *dates = [str(s).strip() for s in semester_tr.strings if s.strip() != '']
         try:
             dates = [dtm.datetime.strptime(d.replace('*', ''), "%d.%m.%Y").date() for d in dates]
         except ValueError as e:
-            print(e)
+            logger.warning("Skipping semester %s with invalid dates %s" % (name, dates), exc_info=e)
             continue
         if len(dates) >= 3:
             start, end, bruecke = dates
@@ -292,8 +905,73 @@ def get_semester_dates() -> List[semester]:
     return semesters
 
 
+def load_caches() -> int:
+    """
+    Load the opening times and semester dates scraped by a previous run, so that they don't have to be scraped again.
+
+    :return: the number of results loaded
+    """
+
+    return get_opening_times.cache_load() + get_semester_dates.cache_load()
+
+
+def refresh_caches():
+    """
+    Scrape all cached opening times and semester dates again in background, keeping the old values until then.
+    """
+
+    for func in [get_opening_times, get_semester_dates]:
+        logger.debug("Statistics for cache of {}: {}".format(func.__name__, func.cache_info()))
+        for args in func.cache_keys():
+            func.cache_refresh(*args)
+
+
+def warm_up(workers: int = WARM_UP_WORKERS) -> Dict[str, Future]:
+    """
+    Concurrently fetch the semester dates, the opening times of all LOCATIONS and the menus of the current and the
+    next week, so that the first commands after a restart can be answered from the caches.
+
+    :return: the Futures of the single steps by their name, each resulting in the seconds the step took
+    """
+
+    today = dtm.date.today()
+    steps = [("semester dates", get_semester_dates)]
+    steps += [("opening times of %s" % name, functools.partial(get_opening_times, loc))
+              for name, loc in LOCATIONS.items()]
+    steps += [("menu of %s-W%02d" % week, functools.partial(get_menu_week, week))
+              for week in [menu_week_of(today), menu_week_of(today + dtm.timedelta(weeks=1))]]
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warm-up")
+    futures = {name: executor.submit(__timed, func) for name, func in steps}
+    executor.shutdown(wait=False)
+    return futures
+
+
+def __timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def warm_up_report(futures: Dict[str, Future]) -> str:
+    """
+    Wait for all steps of the warm-up and describe how long each took or why it failed.
+    """
+
+    report = []
+    for name, future in futures.items():
+        if future.exception():
+            report.append("{} failed ({})".format(name, type(future.exception()).__name__))
+        else:
+            report.append("{} {:.2f}s".format(name, future.result()))
+    return ", ".join(report)
+
+
 def clear_caches():
+    global holiday_index_cache
     logger.debug("Clearing caches...")
     for func in [get_opening_times, get_semester_dates]:
         logger.debug("Statistics for cache of {}: {}".format(func.__name__, func.cache_info()))
         func.cache_clear()
+    opening_calendars.clear()
+    holiday_index_cache = None
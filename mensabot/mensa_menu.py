@@ -1,9 +1,11 @@
+import collections
 import datetime as dtm
 import difflib
+import functools
 import itertools
 import re
+import sys
 import warnings
-from collections import Counter
 from typing import List, NamedTuple, Optional
 
 import regex as re
@@ -12,16 +14,73 @@ PATTERN_TAG = "([AH]?[A-Z]|MV|VG|1?[0-9])"
 PATTERN_ZUSATZ = PATTERN_TAG + "(" + PATTERN_TAG + "[,/]\s*)*"
 PATTERN_KENNZ = "\s*[,*]\s*(" + PATTERN_TAG + "(" + PATTERN_TAG + "[,/]\s*)*)$"
 
-dish = NamedTuple("dish", [
-    ("datum", dtm.datetime),
+MENU_TYPES = ["S", "H", "B", "N"]
+PRICES_CATEGORIES = ["stud", "bed", "gast"]
+
+class codeset(frozenset):
+    """
+    An immutable set of Kennzeichnungen or Zusatzstoffe, which iterates in canonical order: numbers first, then letters.
+    So equal sets always render the same, no matter in which order the codes were given.
+    Use `codeset.of` to get the shared instance for some codes instead of creating a new one.
+    """
+
+    __slots__ = ("order",)
+    __interned = {}
+
+    @staticmethod
+    def __key(code: str):
+        return (0, int(code), code) if code.isdigit() else (1, 0, code)
+
+    def __new__(cls, codes=()):
+        order = tuple(sorted({sys.intern(c) for c in codes if c}, key=cls.__key))
+        self = super().__new__(cls, order)
+        self.order = order
+        return self
+
+    @classmethod
+    def of(cls, codes) -> "codeset":
+        codes = tuple(codes)
+        try:
+            return cls.__interned[codes]
+        except KeyError:
+            return cls.__interned.setdefault(codes, cls(codes))
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __reduce__(self):
+        return codeset.of, (self.order,)
+
+    def __repr__(self):
+        return "codeset(%r)" % (list(self.order),)
+
+
+class dish(NamedTuple("dish", [
+    ("datum", dtm.date),
     ("name", str),
     ("warengruppe", str),
-    ("kennz", Counter),
-    ("zusatz", Counter),
+    ("kennz", codeset),
+    ("zusatz", codeset),
     ("stud", float),
     ("bed", float),
     ("gast", float)
-])
+])):
+    """
+    A single dish from the menu. Dishes are hashable and can also be indexed by the name of a field,
+    e.g. `dish["stud"]` for the price of a certain category.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return getattr(self, item)
+        return super().__getitem__(item)
+
+
+@functools.lru_cache(maxsize=64)
+def __parse_datum(datum: str) -> dtm.date:
+    return dtm.datetime.strptime(datum, "%d.%m.%Y").date()
 
 
 def parse_dish(row: dict) -> dish:
@@ -29,77 +88,89 @@ def parse_dish(row: dict) -> dish:
     Parse a row from the csv file as dish, trying to extract further information from the name.
     """
 
-    row['datum'] = dtm.datetime.strptime(row['datum'], "%d.%m.%Y").date()
-    row['zusatz'] = Counter()
-    row['kennz'] = Counter(row['kennz'].split(",") if row['kennz'] else [])
-    row["stud"] = float(row["stud"].replace(",", "."))
-    row["bed"] = float(row["bed"].replace(",", "."))
-    row["gast"] = float(row["gast"].replace(",", "."))
-    del row['tag']
-    del row['preis']
+    name = row["name"]
+    kennz = row['kennz'].split(",") if row['kennz'] else []
+    zusatz = []
 
     # fix for fucked up Salatmixes
-    if row["name"].startswith("Salatmix"):
-        row["name"] = re.match("Salatmix( [IV]+)?", row["name"]).group()
+    if name.startswith("Salatmix"):
+        name = re.match("Salatmix( [IV]+)?", name).group()
     else:
-        names, zusatz, kennz = __parse_name(row["name"])
-        row["name"] = " ".join(names)
-        row['zusatz'] += Counter(zusatz)
-        del row['zusatz']['']
-        row['kennz'] += Counter(kennz)
-        del row['kennz']['']
+        names, zusatz, name_kennz = __parse_name(name)
+        name = " ".join(names)
+        kennz += name_kennz
+
+    return dish(
+        datum=__parse_datum(row['datum']),
+        name=sys.intern(name),
+        warengruppe=sys.intern(row['warengruppe']),
+        kennz=codeset.of(kennz),
+        zusatz=codeset.of(zusatz),
+        stud=float(row["stud"].replace(",", ".")),
+        bed=float(row["bed"].replace(",", ".")),
+        gast=float(row["gast"].replace(",", "."))
+    )
 
-    return dish(**row)
+
+# runs of brackets are collapsed into one, everything in between is a single token
+REGEX_NAME_TOKEN = re.compile("\\(+|\\)+|[^()]+")
+REGEX_KENNZ = re.compile(PATTERN_KENNZ)
+REGEX_ZUSATZ = re.compile(PATTERN_ZUSATZ)
 
 
 def __parse_name(str_in):
-    str_in = re.sub("\(+", "(", re.sub("\)+", ")", str_in))
+    """
+    Split the name of a dish into the parts of its name, the Zusatzstoffe given in brackets and the Kennzeichnungen
+    appended to the parts of the name.
+
+    :return: the tuple (names, zusatz, kennz) or, if the brackets are unbalanced, (str_in, ["??"], ["??"])
+    """
 
     name = []
     kennz = []
     zusatz = []
 
-    def append_name(token):
-        nonlocal kennz
-        token = token.strip()
-        m = re.search(PATTERN_KENNZ, token)
-        if m:
-            kennz += (s.strip() for s in m.group(1).split(","))
-            token = re.sub(PATTERN_KENNZ, "", token)
-        name.append(token)
-
-    def append_zusatz(token):
-        nonlocal zusatz
-        token = token.strip()
-        if re.match(PATTERN_ZUSATZ, token):
-            zusatz += (s.strip() for s in token.split(","))
-        else:
-            name.append("(" + token + ")")
-
     brackets = False
     token = ""
-    for c in str_in:
-        if c == "(":
+    for part in REGEX_NAME_TOKEN.findall(str_in):
+        if part[0] == "(":
             if brackets:
-                return str_in, ["??"], ["??"]
-            append_name(token)
+                return __collapse_brackets(str_in), ["??"], ["??"]
+            __append_name(token, name, kennz)
             token = ""
             brackets = True
-        elif c == ")":
+        elif part[0] == ")":
             if not brackets:
-                return str_in, ["??"], ["??"]
-            append_zusatz(token)
+                return __collapse_brackets(str_in), ["??"], ["??"]
+            token = token.strip()
+            if REGEX_ZUSATZ.match(token):
+                zusatz += (s.strip() for s in token.split(","))
+            else:
+                name.append("(" + token + ")")
             token = ""
             brackets = False
         else:
-            token += c
+            token = part
 
     if token:
-        append_name(token)
+        __append_name(token, name, kennz)
 
     return name, zusatz, kennz
 
 
+def __append_name(token, name, kennz):
+    token = token.strip()
+    m = REGEX_KENNZ.search(token)
+    if m:
+        kennz += (s.strip() for s in m.group(1).split(","))
+        token = token[:m.start()]
+    name.append(token)
+
+
+def __collapse_brackets(str_in):
+    return REGEX_NAME_TOKEN.sub(lambda m: m.group()[0] if m.group()[0] in "()" else m.group(), str_in)
+
+
 ########################################################################################################################
 
 class Change(object):
@@ -134,6 +205,9 @@ class Change(object):
                self.from_dish == other.from_dish and \
                self.to_dish == other.to_dish
 
+    def __hash__(self):
+        return hash((self.type, self.from_dish, self.to_dish))
+
     def __str__(self):
         if self.type == "ATTR":
             return "%s ATR: %s (%s)" % (
@@ -166,26 +240,26 @@ def generate_diff(menu1, menu2) -> List[Change]:
     if menu1 == menu2:
         return []
 
-    dates = {dish.datum for dish in menu1}
-    map1 = {datum: {dish.warengruppe: dish for dish in menu1 if dish.datum == datum} for datum in dates}
-    map2 = {datum: {dish.warengruppe: dish for dish in menu2 if dish.datum == datum} for datum in dates}
+    map1 = __group_by_date(menu1)
+    map2 = __group_by_date(menu2)
 
     diff = []
-    for date in dates:
-        if map1[date] == map2[date]:
+    for date, wgs1 in map1.items():
+        wgs2 = map2.get(date, {})
+        if wgs1 == wgs2:
             continue
 
         # find all warengruppen that contain changes
         changed = {
-            re.sub("[0-9]", "", wg) for wg
-            in itertools.chain(map1[date].keys(), map2[date].keys())
-            if map1[date].get(wg, None) != map2[date].get(wg, None)
+            __wg_prefix(wg) for wg
+            in itertools.chain(wgs1.keys(), wgs2.keys())
+            if wgs1.get(wg, None) != wgs2.get(wg, None)
         }
 
         for wg in changed:
             # compare all items in the concerned warengruppe
-            changed_wg1 = [dish for dish in map1[date].values() if dish.warengruppe.startswith(wg)]
-            changed_wg2 = [dish for dish in map2[date].values() if dish.warengruppe.startswith(wg)]
+            changed_wg1 = [dish for dish in wgs1.values() if dish.warengruppe.startswith(wg)]
+            changed_wg2 = [dish for dish in wgs2.values() if dish.warengruppe.startswith(wg)]
             changed_wg1.sort(key=lambda x: x.warengruppe)  # sort items to make algorithm deterministic
             changed_wg2.sort(key=lambda x: x.warengruppe)
             diff += __compare_changed_wg(changed_wg1, changed_wg2)
@@ -193,21 +267,45 @@ def generate_diff(menu1, menu2) -> List[Change]:
     return diff
 
 
+def __group_by_date(menu):
+    """
+    Index the dishes by date and warengruppe in a single pass. As before, the last dish wins if a warengruppe
+    occurs multiple times on the same day.
+    """
+
+    groups = {}
+    for dish in menu:
+        groups.setdefault(dish.datum, {})[dish.warengruppe] = dish
+    return groups
+
+
+@functools.lru_cache(maxsize=None)
+def __wg_prefix(wg):
+    return re.sub("[0-9]", "", wg)
+
+
 def __compare_changed_wg(changed_wg1, changed_wg2):
-    diff, removed = [], []
+    diff, removed = [], collections.deque()
+    found = set()  # the changes in diff, for constant time lookup
 
     names1 = {d.name: d for d in changed_wg1}
     names2 = {d.name: d for d in changed_wg2}
 
+    def append(change):
+        diff.append(change)
+        found.add(change)
+
     for dish in changed_wg1:
         try:
             if dish == names2[dish.name]:
                 continue
-            diff.append(Change("MOVE", dish, names2[dish.name]))
+            append(Change("MOVE", dish, names2[dish.name]))
         except KeyError:
+            # only dishes without an identically named counterpart need fuzzy matching, but all names of the
+            # group stay candidates, so that ambiguous renames are detected just like before
             matches = difflib.get_close_matches(dish.name, names2)
             if len(matches) == 1:  # TODO what if len > 1?
-                diff.append(Change("RENAME", dish, names2[matches[0]]))
+                append(Change("RENAME", dish, names2[matches[0]]))
             else:
                 removed.append(Change("REMOVE", dish, None))
 
@@ -215,44 +313,24 @@ def __compare_changed_wg(changed_wg1, changed_wg2):
         try:
             if dish == names1[dish.name]:
                 continue
-            assert Change("MOVE", names1[dish.name], dish) in diff  # TODO better handling of this case
+            assert Change("MOVE", names1[dish.name], dish) in found  # TODO better handling of this case
         except KeyError:
             matches = difflib.get_close_matches(dish.name, names1)
             if len(matches) == 1:
-                if not Change("RENAME", names1[matches[0]], dish) in diff:
+                if not Change("RENAME", names1[matches[0]], dish) in found:
                     warnings.warn("Dish %s renamed to %s, but only found in one direction. Diff will be invalid!" %
                                   (dish, matches[0]))  # TODO better handling of this case
             elif removed:
-                diff.append(Change("REPLACE", removed.pop(0).from_dish, dish))
+                append(Change("REPLACE", removed.popleft().from_dish, dish))
             else:
-                diff.append(Change("ADD", None, dish))
+                append(Change("ADD", None, dish))
 
-    return diff + removed
+    return diff + list(removed)
 
 
 ########################################################################################################################
 
-def main():
-    import argparse
-    import csv
-    from mensabot.mensa import PRICES_CATEGORIES, MENU_TYPES
-
-    parser = argparse.ArgumentParser(description='Compare two mensa menus.')
-    parser.add_argument('path', action='store')
-    parser.add_argument('old_file', action='store')
-    parser.add_argument('old_hex', action='store')
-    parser.add_argument('old_mode', action='store')
-    parser.add_argument('new_file', action='store')
-    parser.add_argument('new_hex', action='store')
-    parser.add_argument('new_mode', action='store')
-    args = parser.parse_args()
-
-    with open(args.old_file, "r", encoding="iso8859_3") as f:
-        menu1 = [parse_dish(row) for row in csv.DictReader(f.readlines(), delimiter=';')]
-    with open(args.new_file, "r", encoding="iso8859_3") as f:
-        menu2 = [parse_dish(row) for row in csv.DictReader(f.readlines(), delimiter=';')]
-
-    diff = generate_diff(menu1, menu2)
+def print_diff(diff: List[Change]):
     diff = sorted(diff, key=lambda d: (d.dish().datum, MENU_TYPES.index(d.dish().warengruppe[0]), d.dish().warengruppe))
     for x in diff:
         if list(x.diff.keys()) == ["warengruppe"]:
@@ -273,9 +351,54 @@ def main():
                   (x.from_dish.stud, x.from_dish.bed, x.from_dish.gast,
                    x.to_dish.stud, x.to_dish.bed, x.to_dish.gast))
         if "kennz" in x.diff:
-            print("\tKennz: %s -> %s" % tuple(",".join(c.keys()) for c in x.diff["kennz"]))
+            print("\tKennz: %s -> %s" % tuple(",".join(c) for c in x.diff["kennz"]))
         if "zusatz" in x.diff:
-            print("\tZusatz: %s ->️ %s" % tuple(",".join(c.keys()) for c in x.diff["zusatz"]))
+            print("\tZusatz: %s ->️ %s" % tuple(",".join(c) for c in x.diff["zusatz"]))
+
+
+def main():
+    import argparse
+    import csv
+
+    parser = argparse.ArgumentParser(
+        description='Compare two mensa menus, either two csv files as git diff driver or versions from the history.')
+    parser.add_argument('--week', action='store', metavar='YYYY-Www',
+                        help='show the changes of this week recorded in the menu history')
+    parser.add_argument('--date', action='store', metavar='YYYY-MM-DD',
+                        help='show the changes of this date recorded in the menu history')
+    parser.add_argument('--versions', action='store', nargs=2, type=int, metavar=('OLD', 'NEW'),
+                        help='only compare these two versions of the --week, counting from 0 or from the end if < 0')
+    parser.add_argument('git_args', nargs='*', metavar='path old_file old_hex old_mode new_file new_hex new_mode')
+    args = parser.parse_args()
+
+    if args.week or args.date:
+        from mensabot import history
+        from mensabot.db import migrate
+
+        migrate()
+        if args.week:
+            year, week = args.week.split("-W")
+            versions = history.get_menu_week_versions((int(year), int(week)))
+            if args.versions:
+                versions = [versions[i] for i in args.versions]
+            for (old_at, old), (new_at, new) in zip(versions, versions[1:]):
+                print("%s -> %s" % (old_at, new_at))
+                print_diff(generate_diff(old, new))
+        else:
+            for at, diff in history.get_changes(dtm.datetime.strptime(args.date, "%Y-%m-%d").date()):
+                print(at)
+                print_diff(diff)
+        return
+
+    if len(args.git_args) != 7:
+        parser.error("expected the 7 arguments git passes to a diff driver or --week / --date")
+    path, old_file, old_hex, old_mode, new_file, new_hex, new_mode = args.git_args
+    with open(old_file, "r", encoding="iso8859_3") as f:
+        menu1 = [parse_dish(row) for row in csv.DictReader(f.readlines(), delimiter=';')]
+    with open(new_file, "r", encoding="iso8859_3") as f:
+        menu2 = [parse_dish(row) for row in csv.DictReader(f.readlines(), delimiter=';')]
+
+    print_diff(generate_diff(menu1, menu2))
 
 
 if __name__ == "__main__":
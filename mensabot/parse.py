@@ -1,14 +1,40 @@
+import datetime as dtm
+import functools
 import sys
 from pkgutil import get_data
 
-import dateparser
-from dateparser import DateDataParser
+import regex as re
 
 LANG = ['de', 'en']
 DATEPARSER_SETTINGS = {'PREFER_DATES_FROM': 'future'}
-
-
-def __inject_alt_langs():
+DATEPARSER_CACHE_SIZE = 1024
+
+# time of day used as RELATIVE_BASE, so that results relative to now can be told apart from fixed dates and times
+RELATIVE_BASE_TIME = dtm.time(0, 0, 0, 1)
+
+RELATIVE_DAYS = {
+    "heute": 0, "today": 0,
+    "morgen": 1, "tomorrow": 1,
+    "übermorgen": 2, "uebermorgen": 2,
+    "gestern": -1, "yesterday": -1,
+    "vorgestern": -2,
+}
+WEEKDAYS = {
+    name: nr for nr, names in enumerate([
+        ["montag", "mon", "mo", "monday"],
+        ["dienstag", "die", "di", "tuesday", "tue"],
+        ["mittwoch", "mit", "mi", "wednesday", "wed"],
+        ["donnerstag", "don", "do", "thursday", "thu"],
+        ["freitag", "fre", "fr", "friday", "fri"],
+        ["samstag", "sam", "sa", "saturday", "sat"],
+        ["sonntag", "son", "so", "sunday", "sun"],
+    ]) for name in names
+}
+REGEX_DAY_OFFSET = re.compile(r"([+-])\s*([0-9]{1,3})")
+REGEX_DAY_MONTH = re.compile(r"([0-9]{1,2})\.([0-9]{1,2})\.([0-9]{4})?")
+
+
+def __inject_alt_langs(DateDataParser):
     """
     Make the lookup function for dateparser language definition files also look in mensabot.languages  
     """
@@ -28,7 +54,15 @@ def __inject_alt_langs():
     sys.modules['dateparser.utils'].get_data = get_data2
 
 
-__inject_alt_langs()
+@functools.lru_cache(maxsize=None)
+def __load_dateparser():
+    """
+    Import dateparser only once the first date needs to be parsed, as it alone takes about 0.3s to import.
+    """
+
+    from dateparser import DateDataParser
+    __inject_alt_langs(DateDataParser)
+    return DateDataParser
 
 
 def parse_loc_date(tokens):
@@ -65,17 +99,104 @@ def parse_loc(s):
     return None
 
 
-def parse_date(s):
+def parse_date(s, now: dtm.datetime = None):
+    """
+    Parse a date given by the user, relative to `now`.
+    Results relative to now, like "morgen" or "in 2 Tagen", keep the current time of day,
+    while weekdays and calendar dates are returned at midnight.
+    Only results that don't depend on the time of day are cached, everything else is parsed relative to `now`.
+
+    :param now: the current time, `datetime.now()` by default
+    """
+
     if not s or s == ['']:
         return None
     if not isinstance(s, str):
         s = " ".join(s)
-    if s.startswith("+"):
-        s = "in " + s[1:]
-    if s.startswith("-"):
-        s = "vor " + s[1:]
+    if not now:
+        now = dtm.datetime.now()
+    s = " ".join(s.lower().split())
 
-    v = dateparser.parse(s, languages=LANG, settings=DATEPARSER_SETTINGS)
+    v = parse_date_fast(s, now)
+    if not v:
+        if s.startswith("+"):
+            s = "in " + s[1:]
+        if s.startswith("-"):
+            s = "vor " + s[1:]
+        v = __parse_date_cached(s, now.date())
+        if v and v.time() == RELATIVE_BASE_TIME:
+            v = dtm.datetime.combine(v.date(), now.time())
+        elif v and v.time() != dtm.time():
+            # depends on the time of day, like "in 2 stunden" or "12:00", so the cached day-level result can't be used
+            v = __parse_date_at(s, now)
     if not v:
         raise ValueError("Could not parse date '%s'" % s)
     return v
+
+
+def parse_date_fast(s: str, now: dtm.datetime):
+    """
+    Parse the most common ways of giving a date without asking dateparser:
+    "heute", "morgen", "gestern" and friends, weekday names, "+N" / "-N" days and "dd.mm." / "dd.mm.yyyy".
+
+    :param s: the lower-cased date string
+    :return: the parsed datetime or None, if `s` should be given to dateparser
+    """
+
+    if s in RELATIVE_DAYS:
+        return now + dtm.timedelta(days=RELATIVE_DAYS[s])
+
+    midnight = dtm.datetime.combine(now.date(), dtm.time())
+    if s in WEEKDAYS:
+        # like dateparser with PREFER_DATES_FROM future, today's weekday means the same day next week
+        return midnight + dtm.timedelta(days=(WEEKDAYS[s] - now.weekday() - 1) % 7 + 1)
+
+    match = REGEX_DAY_OFFSET.fullmatch(s)
+    if match:
+        days = int(match.group(2))
+        return now + dtm.timedelta(days=days if match.group(1) == "+" else -days)
+
+    match = REGEX_DAY_MONTH.fullmatch(s)
+    if match:
+        day, month, year = match.groups()
+        try:
+            v = midnight.replace(year=int(year or now.year), month=int(month), day=int(day))
+        except ValueError:
+            return None
+        if not year and v < midnight:
+            v = v.replace(year=now.year + 1)
+        return v
+
+    return None
+
+
+@functools.lru_cache(maxsize=DATEPARSER_CACHE_SIZE)
+def __parse_date_cached(s: str, today: dtm.date):
+    data = get_date_parser(today).get_date_data(s)
+    return data['date_obj'] if data else None
+
+
+def __parse_date_at(s: str, now: dtm.datetime):
+    parser = __load_dateparser()(languages=LANG, settings=dict(DATEPARSER_SETTINGS, RELATIVE_BASE=now))
+    data = parser.get_date_data(s)
+    return data['date_obj'] if data else None
+
+
+@functools.lru_cache(maxsize=1)
+def get_date_parser(today: dtm.date = None) -> "dateparser.DateDataParser":
+    """
+    Get the DateDataParser for parsing relative to `today`, which is only rebuilt once a day.
+    """
+
+    if not today:
+        today = dtm.date.today()
+    settings = dict(DATEPARSER_SETTINGS, RELATIVE_BASE=dtm.datetime.combine(today, RELATIVE_BASE_TIME))
+    return __load_dateparser()(languages=LANG, settings=settings)
+
+
+def load_date_parser():
+    """
+    Import dateparser and load its language data, which otherwise happens on the first date the parser is asked for.
+    """
+
+    __parse_date_cached("in 1 woche", dtm.date.today())
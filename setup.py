@@ -27,10 +27,11 @@ setup(
         "console_scripts": [
             "mensabot = mensabot.bot.main:main",
             "mensabot-bc = mensabot.bot.broadcast:main",
-            "mensa-diff = mensabot.mensa_menu:main"
+            "mensa-diff = mensabot.mensa_menu:main",
+            "mensabot-import = mensabot.importer:main"
         ]
     },
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     package_data={
         'mensabot': ['templates/*', 'templates/*/*', 'templates/*/*/*', 'languages/*'],
     },
@@ -46,5 +47,11 @@ setup(
         'requests',
         'sh',
         'sqlalchemy',
-    ]
+    ],
+    extras_require={
+        'asyncio': ['aiohttp'],
+        'lxml': ['lxml'],
+        'dulwich': ['dulwich'],
+        'benchmark': ['pytest-benchmark'],
+    }
 )
@@ -0,0 +1,98 @@
+import asyncio
+import datetime as dtm
+import threading
+from concurrent.futures import Future
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from mensabot import mensa
+from mensabot.bot import aio
+
+CSV = "datum;tag;warengruppe;name;kennz;preis;stud;bed;gast\n" \
+      "28.05.2018;Mo;HG1;Puten - Dönerteller * G (5,16,A,G,J,K);G;;2,80;3,50;4,20\n" \
+      "28.05.2018;Mo;S1;Tomatencremesuppe (G);V;;0,60;0,80;1,20\n"
+WEEK = (2018, 22)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(mensa, "MENU_STORE", str(tmp_path))
+    monkeypatch.setattr(mensa, "cache", {})
+    requested = []
+    status = [200]
+
+    async def handle(request):
+        requested.append(request.path)
+        if not request.path.endswith("/22.csv"):
+            raise web.HTTPNotFound()
+        if status[0] == 304:
+            return web.Response(status=304)
+        return web.Response(text=CSV, content_type="text/csv", charset="iso8859_1")
+
+    def fetch(*coros):
+        async def run():
+            app = web.Application()
+            app.router.add_get("/{tail:.*}", handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            monkeypatch.setattr(mensa, "MENU_URL", "http://127.0.0.1:%s/csv/" % port)
+            try:
+                async with aiohttp.ClientSession() as session:
+                    return await asyncio.gather(*(coro(session) for coro in coros))
+            finally:
+                await runner.cleanup()
+
+        return asyncio.run(run())
+
+    fetch.requested, fetch.status = requested, status
+    return fetch
+
+
+def test_fetch_menu_week(server, tmp_path):
+    menu, = server(lambda session: aio.fetch_menu_week(session, WEEK))
+    assert server.requested == ["/csv/22.csv"]
+    assert [d.name for d in menu] == ["Puten - Dönerteller", "Tomatencremesuppe"]
+    assert menu[0].datum == dtm.date(2018, 5, 28)
+    assert mensa.cache[WEEK][1] == menu
+    assert (tmp_path / "2018-W22.csv").exists()
+    assert mensa.pending_fetches == {}
+
+
+def test_fetch_running(server, monkeypatch):
+    # a thread is already fetching the week, e.g. refresh_menu_week started by a handler hitting a stale entry
+    running = Future()
+    monkeypatch.setitem(mensa.pending_fetches, WEEK, running)
+    threading.Timer(0.1, running.set_result, ["from the thread"]).start()
+
+    results = server(lambda session: aio.fetch_menu_week(session, WEEK),
+                     lambda session: aio.fetch_menu_week(session, WEEK))
+    assert results == ["from the thread"] * 2
+    assert server.requested == []
+
+
+def test_fetch_shared(server, monkeypatch):
+    # a thread asking for the week while the event loop fetches it waits for that fetch
+    updates = []
+    update_menu_week = mensa.update_menu_week
+    monkeypatch.setattr(mensa, "update_menu_week", lambda *args: updates.append(args) or update_menu_week(*args))
+
+    async def refresh_in_thread(session):
+        await asyncio.sleep(0)
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: mensa.refresh_menu_week(WEEK).result())
+
+    menu, other = server(lambda session: aio.fetch_menu_week(session, WEEK), refresh_in_thread)
+    assert menu == other
+    assert len(updates) == 1
+
+
+def test_not_modified(server, monkeypatch):
+    server.status[0] = 304
+    threads = []
+    monkeypatch.setattr(mensa, "unchanged_menu_week", lambda week: threads.append(threading.current_thread()) or [])
+    assert server(lambda session: aio.fetch_menu_week(session, WEEK)) == [[]]
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,155 @@
+import datetime as dtm
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event
+
+from mensabot import db
+from mensabot.db import CHATS, connection, delete_chat, get_chat, get_push_chats, move_chat, set_chat
+
+
+@pytest.fixture(autouse=True)
+def database(tmpdir, monkeypatch):
+    engine = db.create_sql_engine("sqlite:///" + os.path.join(str(tmpdir), "mensabot.sqlite"))
+    monkeypatch.setattr(db, "SQL_ENGINE", engine)
+    monkeypatch.setattr(db, "chat_cache", {})
+    monkeypatch.setattr(db, "push_buckets", None)
+    db.migrate()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def statements(database):
+    executed = []
+    event.listen(database, "before_cursor_execute", lambda conn, cursor, stmt, *args: executed.append(stmt))
+    return executed
+
+
+def select_chat(id):
+    with connection() as (conn, execute):
+        return execute(CHATS.select().where(CHATS.c.id == id)).fetchone()
+
+
+def test_wal(database):
+    assert database.execute("PRAGMA journal_mode").scalar() == "wal"
+
+
+def test_get_creates_default(statements):
+    chat = get_chat(42)
+    assert chat.id == 42
+    assert chat["price_category"] == 0
+    assert chat.template is None and chat.push_time is None
+    assert chat.push_sound and chat.update_menu and not chat.notify_change
+    assert len(statements) == 3  # select, insert, select
+    assert select_chat(42) == chat
+
+
+def test_get_cached(statements):
+    chat = get_chat(42)
+    del statements[:]
+    for _ in range(10):
+        assert get_chat(42) is chat
+    assert statements == []
+
+
+def test_set_new_and_existing():
+    chat = set_chat(1, push_time=dtm.time(11, 15), locale="en")
+    assert chat.push_time == dtm.time(11, 15) and chat.locale == "en"
+    assert chat.price_category == 0 and chat.push_sound
+    assert get_chat(1) is chat
+
+    chat = set_chat(1, price_category=2)
+    assert chat.price_category == 2 and chat.push_time == dtm.time(11, 15) and chat.locale == "en"
+    assert get_chat(1) is chat
+    assert select_chat(1) == chat
+
+
+def test_set_server_default():
+    set_chat(1, push_sound=False, template="short", price_category=1)
+    chat = set_chat(1, push_sound=CHATS.c.push_sound.server_default.arg,
+                    template=CHATS.c.template.server_default.arg,
+                    price_category=CHATS.c.price_category.server_default.arg)
+    assert chat.push_sound is True and chat.template is None and chat.price_category == 0
+
+
+def test_set_unknown_column():
+    with pytest.raises(KeyError):
+        set_chat(1, foo="bar")
+    assert select_chat(1) is None
+
+
+def test_move_and_delete():
+    set_chat(1, locale="en")
+    move_chat(1, 2)
+    assert select_chat(1) is None
+    assert get_chat(2).locale == "en"
+
+    delete_chat(2)
+    assert select_chat(2) is None
+    assert get_chat(2).locale is None
+
+
+def test_threads():
+    def work(i):
+        id = i % 10
+        get_chat(id)
+        set_chat(id, price_category=i % 3)
+        return get_chat(id).id
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert sorted(set(executor.map(work, range(200)))) == list(range(10))
+    for id in range(10):
+        assert get_chat(id) == select_chat(id)
+
+
+def push_chats(start=dtm.time(0), end=dtm.time(23, 59)):
+    return [(minute, [row.id for row in rows]) for minute, rows in get_push_chats(start, end)]
+
+
+def test_migrate_index(database):
+    def indices():
+        return [row[1] for row in database.execute("PRAGMA index_list(chats)")]
+
+    assert "chats_push_time" in indices()
+    database.execute("DROP INDEX chats_push_time")
+    database.execute("DROP TABLE dish_versions")
+    database.execute("PRAGMA user_version = 2")
+    db.migrate()
+    assert "chats_push_time" in indices()
+    assert database.execute("PRAGMA user_version").scalar() == db.SCHEMA_VERSION
+
+
+def test_push_buckets(statements):
+    with connection() as (conn, execute):
+        execute(CHATS.insert(), [
+            dict(id=1, push_time=dtm.time(11, 15, 30)), dict(id=2, push_time=dtm.time(11, 15)),
+            dict(id=3, push_time=dtm.time(11, 30)), dict(id=4, push_time=None), dict(id=5, push_time=dtm.time(12, 0))])
+    del statements[:]
+
+    assert push_chats() == [(dtm.time(11, 15), [2, 1]), (dtm.time(11, 30), [3]), (dtm.time(12, 0), [5])]
+    assert len(statements) == 1
+    assert push_chats(dtm.time(11, 15), dtm.time(12, 0)) == [(dtm.time(11, 15), [2, 1]), (dtm.time(11, 30), [3])]
+    assert push_chats(dtm.time(11, 16), dtm.time(11, 30)) == []
+    assert get_chat(4).id == 4
+    assert len(statements) == 1
+
+
+def test_push_buckets_in_sync():
+    set_chat(1, push_time=dtm.time(11, 15))
+    set_chat(2, push_time=dtm.time(11, 15))
+    assert push_chats() == [(dtm.time(11, 15), [1, 2])]
+
+    set_chat(1, push_time=dtm.time(12, 0))
+    set_chat(3, push_time=dtm.time(12, 0, 10))
+    assert push_chats() == [(dtm.time(11, 15), [2]), (dtm.time(12, 0), [1, 3])]
+
+    set_chat(2, push_time=CHATS.c.push_time.server_default.arg)
+    move_chat(1, 4)
+    assert push_chats() == [(dtm.time(12, 0), [4, 3])]
+
+    delete_chat(3)
+    assert push_chats() == [(dtm.time(12, 0), [4])]
+    db.load_push_buckets()
+    assert push_chats() == [(dtm.time(12, 0), [4])]
@@ -0,0 +1,79 @@
+import os
+import subprocess
+
+import pytest
+
+from mensabot.bot import diff_listener
+
+
+def git(store, *args):
+    return subprocess.run(["git"] + list(args), cwd=store, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+
+
+def commits(store):
+    """
+    The files changed by each commit, newest commit first.
+    """
+
+    return [git(store, "diff-tree", "--no-commit-id", "--name-only", "--root", "-r", sha)
+            for sha in git(store, "log", "--format=%H")]
+
+
+@pytest.fixture(params=["dulwich", "git"])
+def store(request, tmpdir, monkeypatch):
+    if request.param == "dulwich" and not diff_listener.porcelain:
+        pytest.skip("dulwich is not installed")
+    if request.param == "git":
+        monkeypatch.setattr(diff_listener, "porcelain", None)
+        monkeypatch.setenv("GIT_AUTHOR_NAME", "test")
+        monkeypatch.setenv("GIT_AUTHOR_EMAIL", "test@example.com")
+        monkeypatch.setenv("GIT_COMMITTER_NAME", "test")
+        monkeypatch.setenv("GIT_COMMITTER_EMAIL", "test@example.com")
+    store = str(tmpdir.mkdir("menustore"))
+    monkeypatch.setattr(diff_listener, "MENU_STORE", store)
+    monkeypatch.setattr(diff_listener, "MENU_COMMIT_DELAY", 60)
+    monkeypatch.setattr(diff_listener, "commit_stats", diff_listener.CommitStats())
+    return store
+
+
+def write_week(store, week, text):
+    with open(os.path.join(store, "%s-W%02d.csv" % week), "w") as f:
+        f.write(text)
+    with open(os.path.join(store, "%s-W%02d.pickle" % week), "w") as f:
+        f.write("snapshot")
+
+
+def test_coalesce(store):
+    for week in [(2018, 20), (2018, 21), (2018, 20)]:
+        write_week(store, week, "menu of %s\n" % (week,))
+        diff_listener.commit_diff(week, [], [])
+    assert diff_listener.pending_commits == {(2018, 20), (2018, 21)}
+    diff_listener.flush_commits()
+
+    assert diff_listener.pending_commits == set()
+    assert commits(store) == [["2018-W20.csv", "2018-W21.csv"]]
+    assert git(store, "log", "--format=%s")[:2] == ["updates", "from"]
+    stats = diff_listener.commit_stats
+    assert (stats.commits, stats.weeks, stats.failed) == (1, 2, 0)
+    assert stats.last_latency >= stats.last_duration > 0
+    assert "1 commits of 2 weeks" in str(stats)
+
+    write_week(store, (2018, 21), "changed\n")
+    diff_listener.commit_diff((2018, 21), [], [])
+    diff_listener.flush_commits()
+    assert commits(store) == [["2018-W21.csv"], ["2018-W20.csv", "2018-W21.csv"]]
+    assert diff_listener.commit_stats.commits == 2
+    assert git(store, "status", "--porcelain") == ["??", "2018-W20.pickle", "??", "2018-W21.pickle"]
+    assert git(store, "remote", "get-url", "origin") == [diff_listener.MENU_STORE_REMOTE]
+
+
+def test_failure(store, monkeypatch):
+    def fail(files, message):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(diff_listener, "git_commit", fail)
+    diff_listener.commit_diff((2018, 20), [], [])
+    diff_listener.flush_commits()
+    assert diff_listener.commit_stats.failed == 1
+    assert diff_listener.pending_commits == set()
@@ -0,0 +1,55 @@
+import time as systime
+
+from telegram.error import RetryAfter, TimedOut
+
+from mensabot.bot import delivery
+from mensabot.bot.delivery import DeliveryEngine, Throttle, TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.05 < bucket.reserve() <= 0.1
+    bucket.block(1)
+    assert bucket.reserve() > 0.9
+
+
+def test_wave(monkeypatch):
+    monkeypatch.setattr(delivery.systime, "sleep", lambda s: None)
+    engine = DeliveryEngine(4, Throttle(1000, 1000))
+    failures = {"timeout": 1, "retry": 1}
+    sent = []
+
+    def send(chat_id):
+        if chat_id == 1 and failures["timeout"]:
+            failures["timeout"] -= 1
+            raise TimedOut()
+        if chat_id == 2 and failures["retry"]:
+            failures["retry"] -= 1
+            raise RetryAfter(0)
+        if chat_id == 3:
+            raise ValueError("broken")
+        assert engine.is_worker()
+        sent.append(chat_id)
+
+    wave = engine.send_wave("test", [lambda id=id: send(id) for id in range(10)])
+    assert wave.wait(5)
+    assert sorted(sent) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert (wave.sent, wave.failed) == (9, 1)
+    assert wave.latency() >= 0
+    engine.shutdown()
+
+
+def test_failure_callback(monkeypatch):
+    monkeypatch.setattr(delivery.systime, "sleep", lambda s: None)
+    engine = DeliveryEngine(1, Throttle(1000, 1000))
+    failures = []
+
+    def send():
+        engine.on_failure(failures.append)
+        raise TimedOut()
+
+    future = engine.submit(send)
+    assert isinstance(future.exception(5), TimedOut)
+    assert len(failures) == 1 and isinstance(failures[0], TimedOut)
@@ -0,0 +1,52 @@
+import csv
+import datetime as dtm
+import json
+import os
+import warnings
+
+import pytest
+
+from mensabot.mensa import repair_menu_csv
+from mensabot.mensa_menu import Change, generate_diff, parse_dish
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+with open(os.path.join(FIXTURES, "diff.json"), "r", encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+
+def load_menu(file, shift=0):
+    with open(os.path.join(FIXTURES, "menu", file), "r", encoding="iso8859_3") as f:
+        text = repair_menu_csv(f.read())
+    menu = [parse_dish(row) for row in csv.DictReader(text.splitlines(), delimiter=';') if row['datum'].strip()]
+    return [d._replace(datum=d.datum + dtm.timedelta(weeks=shift)) for d in menu]
+
+
+def serialize(dish):
+    if dish is None:
+        return None
+    return [dish.datum.isoformat(), dish.warengruppe, dish.name, list(dish.kennz), list(dish.zusatz),
+            dish.stud, dish.bed, dish.gast]
+
+
+@pytest.mark.parametrize("file1, shift1, file2, shift2, changes", GOLDEN)
+def test_golden(file1, shift1, file2, shift2, changes):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        diff = generate_diff(load_menu(file1, shift1), load_menu(file2, shift2))
+    assert sorted(json.dumps([c.type, serialize(c.from_dish), serialize(c.to_dish)]) for c in diff) == \
+           sorted(json.dumps(c) for c in changes)
+
+
+def test_identical():
+    menu = load_menu("20.csv")
+    assert generate_diff(menu, list(menu)) == []
+    assert generate_diff(menu, list(reversed(menu))) == []
+
+
+def test_change_hash():
+    menu = load_menu("20.csv")
+    a, b = menu[0], menu[0]._replace(stud=menu[0].stud + 1)
+    assert Change("MOVE", a, b) in {Change("MOVE", a, b)}
+    assert Change("MOVE", a, b).type == "ATTR"
+    assert Change("REMOVE", a, None) not in {Change("ADD", None, a)}
@@ -0,0 +1,40 @@
+import datetime as dtm
+import pickle
+
+from mensabot.mensa_menu import codeset, generate_diff, parse_dish
+
+ROW = {"datum": "28.05.2018", "tag": "Mo", "warengruppe": "HG1", "name": "Puten - Dönerteller * G (5,16,A,G,J,K)",
+       "kennz": "G", "preis": "", "stud": "2,80", "bed": "3,50", "gast": "4,20"}
+
+
+def test_parse_dish():
+    d = parse_dish(dict(ROW))
+    assert d.datum == dtm.date(2018, 5, 28)
+    assert d.name == "Puten - Dönerteller"
+    assert list(d.zusatz) == ["5", "16", "A", "G", "J", "K"]
+    assert list(d.kennz) == ["G"]
+    assert d["stud"] == d.stud == d[5] == 2.8
+
+
+def test_hashable():
+    a, b = parse_dish(dict(ROW)), parse_dish(dict(ROW))
+    assert a == b and hash(a) == hash(b)
+    assert a.kennz is b.kennz and a.zusatz is b.zusatz
+    assert len({a, b, a._replace(stud=3.0)}) == 2
+    assert pickle.loads(pickle.dumps(a)) == a
+
+
+def test_codeset():
+    codes = codeset.of(["B", "A", "", "B"])
+    assert list(codes) == ["A", "B"]
+    assert codes == codeset.of(["A", "B"]) == frozenset(["A", "B"])
+    assert "A" in codes and "C" not in codes
+    assert ",".join(codes) == "A,B"
+    assert list(codeset.of(["G", "16", "A", "5"])) == ["5", "16", "A", "G"]
+
+
+def test_codeset_reordered():
+    d = parse_dish(dict(ROW))
+    reordered = parse_dish(dict(ROW, name="Puten - Dönerteller * G (K,J,G,A,16,5)"))
+    assert generate_diff([d], [reordered]) == []
+    assert list(reordered.zusatz) == list(d.zusatz) == ["5", "16", "A", "G", "J", "K"]
@@ -0,0 +1,32 @@
+import datetime as dtm
+
+from mensabot import format
+from mensabot.mensa import menu_week_of
+from mensabot.mensa_menu import codeset, dish
+
+DATE = dtm.date(2018, 5, 28)
+MENU = [
+    dish(DATE, "Tomatencremesuppe", "S1", codeset.of(["V"]), codeset.of(["G"]), 0.6, 0.8, 1.2),
+    dish(DATE, "Pommes frites", "B1", codeset.of(["VG"]), codeset.of([]), 0.9, 1.1, 1.5),
+]
+
+
+def test_menu_cache(monkeypatch):
+    menu = list(MENU)
+    monkeypatch.setattr(format, "get_menu_day", lambda dt: menu)
+    format.clear_menu_cache()
+    before = format.get_menu_cache_info()
+
+    text = format.get_mensa_formatted(DATE, template="de", now=DATE)
+    assert "Tomatencremesuppe" in text
+    assert format.get_mensa_formatted(DATE, template="de", now=DATE) == text
+    assert format.get_mensa_formatted(DATE, template="de", price_category="gast", now=DATE) != text
+    info = format.get_menu_cache_info()
+    assert (info.hits - before.hits, info.misses - before.misses) == (1, 2)
+
+    # a changed menu must not be served from the cache, even if no change was announced
+    menu[0] = menu[0]._replace(name="Kartoffelsuppe")
+    assert "Kartoffelsuppe" in format.get_mensa_formatted(DATE, template="de", now=DATE)
+
+    format.clear_menu_cache(menu_week_of(DATE))
+    assert format.get_menu_cache_info().currsize == 0
@@ -0,0 +1,108 @@
+import collections
+import datetime as dtm
+import os
+import sys
+
+import pytest
+
+from mensabot import db, history, mensa_menu
+from mensabot.mensa import menu_week_of, parse_menu_csv, repair_menu_csv
+from mensabot.mensa_menu import generate_diff
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "menu")
+T1 = dtm.datetime(2018, 4, 27, 10, 0)
+T2 = dtm.datetime(2018, 5, 2, 11, 30)
+T3 = dtm.datetime(2018, 5, 3, 9, 15)
+
+
+def load(file):
+    with open(os.path.join(FIXTURES, file), "r", encoding="iso8859_3") as f:
+        return parse_menu_csv(repair_menu_csv(f.read()))
+
+
+OLD, NEW = load("18.csv"), load("18-v2.csv")
+WEEK = menu_week_of(OLD[0].datum)
+
+
+@pytest.fixture(autouse=True)
+def database(tmpdir, monkeypatch):
+    engine = db.create_sql_engine("sqlite:///" + os.path.join(str(tmpdir), "mensabot.sqlite"))
+    monkeypatch.setattr(db, "SQL_ENGINE", engine)
+    db.migrate()
+    yield engine
+    engine.dispose()
+
+
+def same(menu1, menu2):
+    return collections.Counter(menu1) == collections.Counter(menu2)
+
+
+def changes(diff):
+    return sorted(((c.type, c.from_dish, c.to_dish) for c in diff), key=repr)
+
+
+def test_week_dates():
+    assert history.week_dates(WEEK) == (dtm.date(2018, 4, 30), dtm.date(2018, 5, 6))
+    assert history.week_dates((2020, 53)) == (dtm.date(2020, 12, 28), dtm.date(2021, 1, 3))
+    assert history.week_dates((2019, 1)) == (dtm.date(2018, 12, 31), dtm.date(2019, 1, 6))
+
+
+def test_versions():
+    assert history.record_menu_week(WEEK, OLD, T1) == len(OLD)
+    assert history.record_menu_week(WEEK, OLD, T2) == 0
+    changed = history.record_menu_week(WEEK, NEW, T2)
+    assert 0 < changed < len(OLD) + len(NEW)
+
+    start, end = history.week_dates(WEEK)
+    assert history.get_versions(start, end) == [T1, T2]
+    assert same(history.get_menu_at(start, end, T1), OLD)
+    assert same(history.get_menu_at(start, end, T2), NEW)
+    assert same(history.get_menu_at(start, end), NEW)
+    assert history.get_menu_at(start, end, T1 - dtm.timedelta(seconds=1)) == []
+
+    versions = history.get_menu_week_versions(WEEK)
+    assert [at for at, menu in versions] == [T1, T2]
+    assert same(versions[0][1], OLD) and same(versions[1][1], NEW)
+
+
+def test_removed_day():
+    history.record_menu_week(WEEK, OLD, T1)
+    day = OLD[0].datum
+    history.record_menu_week(WEEK, [d for d in OLD if d.datum != day], T2)
+    history.record_menu_week(WEEK, OLD, T3)
+    assert history.get_versions(day) == [T1, T2, T3]
+    assert history.get_menu_at(day, at=T2) == []
+    assert same(history.get_menu_at(day), [d for d in OLD if d.datum == day])
+
+
+def test_changes():
+    history.record_menu_week(WEEK, OLD, T1)
+    history.record_menu_week(WEEK, NEW, T2)
+    for day in sorted({d.datum for d in OLD + NEW}):
+        expected = generate_diff([d for d in OLD if d.datum == day], [d for d in NEW if d.datum == day])
+        found = history.get_changes(day)
+        if expected:
+            assert [at for at, diff in found] == [T2]
+            assert changes(found[0][1]) == changes(expected)
+    week_changes = history.get_changes(*history.week_dates(WEEK))
+    assert [at for at, diff in week_changes] == [T2]
+    assert changes(week_changes[0][1]) == changes(generate_diff(OLD, NEW))
+
+
+def test_listener():
+    history.record_change(WEEK, [], OLD)
+    assert same(history.get_menu_at(*history.week_dates(WEEK)), OLD)
+
+
+def test_mensa_diff(monkeypatch, capsys):
+    history.record_menu_week(WEEK, OLD, T1)
+    history.record_menu_week(WEEK, NEW, T2)
+    monkeypatch.setattr(sys, "argv", ["mensa-diff", "--week", "%s-W%02d" % WEEK])
+    mensa_menu.main()
+    week_out = capsys.readouterr().out
+    assert week_out.startswith("%s -> %s\n" % (T1, T2))
+    assert "\n[" in week_out
+
+    monkeypatch.setattr(sys, "argv", ["mensa-diff", "--week", "%s-W%02d" % WEEK, "--versions", "0", "-1"])
+    mensa_menu.main()
+    assert capsys.readouterr().out == week_out
@@ -0,0 +1,137 @@
+import collections
+import datetime as dtm
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from mensabot import db, history, importer
+from mensabot.mensa import parse_menu_csv, repair_menu_csv
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "menu")
+WEEK = (2018, 18)
+
+
+def load(file):
+    with open(os.path.join(FIXTURES, file), "r", encoding="iso8859_3") as f:
+        return parse_menu_csv(repair_menu_csv(f.read()))
+
+
+def same(menu1, menu2):
+    return collections.Counter(menu1) == collections.Counter(menu2)
+
+
+@pytest.fixture(autouse=True)
+def database(tmpdir, monkeypatch):
+    engine = db.create_sql_engine("sqlite:///" + os.path.join(str(tmpdir), "mensabot.sqlite"))
+    monkeypatch.setattr(db, "SQL_ENGINE", engine)
+    db.migrate()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    for var in ["GIT_AUTHOR", "GIT_COMMITTER"]:
+        monkeypatch.setenv(var + "_NAME", "test")
+        monkeypatch.setenv(var + "_EMAIL", "test@example.com")
+    store = str(tmpdir.mkdir("menustore"))
+    subprocess.run(["git", "init", "-q"], cwd=store, check=True)
+    return store
+
+
+def commit(store, at, *files):
+    for fixture, week_file in files:
+        shutil.copy(os.path.join(FIXTURES, fixture), os.path.join(store, week_file))
+    subprocess.run(["git", "add", "."], cwd=store, check=True)
+    subprocess.run(["git", "commit", "-q", "-m", "update", "--date", at.isoformat()], cwd=store, check=True,
+                   env=dict(os.environ, GIT_COMMITTER_DATE=at.isoformat()))
+
+
+def test_import_store(store):
+    commit(store, dtm.datetime(2018, 4, 27, 10), ("18.csv", "2018-W18.csv"), ("19.csv", "2018-W19.csv"))
+    with open(os.path.join(store, "notes.csv"), "w") as f:
+        f.write("not a week")
+
+    versions = importer.store_versions(store)
+    assert [v.week for v in versions] == [(2018, 18), (2018, 19)]
+    stats = importer.import_versions(((v, v.source) for v in versions), workers=2)
+    assert (stats.versions, stats.failed, stats.changes) == (2, 0, 0)
+    assert stats.rows == stats.stored == len(load("18.csv")) + len(load("19.csv"))
+    assert same(history.get_menu_at(*history.week_dates(WEEK)), load("18.csv"))
+
+    # the history already contains these versions
+    stats = importer.import_versions(((v, v.source) for v in versions), workers=2)
+    assert (stats.skipped, stats.stored) == (2, 0)
+
+
+def test_import_git(store):
+    t1, t2, t3 = dtm.datetime(2018, 4, 27, 10), dtm.datetime(2018, 4, 30, 9), dtm.datetime(2018, 5, 2, 11)
+    commit(store, t1, ("18.csv", "2018-W18.csv"))
+    commit(store, t2, ("19.csv", "2018-W19.csv"))
+    commit(store, t3, ("18-v2.csv", "2018-W18.csv"), ("19.csv", "2018-W20.csv"))
+
+    versions = importer.git_versions(store)
+    assert [(v.week, v.at) for v in versions] == [(WEEK, t1), (WEEK, t3), ((2018, 19), t2), ((2018, 20), t3)]
+    stats = importer.import_versions(importer.git_blobs(store, versions), workers=2)
+    assert (stats.versions, stats.failed, stats.unchanged) == (4, 0, 0)
+    # week 20 contains the menu of week 19
+    assert stats.skipped == 1
+    assert stats.changes == len(history.get_changes(*history.week_dates(WEEK))[0][1]) > 0
+    assert history.get_versions(*history.week_dates(WEEK)) == [t1, t3]
+    assert same(history.get_menu_at(*history.week_dates(WEEK), at=t1), load("18.csv"))
+    assert same(history.get_menu_at(*history.week_dates(WEEK)), load("18-v2.csv"))
+
+    # importing the history again, e.g. after improving parse_dish
+    stats = importer.import_versions(importer.git_blobs(store, versions), workers=2, replace=True)
+    assert stats.skipped == 1 and stats.stored > 0
+    assert history.get_versions(*history.week_dates(WEEK)) == [t1, t3]
+
+
+def test_import_old_names(store):
+    # before the YYYY-Www.csv names, each week was stored under its number only and overwritten a year later
+    t1, t2, t3 = dtm.datetime(2018, 4, 27, 10), dtm.datetime(2018, 5, 2, 11), dtm.datetime(2019, 4, 26, 10)
+    commit(store, t1, ("18.csv", "18.csv"), ("19.csv", "19.csv"))
+    commit(store, t2, ("18-v2.csv", "18.csv"))
+    with open(os.path.join(FIXTURES, "18.csv"), "r", encoding="iso8859_3") as f:
+        next_year = f.read().replace(".2018;", ".2019;")
+    with open(os.path.join(store, "18.csv"), "w", encoding="iso8859_3") as f:
+        f.write(next_year)
+    commit(store, t3)
+
+    versions = importer.git_versions(store)
+    assert [(v.week, v.at) for v in versions] == [(None, t1), (None, t2), (None, t3), (None, t1)]
+    stats = importer.import_versions(importer.git_blobs(store, versions), workers=2)
+    assert (stats.versions, stats.failed, stats.skipped, len(stats.weeks)) == (4, 0, 0, 3)
+    assert history.get_versions(*history.week_dates(WEEK)) == [t1, t2]
+    assert same(history.get_menu_at(*history.week_dates(WEEK)), load("18-v2.csv"))
+    assert history.get_versions(*history.week_dates((2019, 18))) == [t3]
+    assert same(history.get_menu_at(*history.week_dates((2018, 19))), load("19.csv"))
+
+    assert [v.week for v in importer.store_versions(store)] == [None, None]
+
+
+def test_broken_and_unchanged(store):
+    t1, t2, t3 = dtm.datetime(2018, 4, 27, 10), dtm.datetime(2018, 4, 28, 10), dtm.datetime(2018, 4, 29, 10)
+    commit(store, t1, ("18.csv", "2018-W18.csv"))
+    with open(os.path.join(store, "2018-W18.csv"), "w") as f:
+        f.write("datum;tag;warengruppe;name;kennz;preis;stud;bed;gast\n30.04.2018;Mo;S1;Suppe;;;x;y;z\n")
+    commit(store, t2)
+    commit(store, t3, ("18.csv", "2018-W18.csv"))
+    subprocess.run(["git", "commit", "-q", "--allow-empty", "-m", "nothing"], cwd=store, check=True)
+
+    stats = importer.import_versions(importer.git_blobs(store, importer.git_versions(store)), workers=1,
+                                     dry_run=True)
+    assert (stats.versions, stats.failed, stats.unchanged, stats.stored) == (3, 1, 1, 0)
+    assert history.get_versions(*history.week_dates(WEEK)) == []
+    assert "3 versions of 1 weeks" in str(stats)
+
+
+def test_main(store, monkeypatch, capsys):
+    commit(store, dtm.datetime(2018, 4, 27, 10), ("18.csv", "2018-W18.csv"))
+    monkeypatch.setattr(sys, "argv", ["mensabot-import", "--git", "--workers", "1", store])
+    importer.main()
+    assert capsys.readouterr().out.startswith("1 versions of 1 weeks")
+    assert same(history.get_menu_at(*history.week_dates(WEEK)), load("18.csv"))
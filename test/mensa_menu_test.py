@@ -40,9 +40,9 @@ def print_diff(diff):
                   (x.from_dish.stud, x.from_dish.bed, x.from_dish.gast,
                    x.to_dish.stud, x.to_dish.bed, x.to_dish.gast))
         if "kennz" in x.diff:
-            print("\t\tKennz: %s ➡️ %s" % tuple(",".join(c.keys()) for c in x.diff["kennz"]))
+            print("\t\tKennz: %s ➡️ %s" % tuple(",".join(c) for c in x.diff["kennz"]))
         if "zusatz" in x.diff:
-            print("\t\tZusatz: %s ➡️ %s" % tuple(",".join(c.keys()) for c in x.diff["zusatz"]))
+            print("\t\tZusatz: %s ➡️ %s" % tuple(",".join(c) for c in x.diff["zusatz"]))
 
             # print("\t" + str(x))
             # print("\t\t" + str(x.diff))
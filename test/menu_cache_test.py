@@ -0,0 +1,76 @@
+import datetime as dtm
+import threading
+import time
+
+import pytest
+import requests
+
+from mensabot import mensa
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    fetches = []
+    release = threading.Event()
+
+    def fetch_menu_week(week):
+        fetches.append(week)
+        release.wait(5)
+        if week == 13:
+            raise requests.exceptions.ConnectionError()
+        return ["menu %s/%s" % (week, len(fetches))]
+
+    monkeypatch.setattr(mensa, "fetch_menu_week", fetch_menu_week)
+    monkeypatch.setattr(mensa, "cache", {})
+    return fetches, release
+
+
+def test_coalesced_miss(fetches):
+    fetches, release = fetches
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(mensa.get_menu_week(12))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert fetches == [12]
+    assert results == [["menu 12/1"]] * 8
+
+
+def test_failed_miss(fetches):
+    fetches, release = fetches
+    release.set()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        mensa.get_menu_week(13)
+    assert not mensa.pending_fetches
+
+
+def test_stale_while_revalidate(fetches):
+    fetches, release = fetches
+    stale = dtm.datetime.now() - dtm.timedelta(seconds=mensa.MENU_CACHE_TTL + 1)
+    mensa.cache[12] = (stale, ["stale"])
+    assert mensa.get_menu_week(12) == ["stale"]
+    assert mensa.get_menu_week(12) == ["stale"]
+    release.set()
+    mensa.refresh_menu_week(12).result(5)
+    assert fetches == [12]
+    assert mensa.get_menu_week(12) == ["menu 12/1"]
+
+    expired = dtm.datetime.now() - dtm.timedelta(seconds=mensa.MENU_CACHE_MAX_STALE + 1)
+    mensa.cache[12] = (expired, ["expired"])
+    assert mensa.get_menu_week(12) == ["menu 12/2"]
+
+
+def test_prefetch(fetches):
+    fetches, release = fetches
+    mensa.cache[(2019, 1)] = (dtm.datetime.now(), ["fresh"])
+    futures = mensa.prefetch_menu_weeks(dtm.date(2018, 12, 24), weeks=3)
+    time.sleep(0.1)
+    # all missing weeks are fetched at once, across the turn of the year
+    assert sorted(fetches) == [(2018, 52), (2019, 2), (2019, 3)]
+    release.set()
+    assert sorted(f.result(5)[0] for f in futures) == ["menu (2018, 52)/3", "menu (2019, 2)/3", "menu (2019, 3)/3"]
+    assert mensa.cache[(2019, 1)][1] == ["fresh"]
+    assert mensa.get_menu_week((2019, 2)) == ["menu (2019, 2)/3"]
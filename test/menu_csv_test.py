@@ -0,0 +1,73 @@
+import glob
+import os
+import random
+
+import pytest
+import regex as re
+
+from mensabot import mensa
+from mensabot.mensa import decode_lines, parse_menu_csv, read_menu_csv, repair_menu_csv, repair_menu_lines
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "fixtures", "menu", "*.csv")))
+
+
+def repair_menu_csv_regex(text):
+    # the former whole-text implementation of repair_menu_csv
+    text = re.sub("\\([A-Z0-9,; ]+\\)", lambda m: m.group().replace(";", ","), text)
+    return re.sub("\n(?![0-9]{2}\\.[0-9]{2}\\.[0-9]{4};)", " ", text)
+
+
+def chunked(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_repair_lines():
+    lines = ["datum;tag;warengruppe;name", "30.04.2018;Mo;S1;Suppe (A;AA,I)", "mit Brot (G; 3)", "",
+             "30.04.2018;Mo;HG1;Braten"]
+    assert list(repair_menu_lines(lines)) == ["datum;tag;warengruppe;name", "30.04.2018;Mo;S1;Suppe (A,AA,I) mit "
+                                              "Brot (G, 3) ", "30.04.2018;Mo;HG1;Braten"]
+    assert list(repair_menu_lines([])) == []
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_same_as_regex(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    text = data.decode("iso8859_3")
+    repaired = repair_menu_csv_regex(text)
+    assert repair_menu_csv(text) == repaired
+
+    menu = parse_menu_csv(repaired)
+    assert menu
+    for size in [1, 100, len(data) + 1]:
+        assert list(read_menu_csv(chunked(data, size))) == menu
+
+
+def test_same_as_regex_random():
+    rnd = random.Random(0)
+    parts = ["\n", "\r", "(", ")", ";", ",", " ", "A", "1", "x", "30.04.2018", "30.04.2018;", "\n30.04.2018;Mo;"]
+    for _ in range(5000):
+        text = "".join(rnd.choice(parts) for _ in range(rnd.randint(0, 30)))
+        assert repair_menu_csv(text) == repair_menu_csv_regex(text), repr(text)
+
+
+def test_decode_lines():
+    text = "Kn\xf6del\nSp\xe4tzle\n\nĝx\n"
+    data = text.encode("iso8859_3")
+    for size in [1, 2, 5, len(data)]:
+        assert list(decode_lines(chunked(data, size))) == text.split("\n")
+    assert list(decode_lines([])) == [""]
+    with pytest.raises(UnicodeDecodeError):
+        list(decode_lines([b"\xa5"]))
+
+
+def test_generator(monkeypatch):
+    # dishes are parsed while the file is being read
+    with open(FIXTURES[0], "rb") as f:
+        data = f.read()
+    read = []
+    monkeypatch.setattr(mensa, "parse_dish", lambda row: row)
+    rows = read_menu_csv(read.append(chunk) or chunk for chunk in chunked(data, 64))
+    assert read == []
+    next(rows)
+    assert 0 < len(read) < len(data) / 64
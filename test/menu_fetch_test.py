@@ -0,0 +1,84 @@
+import datetime as dtm
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from mensabot import mensa
+from mensabot.mensa_menu import parse_dish
+
+CSV = "datum;tag;warengruppe;name;kennz;preis;stud;bed;gast\n" \
+      "28.05.2018;Mo;HG1;Puten - Dönerteller * G (5,16,A,G,J,K);G;;2,80;3,50;4,20\n" \
+      "28.05.2018;Mo;S1;Tomatencremesuppe (G);V;;0,60;0,80;1,20\n"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if not self.path.endswith("/22.csv"):
+            self.send_response(404)
+            self.end_headers()
+        elif self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            body = server.body.encode("iso8859_1")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv; charset=iso-8859-1")
+            self.send_header("ETag", server.etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = HTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests, server.etag, server.body = [], '"1"', CSV
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(mensa, "MENU_URL", "http://127.0.0.1:%s/csv/" % server.server_port)
+    monkeypatch.setattr(mensa, "MENU_STORE", str(tmp_path))
+    monkeypatch.setattr(mensa, "cache", {})
+    yield server
+    server.shutdown()
+
+
+def test_conditional_fetch(server, monkeypatch):
+    parsed, changes = [], []
+    monkeypatch.setattr(mensa, "parse_dish", lambda row: parsed.append(row) or parse_dish(row))
+    monkeypatch.setattr(mensa, "change_listeners", [lambda week, old, new: changes.append((week, old, new))])
+
+    menu = mensa.get_menu_week((2018, 22), disable_cache=True)
+    assert [d.name for d in menu] == ["Puten - Dönerteller", "Tomatencremesuppe"]
+    assert len(parsed) == 2 and len(changes) == 1
+
+    # not modified
+    assert mensa.get_menu_week((2018, 22), disable_cache=True) == menu
+    assert server.requests[-1] == ("/csv/22.csv", '"1"')
+    assert len(parsed) == 2
+
+    # new ETag, but same content
+    server.etag = '"2"'
+    assert mensa.get_menu_week((2018, 22), disable_cache=True) == menu
+    assert len(parsed) == 2 and len(changes) == 1
+    assert mensa.load_menu_meta((2018, 22))["etag"] == '"2"'
+
+    server.etag, server.body = '"3"', CSV.replace("2,80", "2,90")
+    assert mensa.get_menu_week((2018, 22), disable_cache=True)[0].stud == 2.9
+    assert len(changes) == 2
+
+
+def test_other_year(server):
+    # the website only knows week numbers, so asking for last year's week returns the current one
+    assert mensa.get_menu_week((2017, 22), disable_cache=True) == []
+    assert mensa.load_menu_week((2017, 22)) == []
+    assert [d.datum for d in mensa.get_menu_week((2018, 22), disable_cache=True)] == [dtm.date(2018, 5, 28)] * 2
+
+
+def test_menu_week_urls(monkeypatch):
+    monkeypatch.setattr(mensa, "MENU_URL", "http://stwno/csv/")
+    assert mensa.menu_week_urls((2018, 3)) == ("http://stwno/csv/3.csv", "http://stwno/csv/03.csv")
@@ -0,0 +1,109 @@
+import datetime as dtm
+import os
+import pickle
+
+import pytest
+
+from mensabot import mensa
+from mensabot.mensa_menu import parse_dish
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "menu")
+WEEK = (2018, 20)
+
+
+def read_fixture(file):
+    with open(os.path.join(FIXTURES, file), "r", encoding="iso8859_3") as f:
+        return f.read()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(mensa, "MENU_STORE", str(tmp_path))
+    monkeypatch.setattr(mensa, "cache", {})
+    monkeypatch.setattr(mensa, "change_listeners", [])
+    return tmp_path
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    parsed = []
+    monkeypatch.setattr(mensa, "parse_dish", lambda row: parsed.append(row) or parse_dish(row))
+    return parsed
+
+
+def test_snapshot_written(store, parsed):
+    menu = mensa.update_menu_week(WEEK, read_fixture("20.csv"))
+    assert (store / "2018-W20.pickle").is_file()
+    assert not (store / "2018-W20.pickle.tmp").exists()
+
+    del parsed[:]
+    assert mensa.load_menu_week(WEEK) == menu
+    assert parsed == []
+
+
+def test_changed_content(store, parsed):
+    changes = []
+    mensa.change_listeners.append(lambda week, old, new: changes.append((old, new)))
+    old = mensa.update_menu_week(WEEK, read_fixture("20.csv"))
+
+    # the old menu is taken from the snapshot, only the new text is parsed
+    del parsed[:]
+    new = mensa.update_menu_week(WEEK, read_fixture("20-v2.csv"))
+    assert len(parsed) == len(new)
+    assert changes[-1] == (old, new)
+    assert mensa.load_menu_week(WEEK) == new
+
+
+def test_repaired_text_hash(store, parsed):
+    text = read_fixture("20.csv")
+    menu = mensa.update_menu_week(WEEK, text)
+
+    # different download (so the meta hash differs), but the same csv after repairing it
+    del parsed[:]
+    assert mensa.update_menu_week(WEEK, text.replace("(A;AA,I)", "(A,AA,I)")) == menu
+    assert parsed == []
+
+
+def test_outdated_snapshot(store, parsed):
+    menu = mensa.update_menu_week(WEEK, read_fixture("20.csv"))
+    (store / "2018-W20.csv").write_text(mensa.repair_menu_csv(read_fixture("21.csv")), encoding="iso8859_3")
+
+    del parsed[:]
+    other = mensa.load_menu_week(WEEK)
+    assert other != menu and len(parsed) == len(other)
+
+    del parsed[:]
+    assert mensa.load_menu_week(WEEK) == other
+    assert parsed == []
+
+
+@pytest.mark.parametrize("content", [b"", b"garbage", None])
+def test_broken_snapshot(store, content):
+    menu = mensa.update_menu_week(WEEK, read_fixture("20.csv"))
+    if content is None:  # written by an older version
+        snapshot = mensa.load_menu_snapshot(WEEK)
+        content = pickle.dumps(dict(snapshot, version=mensa.SNAPSHOT_VERSION - 1))
+    (store / "2018-W20.pickle").write_bytes(content)
+    assert mensa.load_menu_week(WEEK) == menu
+    assert mensa.load_menu_snapshot(WEEK)["menu"] == menu
+
+
+def test_warm_cache(store, monkeypatch):
+    menu = mensa.update_menu_week(WEEK, read_fixture("20.csv"))
+    year = menu[0].datum.isocalendar()[0]
+
+    class date(dtm.date):
+        @classmethod
+        def today(cls):
+            return dtm.date(year, 12, 1)
+
+    monkeypatch.setattr(mensa.dtm, "date", date)
+    assert mensa.warm_menu_cache() == 1
+    fetched, cached = mensa.cache[WEEK]
+    assert cached == menu
+    assert mensa.MENU_CACHE_TTL <= (dtm.datetime.now() - fetched).total_seconds() < mensa.MENU_CACHE_MAX_STALE
+
+    mensa.cache.clear()
+    date.today = classmethod(lambda cls: dtm.date(year + 1, 12, 1))
+    assert mensa.warm_menu_cache() == 0
+    assert mensa.cache == {}
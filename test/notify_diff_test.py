@@ -0,0 +1,68 @@
+import collections
+import datetime as dtm
+
+from telegram import Chat, Message
+
+from mensabot.bot import diff_listener
+from mensabot.bot.command import mensa as mensa_cmd
+from mensabot.bot.delivery import DeliveryEngine, Throttle
+
+DAY = dtm.date(2018, 5, 16)
+SENT = dtm.datetime(2018, 5, 16, 9, 0)
+
+chat_row = collections.namedtuple("chat_row", ["id", "template", "locale", "price_category", "notify_change",
+                                               "notify_change_sound", "update_menu"])
+CHATS = {
+    1: chat_row(1, None, None, 0, True, False, True),
+    2: chat_row(2, None, None, 0, True, False, True),
+    3: chat_row(3, "en", None, 1, False, False, True),
+    4: chat_row(4, None, None, 0, True, True, False),
+}
+
+
+def message(chat_id, message_id):
+    return Message(message_id, None, SENT, Chat(chat_id, Chat.PRIVATE))
+
+
+def test_notify_diff(monkeypatch):
+    renders = collections.Counter()
+    sent, edited = [], []
+
+    def get_mensa_formatted(dt, template=None, locale=None, price_category="stud", now=None):
+        renders["menu"] += 1
+        return "new menu %s %s %s" % (template, locale, price_category)
+
+    def get_mensa_diff_formatted(dt, diff, template=None, locale=None, price_category="stud", now=None):
+        renders["diff"] += 1
+        return "diff %s %s %s" % (template, locale, price_category)
+
+    monkeypatch.setattr(diff_listener, "get_chat", CHATS.get)
+    monkeypatch.setattr(diff_listener, "get_mensa_formatted", get_mensa_formatted)
+    monkeypatch.setattr(diff_listener, "get_mensa_diff_formatted", get_mensa_diff_formatted)
+    monkeypatch.setattr(diff_listener, "DELIVERY", DeliveryEngine(4, Throttle(1000, 1000)))
+    monkeypatch.setattr(mensa_cmd.updater.bot, "sendMessage", lambda **kwargs: sent.append(kwargs["chat_id"]))
+    monkeypatch.setattr(mensa_cmd.updater.bot, "editMessageText",
+                        lambda **kwargs: edited.append((kwargs["chat_id"], kwargs["message_id"], kwargs["text"])))
+
+    messages = [(message(1, 10), "old menu"), (message(1, 11), "old menu"), (message(2, 12), "old menu"),
+                (message(2, 13), "new menu None None stud"), (message(3, 14), "old menu"), (message(4, 15), "old")]
+    monkeypatch.setattr(mensa_cmd, "notifications_date", DAY)
+    monkeypatch.setattr(mensa_cmd, "notifications", {(msg.chat_id, msg.message_id): (msg, text)
+                                                     for msg, text in messages})
+
+    wave = diff_listener.notify_diff((2018, 20), [], [])
+    assert wave.wait(5)
+    assert (wave.sent, wave.failed) == (7, 0)
+    assert renders == {"diff": 1, "menu": 2}
+    assert sorted(sent) == [1, 2, 4]
+    assert sorted(edited) == [(1, 10, "new menu None None stud"), (1, 11, "new menu None None stud"),
+                              (2, 12, "new menu None None stud"), (3, 14, "new menu en None bed")]
+    assert mensa_cmd.notifications[(3, 14)][1] == "new menu en None bed"
+    assert mensa_cmd.notifications[(4, 15)][1] == "old"
+
+    # nothing changed since the last notification, so no message needs to be edited again
+    del sent[:], edited[:]
+    wave = diff_listener.notify_diff((2018, 20), [], [])
+    assert wave.wait(5)
+    assert edited == []
+    assert sorted(sent) == [1, 2, 4]
@@ -0,0 +1,111 @@
+import datetime as dtm
+
+import pytest
+
+from mensabot import mensa
+
+SEMESTERS = [
+    mensa.semester("Wintersemester 2017/18", True, dtm.date(2017, 10, 16), dtm.date(2018, 2, 9),
+                   [(dtm.date(2017, 12, 24), dtm.date(2018, 1, 6))]),
+    mensa.semester("Sommersemester 2018", False, dtm.date(2018, 4, 9), dtm.date(2018, 7, 20),
+                   [(dtm.date(2018, 5, 11), dtm.date(2018, 5, 11)), (dtm.date(2018, 3, 29), dtm.date(2018, 4, 3)),
+                    (dtm.date(2018, 5, 22), dtm.date(2018, 5, 22))]),
+    mensa.semester("Wintersemester 2018/19", True, dtm.date(2018, 10, 15), dtm.date(2019, 2, 8),
+                   [(dtm.date(2018, 12, 24), dtm.date(2019, 1, 6))]),
+]
+
+WEEKDAYS = {(t, d): (dtm.time(8), dtm.time(16)) if d < 5 else mensa.NOT_OPEN for d in range(7) for t in [True, False]}
+CAFETE = dict(WEEKDAYS)
+CAFETE.update({(True, d): (dtm.time(9), dtm.time(14)) for d in range(3)})
+CAFETE.update({(True, d): mensa.NOT_OPEN for d in range(3, 5)})
+LECTURES_ONLY = {(t, d): mensa.NOT_OPEN for d in range(7) for t in [True, False]}
+LECTURES_ONLY.update({(False, d): (dtm.time(11), dtm.time(14)) for d in range(5)})
+
+
+@pytest.fixture(autouse=True)
+def caches(monkeypatch, tmp_path):
+    monkeypatch.setattr(mensa, "opening_calendars", {})
+    monkeypatch.setattr(mensa, "SCRAPE_STORE", str(tmp_path))
+    mensa.get_semester_dates.cache_put(SEMESTERS)
+    mensa.get_opening_times.cache_put(CAFETE, "cafete")
+    mensa.get_opening_times.cache_put(LECTURES_ONLY, "lectures")
+    yield
+    mensa.clear_caches()
+
+
+def get_next_open_by_day(dt, loc):
+    # the previous implementation, checking day after day
+    times = mensa.get_opening_times(loc)
+    for i in range(6):
+        d = dt + dtm.timedelta(days=i)
+        open, close = times[(mensa.is_holiday(d), d.isoweekday() - 1)]
+        if i == 0 and dt.time() < close or i > 0 and open > dtm.time(0, 0):
+            return mensa.open_info(open, close, d, i)
+    raise AssertionError()
+
+
+def call(func, *args):
+    try:
+        return func(*args)
+    except AssertionError:
+        return AssertionError
+
+
+@pytest.mark.parametrize("loc", ["cafete", "lectures"])
+def test_same_as_by_day(loc):
+    day = dtm.datetime(2017, 10, 16)
+    while day < dtm.datetime(2019, 3, 1):
+        for time in [dtm.time(0), dtm.time(10, 30), dtm.time(14), dtm.time(23, 59)]:
+            dt = dtm.datetime.combine(day, time)
+            assert call(mensa.get_next_open, dt, loc) == call(get_next_open_by_day, dt, loc), dt
+        day += dtm.timedelta(days=1)
+
+
+def test_outside_of_semesters():
+    with pytest.raises(AssertionError):
+        mensa.get_opening_times_on(dtm.date(2017, 1, 1), "cafete")
+    # after the last semester it is holidays forever
+    assert mensa.get_opening_times_on(dtm.date(2020, 6, 1), "cafete") == (dtm.time(9), dtm.time(14))
+
+
+def test_rebuilt_on_refresh():
+    calendar = mensa.get_opening_calendar("cafete")
+    assert mensa.get_opening_calendar("cafete") is calendar
+
+    mensa.get_opening_times.cache_put(WEEKDAYS, "cafete")
+    assert mensa.get_opening_calendar("cafete") is not calendar
+    assert mensa.get_opening_times_on(dtm.date(2018, 8, 2), "cafete") == (dtm.time(8), dtm.time(16))
+
+    calendar = mensa.get_opening_calendar("cafete")
+    mensa.get_semester_dates.cache_put(SEMESTERS[:2])
+    assert mensa.get_opening_calendar("cafete") is not calendar
+
+
+def is_holiday_by_semester(day):
+    # the previous implementation, scanning the semesters
+    current = next((sem for sem in reversed(SEMESTERS) if sem.start <= day), None)
+    assert current
+    return current.end < day or any(start <= day <= end for start, end in current.holidays)
+
+
+def test_is_holiday_range():
+    start, end = dtm.date(2017, 10, 16), dtm.date(2019, 12, 31)
+    mask = mensa.is_holiday_range(start, end)
+    days = [start + dtm.timedelta(days=i) for i in range((end - start).days + 1)]
+    assert mask == [is_holiday_by_semester(day) for day in days]
+    assert [mensa.is_holiday(dtm.datetime.combine(day, dtm.time())) for day in days] == mask
+
+    for first, last in [(dtm.date(2018, 5, 8), dtm.date(2018, 5, 12)), (dtm.date(2018, 5, 22), dtm.date(2018, 5, 22)),
+                        (dtm.date(2019, 2, 1), dtm.date(2019, 2, 28)), (dtm.date(2018, 5, 9), dtm.date(2018, 5, 8))]:
+        assert mensa.is_holiday_range(first, last) == [is_holiday_by_semester(day) for day in days
+                                                       if first <= day <= last]
+    with pytest.raises(AssertionError):
+        mensa.is_holiday_range(dtm.date(2017, 10, 1), dtm.date(2017, 10, 20))
+
+
+def test_schedule_outside_of_calendar():
+    start = dtm.date(2019, 2, 25)
+    assert mensa.get_opening_times_range(start, start + dtm.timedelta(days=20), "cafete") == \
+           [CAFETE[(True, (start + dtm.timedelta(days=i)).weekday())] for i in range(21)]
+    assert mensa.get_next_open(dtm.datetime(2019, 6, 7, 12), "cafete") == \
+           mensa.open_info(dtm.time(9), dtm.time(14), dtm.datetime(2019, 6, 10, 12), 3)
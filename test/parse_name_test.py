@@ -0,0 +1,24 @@
+import json
+import os
+
+import pytest
+
+from mensabot import mensa_menu
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+with open(os.path.join(FIXTURES, "parse_name.json"), "r", encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+parse_name = getattr(mensa_menu, "__parse_name")
+
+
+@pytest.mark.parametrize("file, name, names, zusatz, kennz", GOLDEN)
+def test_golden(file, name, names, zusatz, kennz):
+    assert parse_name(name) == (names, zusatz, kennz)
+
+
+def test_brackets():
+    assert parse_name("Schokopudding ((G)))) (A") == (["Schokopudding", "", "A"], ["G"], [])
+    assert parse_name("Falafel ((mit (Hummus)))") == ("Falafel (mit (Hummus)", ["??"], ["??"])
+    assert parse_name("Kaiserschmarrn) mit Apfelmus") == ("Kaiserschmarrn) mit Apfelmus", ["??"], ["??"])
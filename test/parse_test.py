@@ -0,0 +1,88 @@
+import datetime as dtm
+
+import dateparser
+import pytest
+
+from mensabot import parse
+from mensabot.parse import parse_date, parse_loc_date
+
+NOW = dtm.datetime(2018, 5, 16, 13, 37, 42)  # a wednesday
+
+
+def dateparser_parse(s):
+    return dateparser.parse(s, languages=parse.LANG, settings=dict(parse.DATEPARSER_SETTINGS, RELATIVE_BASE=NOW))
+
+
+@pytest.mark.parametrize("s", [
+    "heute", "today", "morgen", "Morgen", "tomorrow", "übermorgen", "gestern",
+    "montag", "Mo", "dienstag", "mittwoch", "mi", "do", "friday", "fr", "samstag", "so", "sonntag", "tue",
+])
+def test_fast_path_like_dateparser(s):
+    assert parse.parse_date_fast(s.lower(), NOW) is not None
+    assert parse_date(s, NOW) == dateparser_parse(s)
+
+
+@pytest.mark.parametrize("s", ["in 2 tagen", "vor 2 Tagen", "in 3 days", "20. Mai", "2018-05-20", "next week"])
+def test_fallback_like_dateparser(s):
+    assert parse.parse_date_fast(s.lower(), NOW) is None
+    assert parse_date(s, NOW) == dateparser_parse(s)
+
+
+@pytest.mark.parametrize("s, expected", [
+    ("+1", dtm.datetime(2018, 5, 17, 13, 37, 42)),
+    ("+ 3", dtm.datetime(2018, 5, 19, 13, 37, 42)),
+    ("-1", dtm.datetime(2018, 5, 15, 13, 37, 42)),
+    ("+2 wochen", dtm.datetime(2018, 5, 30, 13, 37, 42)),
+    ("17.05.", dtm.datetime(2018, 5, 17)),
+    ("1.6.", dtm.datetime(2018, 6, 1)),
+    ("3.5.", dtm.datetime(2019, 5, 3)),
+    ("16.5.", dtm.datetime(2018, 5, 16)),
+    ("17.05.2018", dtm.datetime(2018, 5, 17)),
+    ("1.1.2017", dtm.datetime(2017, 1, 1)),
+])
+def test_offsets_and_dates(s, expected):
+    assert parse_date(s, NOW) == expected
+
+
+def test_relative_keeps_time_when_cached():
+    assert parse_date("in 2 tagen", NOW) == dtm.datetime(2018, 5, 18, 13, 37, 42)
+    later = NOW.replace(hour=18, minute=5)
+    assert parse_date("in 2 tagen", later) == dtm.datetime(2018, 5, 18, 18, 5, 42)
+    assert parse_date("20. Mai", later) == dtm.datetime(2018, 5, 20)
+    assert parse_date("in 2 tagen", NOW + dtm.timedelta(days=1)) == dtm.datetime(2018, 5, 19, 13, 37, 42)
+
+
+@pytest.mark.parametrize("s", ["in 2 stunden", "in 30 minuten", "vor 3 stunden", "in 12 hours", "12:00", "15:00",
+                               "morgen 12:00", "20. Mai 9:30"])
+def test_time_of_day_like_dateparser(s):
+    for now in [NOW, NOW.replace(hour=9), NOW.replace(hour=23, minute=30)]:
+        v = parse_date(s, now)
+        assert v == dateparser.parse(s, languages=parse.LANG,
+                                     settings=dict(parse.DATEPARSER_SETTINGS, RELATIVE_BASE=now))
+        assert v.microsecond == 0
+
+
+def test_hour_offset():
+    assert parse_date("in 2 stunden", NOW) == dtm.datetime(2018, 5, 16, 15, 37, 42)
+    assert parse_date("12:00", NOW) == dtm.datetime(2018, 5, 17, 12)
+    assert parse_date("12:00", NOW.replace(hour=9)) == dtm.datetime(2018, 5, 16, 12)
+
+
+@pytest.mark.parametrize("s", ["31.2.", "foobar", "next monday"])
+def test_invalid(s):
+    with pytest.raises(ValueError):
+        parse_date(s, NOW)
+
+
+def test_empty():
+    assert parse_date("", NOW) is None
+    assert parse_date([""], NOW) is None
+
+
+def test_parse_loc_date():
+    loc, dt = parse_loc_date(["audimax", "morgen"])
+    assert loc == "audimax"
+    assert dt.date() == dtm.date.today() + dtm.timedelta(days=1)
+    loc, dt = parse_loc_date(["+2", "mensa"])
+    assert loc == "mensacafete"
+    assert dt.date() == dtm.date.today() + dtm.timedelta(days=2)
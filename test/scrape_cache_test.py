@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from mensabot import mensa
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(mensa, "SCRAPE_STORE", str(tmp_path))
+    return tmp_path
+
+
+def scraper(results, **kwargs):
+    """
+    A memoized function returning the given results one after another, raising them if they are exceptions.
+    """
+
+    calls = []
+
+    @mensa.memoize(**kwargs)
+    def scrape(loc):
+        calls.append(loc)
+        res = results.pop(0)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    return scrape, calls
+
+
+def test_memoize(store):
+    scrape, calls = scraper(["a", "b"])
+    assert scrape("x") == "a" and scrape("x") == "a"
+    assert calls == ["x"]
+    assert scrape.cache_info() == mensa.memo_info(1, 1, 1)
+    scrape.cache_clear()
+    assert scrape("x") == "b"
+    assert list(store.iterdir()) == []
+
+
+def test_persist(store):
+    scrape, calls = scraper(["a"], persist="test")
+    assert scrape("x") == "a"
+    assert (store / "test.pickle").is_file()
+
+    # e.g. after a restart
+    scrape, calls = scraper([], persist="test")
+    assert scrape.cache_load() == 1
+    assert scrape("x") == "a"
+    assert calls == []
+
+    scrape.cache_put("b", "y")
+    scrape, calls = scraper([], persist="test")
+    scrape.cache_load()
+    assert scrape("y") == "b"
+
+
+def test_broken_store(store):
+    (store / "test.pickle").write_bytes(b"garbage")
+    scrape, calls = scraper(["a"], persist="test")
+    assert scrape.cache_load() == 0
+    assert scrape("x") == "a"
+
+
+def test_unpicklable(store, caplog):
+    scrape, calls = scraper([lambda: None], persist="test")
+    assert scrape("x")() is None
+    assert scrape("x")() is None and calls == ["x"]
+    assert "Could not save cache of scrape" in caplog.text
+    assert not (store / "test.pickle").exists()
+
+
+def test_last_known_good(store):
+    scrape, calls = scraper(["a", requests.exceptions.ConnectionError(), "b"], ttl=0)
+    assert scrape("x") == "a"
+    assert scrape("x") == "a"  # expired, but fetching fails
+    assert scrape("x") == "b"
+    assert calls == ["x"] * 3
+
+    scrape, calls = scraper([requests.exceptions.ConnectionError()], ttl=0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        scrape("x")
+
+
+def test_refresh_in_background(store, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(mensa, "time", type("clock", (), {"time": staticmethod(lambda: clock[0])}))
+    monkeypatch.setattr(mensa, "REFRESH_EXECUTOR", ThreadPoolExecutor(max_workers=1))
+    release = threading.Event()
+    calls = []
+
+    @mensa.memoize(refresh_after=60, ttl=600)
+    def scrape(loc):
+        calls.append(loc)
+        if len(calls) == 2:
+            release.wait(5)
+        return len(calls)
+
+    assert scrape("x") == 1
+    clock[0] += 30
+    assert scrape("x") == 1
+    assert len(calls) == 1
+
+    # outdated, so it is fetched again in background without blocking, but only once
+    clock[0] += 60
+    assert scrape("x") == 1
+    assert scrape("x") == 1
+    release.set()
+    mensa.REFRESH_EXECUTOR.shutdown(wait=True)
+    assert scrape("x") == 2
+    assert len(calls) == 2
+
+    # expired, so it is fetched again before returning
+    clock[0] += 600
+    assert scrape("x") == 3
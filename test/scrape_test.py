@@ -0,0 +1,52 @@
+import datetime as dtm
+import json
+import os
+import pickle
+import warnings
+
+import pytest
+
+from mensabot import mensa
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+
+with open(os.path.join(FIXTURES, "expected.json"), "r", encoding="utf-8") as f:
+    EXPECTED = json.load(f)
+
+PARSERS = ["html.parser", pytest.param("lxml", marks=pytest.mark.skipif(
+    not mensa.builder_registry.lookup("lxml"), reason="lxml is not installed"))]
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name + ".html"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def parse_time(s):
+    return dtm.datetime.strptime(s, "%H:%M").time()
+
+
+@pytest.mark.parametrize("features", PARSERS)
+@pytest.mark.parametrize("name", ["opening_audimax", "opening_nikolakloster", "opening_wiwi"])
+def test_opening_times(name, features):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        times = mensa.parse_opening_times(read_fixture(name), features)
+    assert times == {(holiday, day): (parse_time(open), parse_time(close))
+                     for holiday, day, open, close in EXPECTED[name]}
+
+
+@pytest.mark.parametrize("features", PARSERS)
+def test_semester_dates(features):
+    date = dtm.date.fromisoformat
+    semesters = mensa.parse_semester_dates(read_fixture("semester_dates"), features)
+    assert semesters == [mensa.semester(name, is_winter, date(start), date(end), [(date(a), date(b)) for a, b in hol])
+                         for name, is_winter, start, end, hol in EXPECTED["semester_dates"]]
+    # plain strings, so that persisting them doesn't pickle the whole parse tree
+    assert all(type(s.name) is str for s in semesters)
+    assert len(pickle.dumps(semesters)) < 5000
+
+
+def test_warnings():
+    with pytest.warns(UserWarning, match="Could not parse time range 'nach Vereinbarung'"):
+        mensa.parse_opening_times(read_fixture("opening_wiwi"))
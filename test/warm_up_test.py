@@ -0,0 +1,35 @@
+import threading
+
+import requests
+
+from mensabot import mensa
+
+
+def test_warm_up(monkeypatch):
+    running, peak = set(), []
+    lock, release = threading.Lock(), threading.Event()
+
+    def fetch(name):
+        with lock:
+            running.add(name)
+            peak.append(len(running))
+        release.wait(5)
+        with lock:
+            running.discard(name)
+        if name == "wiwi":
+            raise requests.exceptions.ConnectionError()
+
+    monkeypatch.setattr(mensa, "get_semester_dates", lambda: fetch("semester"))
+    monkeypatch.setattr(mensa, "get_opening_times", lambda loc: fetch(loc.rsplit("-", 1)[-1]))
+    monkeypatch.setattr(mensa, "get_menu_week", lambda week: fetch(week))
+
+    futures = mensa.warm_up(workers=3)
+    assert len(futures) == 1 + len(mensa.LOCATIONS) + 2
+    release.wait(0.2)
+    assert max(peak) == 3
+    release.set()
+
+    report = mensa.warm_up_report(futures)
+    assert "opening times of wiwi failed (ConnectionError)" in report
+    assert "semester dates 0." in report
+    assert all(f.done() for f in futures.values())